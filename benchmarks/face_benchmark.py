@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Face pipeline benchmark
+
+Feeds recorded video files or image directories through capture_face and
+verify_face in place of the camera, and reports per-stage timings (decode,
+color convert, detect, encode, distance) and time-to-verify for each
+combination of jitter count, detection scale and detection model.
+
+Usage:
+    python benchmarks/face_benchmark.py --enroll fixtures/alice_enroll.mp4 --probe fixtures/alice_probe.mp4
+    python benchmarks/face_benchmark.py --enroll fixtures/alice/ --probe fixtures/alice_probe/ \\
+        --jitters 1,2 --scales 1.0,0.5 --models hog
+"""
+import argparse
+import itertools
+import os
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'src'))
+
+from face import capture_face, verify_face, encode_face_to_base64, decode_base64_to_face
+
+STAGES = ['decode', 'color_convert', 'detect', 'encode', 'distance']
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+def csv_list(cast):
+    return lambda text: [cast(item) for item in text.split(",") if item]
+
+def enroll(source, required_encodings):
+    """Build the stored encodings the same way AdminUI does, including the base64 round trip"""
+    timings = {}
+    start = time.perf_counter()
+    encodings = capture_face(frame_source=source, required_encodings=required_encodings,
+                             show_window=False, timings=timings)
+    elapsed = time.perf_counter() - start
+    if encodings is None:
+        return None, elapsed, timings
+    return decode_base64_to_face(encode_face_to_base64(encodings)), elapsed, timings
+
+def run_config(known, probe, tolerance, num_jitters, detection_scale, model, runs):
+    """Verify the probe source several times; returns (results, merged stage timings)"""
+    timings = {}
+    results = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        matched = verify_face(known, tolerance=tolerance, frame_source=probe, num_jitters=num_jitters,
+                              model=model, detection_scale=detection_scale, show_window=False,
+                              timings=timings)
+        results.append((matched, time.perf_counter() - start))
+    return results, timings
+
+def print_stages(timings, indent="    "):
+    for stage in STAGES:
+        values = timings.get(stage, [])
+        if not values:
+            continue
+        print(f"{indent}{stage:<14} n={len(values):<5} mean={sum(values) / len(values) * 1000:8.2f} ms  "
+              f"p95={percentile(values, 95) * 1000:8.2f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the face pipeline against recorded fixtures")
+    parser.add_argument("--enroll", required=True, help="video file or image directory used for enrollment")
+    parser.add_argument("--probe", required=True, help="video file or image directory to verify")
+    parser.add_argument("--tolerance", type=float, default=0.45)
+    parser.add_argument("--required", type=int, default=7, help="encodings captured at enrollment")
+    parser.add_argument("--jitters", type=csv_list(int), default=[1, 2, 3])
+    parser.add_argument("--scales", type=csv_list(float), default=[1.0, 0.5])
+    parser.add_argument("--models", type=csv_list(str), default=["hog"], help="hog and/or cnn")
+    parser.add_argument("--runs", type=int, default=3, help="verifications per configuration")
+    args = parser.parse_args()
+
+    known, enroll_time, enroll_timings = enroll(args.enroll, args.required)
+    print(f"Enrollment from {args.enroll}: {enroll_time:.2f}s")
+    print_stages(enroll_timings)
+    if known is None:
+        print("Enrollment failed: not enough distinct face captures in the fixture")
+        return 1
+
+    print(f"\n{'Model':<6} {'Jitter':>6} {'Scale':>6} {'Match':>6} {'Verify p50':>11} {'Verify max':>11}")
+    summary = []
+    for model, num_jitters, detection_scale in itertools.product(args.models, args.jitters, args.scales):
+        results, timings = run_config(known, args.probe, args.tolerance, num_jitters, detection_scale,
+                                      model, args.runs)
+        durations = [elapsed for _, elapsed in results]
+        matches = sum(1 for matched, _ in results if matched)
+        print(f"{model:<6} {num_jitters:>6} {detection_scale:>6.2f} {matches:>3}/{len(results):<2} "
+              f"{percentile(durations, 50):>10.2f}s {max(durations):>10.2f}s")
+        print_stages(timings)
+        summary.append((percentile(durations, 50), model, num_jitters, detection_scale, matches == len(results)))
+
+    # Fastest configuration that still verified on every run
+    passing = [entry for entry in summary if entry[4]]
+    if passing:
+        best = min(passing)
+        print(f"\nFastest reliable configuration: model={best[1]} jitters={best[2]} scale={best[3]} "
+              f"({best[0]:.2f}s to verify)")
+    else:
+        print("\nNo configuration verified the probe on every run")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+"""
+Station throughput benchmark
+
+Seeds synthetic students, books, routes and transaction histories into the
+Firestore emulator, then replays a mix of canteen, bus, library and classroom
+taps through the shared station logic (face verification skipped) and reports
+latency percentiles, throughput and document reads/writes per operation.
+
+Usage:
+    firebase emulators:start --only firestore
+    FIRESTORE_EMULATOR_HOST=localhost:8080 python benchmarks/load_benchmark.py --students 10000 --seed
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'src'))
+
+import firebase_admin
+from firebase_admin import firestore
+
+from stations import (StationError, lookup_student, CanteenStation, BusStation,
+                      LibraryStation, ClassroomStation)
+
+DEPARTMENTS = ['CSE', 'ECE', 'MECH', 'CIVIL', 'EEE']
+SECTIONS = ['A', 'B', 'C']
+CATEGORIES = ['Fiction', 'Science', 'History', 'Technology', 'Mathematics', 'Biography']
+LOCATIONS = ['Canteen', 'Stationery', 'Juice Bar']
+
+# Default tap mix (weights)
+DEFAULT_MIX = {'pay': 50, 'board': 20, 'attendance': 20, 'lend': 5, 'return': 5}
+
+# Firestore allows at most 500 writes per batch
+SEED_BATCH_SIZE = 500
+
+def student_rfid(index):
+    return f"{9000000000 + index}"
+
+def student_classroom(index):
+    return DEPARTMENTS[index % len(DEPARTMENTS)], (index // 7) % 4 + 1, SECTIONS[index % len(SECTIONS)]
+
+# Document read/write counting
+
+class OpCounter(threading.local):
+    """Per-thread read/write counts for the operation currently running"""
+    reads = 0
+    writes = 0
+
+class _Counted:
+    """Proxy over a Firestore client, reference or query that counts document reads and writes"""
+
+    CHAINED = ('collection', 'document', 'where', 'limit', 'order_by', 'start_after', 'start_at',
+               'end_before', 'end_at', 'offset', 'select', 'parent')
+    WRITES = ('set', 'update', 'create', 'delete', 'add')
+
+    def __init__(self, target, counter):
+        self._target = target
+        self._counter = counter
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        counter = self._counter
+
+        if name in self.CHAINED:
+            return lambda *args, **kwargs: _Counted(attr(*args, **kwargs), counter)
+        if name in self.WRITES:
+            def write(*args, **kwargs):
+                counter.writes += 1
+                return attr(*args, **kwargs)
+            return write
+        if name == 'get':
+            def get(*args, **kwargs):
+                # Reads inside a transaction pass the (counted) transaction along
+                result = attr(*args, **_unwrap_kwargs(kwargs))
+                # A query that matches nothing is still billed as one read
+                counter.reads += max(len(result), 1) if isinstance(result, list) else 1
+                return result
+            return get
+        if name == 'stream':
+            def stream(*args, **kwargs):
+                count = 0
+                for doc in attr(*args, **_unwrap_kwargs(kwargs)):
+                    count += 1
+                    counter.reads += 1
+                    yield doc
+                if count == 0:
+                    counter.reads += 1
+            return stream
+        if name == 'batch':
+            return lambda: _CountedBatch(attr(), counter)
+        if name == 'transaction':
+            # Pay, bus taps and lends write through @firestore.transactional
+            return lambda *args, **kwargs: _CountedBatch(attr(*args, **kwargs), counter)
+        if name == 'get_all':
+            def get_all(refs, *args, **kwargs):
+                refs = [_unwrap(ref) for ref in refs]
+                counter.reads += len(refs)
+                return attr(refs, *args, **kwargs)
+            return get_all
+        return attr
+
+class _CountedBatch:
+    """Write batch or transaction that adds its writes to the counter when committed"""
+
+    def __init__(self, batch, counter):
+        self._batch = batch
+        self._counter = counter
+        self._pending = 0
+
+    def __getattr__(self, name):
+        attr = getattr(self._batch, name)
+        if name in ('set', 'update', 'create', 'delete'):
+            def write(ref, *args, **kwargs):
+                self._pending += 1
+                return attr(_unwrap(ref), *args, **kwargs)
+            return write
+        # @firestore.transactional commits a transaction through _commit
+        if name in ('commit', '_commit'):
+            def commit(*args, **kwargs):
+                result = attr(*args, **kwargs)
+                self._counter.writes += self._pending
+                return result
+            return commit
+        if name == '_clean_up':
+            def clean_up(*args, **kwargs):
+                # A retried transaction starts over with no writes
+                self._pending = 0
+                return attr(*args, **kwargs)
+            return clean_up
+        return attr
+
+def _unwrap(ref):
+    if isinstance(ref, _Counted):
+        return ref._target
+    if isinstance(ref, _CountedBatch):
+        return ref._batch
+    return ref
+
+def _unwrap_kwargs(kwargs):
+    return {key: _unwrap(value) for key, value in kwargs.items()}
+
+# Seeding
+
+def _commit_all(db, docs, workers=8):
+    """Write (collection, doc_id, data) tuples with parallel batched commits"""
+    def commit_chunk(chunk):
+        batch = db.batch()
+        for collection, doc_id, data in chunk:
+            ref = db.collection(collection).document(doc_id) if doc_id else db.collection(collection).document()
+            batch.set(ref, data)
+        batch.commit()
+        return len(chunk)
+
+    written = 0
+    chunk = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = []
+        for doc in docs:
+            chunk.append(doc)
+            if len(chunk) >= SEED_BATCH_SIZE:
+                futures.append(pool.submit(commit_chunk, chunk))
+                chunk = []
+            # Keep the number of in-flight batches bounded
+            if len(futures) >= workers * 4:
+                written += sum(f.result() for f in futures)
+                futures = []
+        if chunk:
+            futures.append(pool.submit(commit_chunk, chunk))
+        written += sum(f.result() for f in futures)
+    return written
+
+def seed(db, students, books, routes, history):
+    """Create synthetic data; returns the number of documents written"""
+    rng = random.Random(42)
+    now = datetime.datetime.now()
+    route_ids = [str(100 + r) for r in range(routes)]
+
+    def generate():
+        for r, route_id in enumerate(route_ids):
+            yield 'bus_routes', route_id, {
+                'route_id': route_id,
+                'name': f"Route {route_id}",
+                'stops': [f"Stop {route_id}-{s}" for s in range(8)]
+            }
+
+        for b in range(books):
+            yield 'books', None, {
+                'book_id': f"BK{b:07d}",
+                'title': f"Benchmark Book {b}",
+                'author': f"Author {b % 997}",
+                'category': CATEGORIES[b % len(CATEGORIES)],
+                'status': 'available',
+                'available': True
+            }
+
+        for i in range(students):
+            department, year, section = student_classroom(i)
+            student_id = f"bench-student-{i}"
+            yield 'students', student_id, {
+                'name': f"Student {i}",
+                'rfid': student_rfid(i),
+                'department': department,
+                'year': str(year),
+                'section': section,
+                'wallet_balance': 1000000.0,
+                'has_bus_pass': True,
+                'bus_route': route_ids[i % len(route_ids)],
+                'bus_status': 'outside',
+                'parent_email': ''
+            }
+            for _ in range(history):
+                yield 'transactions', None, {
+                    'student_id': student_id,
+                    'amount': round(rng.uniform(10, 150), 2),
+                    'type': 'debit' if rng.random() < 0.85 else 'credit',
+                    'description': 'Benchmark history',
+                    'location': rng.choice(LOCATIONS),
+                    'timestamp': now - datetime.timedelta(minutes=rng.randint(1, 90 * 24 * 60))
+                }
+
+    start = time.perf_counter()
+    written = _commit_all(db, generate())
+    print(f"Seeded {written} documents in {time.perf_counter() - start:.1f}s")
+    return written
+
+# Replay
+
+class TapReplayer:
+    """Run station operations for random students and record per-operation results"""
+
+    def __init__(self, db, students, books, routes):
+        self.counter = OpCounter()
+        self.db = _Counted(db, self.counter)
+        self.students = students
+        self.books = books
+        self.route_ids = [str(100 + r) for r in range(routes)]
+        self.canteen = CanteenStation(self.db)
+        self.library = LibraryStation(self.db)
+        self.bus_stations = {}
+        self.classrooms = {}
+        self.lent_books = []
+        self.lock = threading.Lock()
+        self.results = {}
+
+    def _bus_station(self, route_id):
+        with self.lock:
+            if route_id not in self.bus_stations:
+                self.bus_stations[route_id] = BusStation(self.db, BusStation.find_route(self.db, route_id))
+            return self.bus_stations[route_id]
+
+    def _classroom(self, department, year, section):
+        key = (department, year, section)
+        with self.lock:
+            if key not in self.classrooms:
+                info = ClassroomStation.open_classroom(self.db, department, year, section)
+                self.classrooms[key] = ClassroomStation(self.db, info)
+            return self.classrooms[key]
+
+    def op_pay(self, rng):
+        student = lookup_student(self.db, student_rfid(rng.randrange(self.students)))
+        self.canteen.pay(student, round(rng.uniform(10, 120), 2), "Benchmark purchase")
+
+    def op_board(self, rng):
+        index = rng.randrange(self.students)
+        station = self._bus_station(self.route_ids[index % len(self.route_ids)])
+        student = lookup_student(self.db, student_rfid(index))
+        station.check_rider(student)
+        stop = rng.choice(station.route_data.get('stops', ['Stop']))
+        if student.get('bus_status') == 'inside':
+            station.offboard(student, stop)
+        else:
+            station.board(student, stop)
+
+    def op_attendance(self, rng):
+        index = rng.randrange(self.students)
+        station = self._classroom(*student_classroom(index))
+        student = station.check_in(student_rfid(index))
+        station.mark_present(student, verification_method='benchmark')
+
+    def op_lend(self, rng):
+        book_data = self.library.find_book_for_lending(f"BK{rng.randrange(self.books):07d}")
+        student = lookup_student(self.db, student_rfid(rng.randrange(self.students)))
+        self.library.lend(book_data, student)
+        with self.lock:
+            self.lent_books.append(book_data['book_id'])
+
+    def op_return(self, rng):
+        with self.lock:
+            book_id = self.lent_books.pop(rng.randrange(len(self.lent_books))) if self.lent_books else None
+        if book_id is None:
+            raise StationError("Nothing Lent", "No book lent during this run yet")
+        self.library.return_book(self.library.find_lent_book(book_id))
+
+    def run_one(self, op_name, rng):
+        self.counter.reads = 0
+        self.counter.writes = 0
+        outcome = 'ok'
+        start = time.perf_counter()
+        try:
+            getattr(self, f"op_{op_name}")(rng)
+        except StationError:
+            outcome = 'rejected'
+        except Exception as e:
+            outcome = 'error'
+            print(f"{op_name} failed: {e}")
+        elapsed = time.perf_counter() - start
+
+        with self.lock:
+            stats = self.results.setdefault(op_name, {'latencies': [], 'ok': 0, 'rejected': 0, 'error': 0,
+                                                      'reads': 0, 'writes': 0})
+            stats['latencies'].append(elapsed)
+            stats[outcome] += 1
+            stats['reads'] += self.counter.reads
+            stats['writes'] += self.counter.writes
+
+    def run(self, mix, operations, concurrency, seed=7):
+        names = list(mix)
+        weights = [mix[name] for name in names]
+        plan_rng = random.Random(seed)
+        plan = plan_rng.choices(names, weights=weights, k=operations)
+
+        def worker(worker_index, ops):
+            rng = random.Random(seed * 1000 + worker_index)
+            for op_name in ops:
+                self.run_one(op_name, rng)
+
+        start = time.perf_counter()
+        threads = [threading.Thread(target=worker, args=(w, plan[w::concurrency])) for w in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - start
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+def report(results, wall_time):
+    total = sum(len(stats['latencies']) for stats in results.values())
+    print(f"\n{'Op':<12} {'Count':>7} {'OK':>7} {'Rej':>6} {'Err':>5} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8} {'Reads/op':>9} {'Writes/op':>10}")
+    for op_name, stats in sorted(results.items()):
+        latencies = sorted(stats['latencies'])
+        count = len(latencies)
+        print(f"{op_name:<12} {count:>7} {stats['ok']:>7} {stats['rejected']:>6} {stats['error']:>5} "
+              f"{percentile(latencies, 50) * 1000:>8.1f} {percentile(latencies, 95) * 1000:>8.1f} "
+              f"{percentile(latencies, 99) * 1000:>8.1f} {stats['reads'] / count:>9.1f} "
+              f"{stats['writes'] / count:>10.1f}")
+    print(f"\n{total} operations in {wall_time:.1f}s = {total / wall_time:.1f} ops/s")
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, weight = part.split("=")
+        if name not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"unknown operation: {name}")
+        mix[name] = float(weight)
+    return mix
+
+def main():
+    parser = argparse.ArgumentParser(description="Station throughput benchmark (Firestore emulator)")
+    parser.add_argument("--students", type=int, default=10000)
+    parser.add_argument("--books", type=int, default=None, help="default: students / 10")
+    parser.add_argument("--routes", type=int, default=20)
+    parser.add_argument("--history", type=int, default=5, help="past transactions per student")
+    parser.add_argument("--seed", action="store_true", help="write the synthetic data set first")
+    parser.add_argument("--ops", type=int, default=2000, help="operations to replay")
+    parser.add_argument("--concurrency", type=int, default=8, help="parallel stations")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX,
+                        help="weights, e.g. pay=50,board=20,attendance=20,lend=5,return=5")
+    parser.add_argument("--project", default="demo-rfid-benchmark")
+    args = parser.parse_args()
+
+    if not os.environ.get("FIRESTORE_EMULATOR_HOST"):
+        print("Set FIRESTORE_EMULATOR_HOST to point at the Firestore emulator; refusing to load-test production.")
+        return 1
+
+    books = args.books if args.books is not None else max(args.students // 10, 1)
+
+    firebase_admin.initialize_app(options={'projectId': args.project})
+    db = firestore.client()
+
+    if args.seed:
+        seed(db, args.students, books, args.routes, args.history)
+
+    replayer = TapReplayer(db, args.students, books, args.routes)
+    wall_time = replayer.run(args.mix, args.ops, args.concurrency)
+    report(replayer.results, wall_time)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
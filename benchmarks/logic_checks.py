@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Logic checks
+
+Runs the pure functions behind the nightly jobs and the attendance reports
+on small hand-built inputs and fails if any result differs from the expected
+one. Nothing is read from or written to Firestore.
+
+Usage: python benchmarks/logic_checks.py [--only NAME]
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+import tempfile
+import traceback
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'src'))
+
+class CheckFailed(Exception):
+    pass
+
+def expect(actual, expected, what):
+    if actual != expected:
+        raise CheckFailed(f"{what}: expected {expected!r}, got {actual!r}")
+
+# Bus reconciliation
+
+def _tap(event_id, student_id, action, hour, minute=0):
+    return {'id': event_id, 'student_id': student_id, 'student_name': student_id, 'action': action,
+            'stop': None, 'timestamp': datetime.datetime(2024, 3, 4, hour, minute)}
+
+def _pairs(rides):
+    return [(board['id'], exit_event['id'] if exit_event else None) for board, exit_event in rides]
+
+def check_pair_rides():
+    from bus_reconciliation import pair_rides
+
+    # An exit before any board belongs to nobody
+    rides, orphans = pair_rides([_tap('x1', 'A', 'exit', 7), _tap('b1', 'A', 'board', 8),
+                                 _tap('x2', 'A', 'exit', 8, 30)])
+    expect(_pairs(rides), [('b1', 'x2')], "exit before a board: rides")
+    expect([e['id'] for e in orphans], ['x1'], "exit before a board: orphans")
+
+    # A second board without an exit leaves the first one dangling
+    rides, orphans = pair_rides([_tap('b1', 'A', 'board', 8), _tap('b2', 'A', 'board', 8, 5),
+                                 _tap('x1', 'A', 'exit', 8, 30)])
+    expect(_pairs(rides), [('b1', None), ('b2', 'x1')], "repeated boards: rides")
+    expect(orphans, [], "repeated boards: orphans")
+
+    # Taps of several students interleaved in time still pair per student
+    rides, orphans = pair_rides([_tap('b1', 'A', 'board', 8), _tap('b2', 'B', 'board', 8, 1),
+                                 _tap('x2', 'B', 'exit', 8, 20), _tap('x1', 'A', 'exit', 8, 30),
+                                 _tap('x3', 'B', 'exit', 9)])
+    expect(_pairs(rides), [('b1', 'x1'), ('b2', 'x2')], "interleaved students: rides")
+    expect([e['id'] for e in orphans], ['x3'], "interleaved students: orphans")
+
+def check_summarize_trips():
+    from bus_reconciliation import pair_rides, summarize_trips
+
+    first_run = [_tap('b1', 'A', 'board', 8), _tap('x1', 'A', 'exit', 8, 30), _tap('b2', 'B', 'board', 8, 10),
+                 _tap('x0', 'C', 'exit', 8, 40), _tap('b3', 'C', 'board', 15)]
+    summaries = summarize_trips('7', *pair_rides(first_run))
+    expect(sorted(summaries), ['7_2024-03-04_am', '7_2024-03-04_pm'], "trip ids")
+
+    morning = summaries['7_2024-03-04_am']
+    expect((morning['boardings'], morning['exits'], morning['completed_rides'], morning['dangling'],
+            morning['orphan_exits'], morning['riders']), (2, 2, 1, 1, 1, 2), "morning counts")
+    expect(morning['avg_ride_minutes'], 30.0, "morning average ride")
+    expect(summaries['7_2024-03-04_pm']['dangling'], 1, "evening dangling rides")
+
+    # A rerun sees the auto_exit entries the first run wrote; the summaries must not change
+    rerun = first_run + [_tap('auto_exit_b2', 'B', 'auto_exit', 23, 59),
+                         _tap('auto_exit_b3', 'C', 'auto_exit', 23, 59),
+                         _tap('auto_exit_old', 'D', 'auto_exit', 23, 59)]
+    expect(summarize_trips('7', *pair_rides(rerun)), summaries, "summaries after a rerun")
+
+# Academic calendar
+
+def _with_calendar(settings, check):
+    """Run check against a temporary calendar file, then restore the configured one"""
+    import calendar_service
+
+    configured = calendar_service.CALENDAR_FILE
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        calendar_service.CALENDAR_FILE = os.path.join(tmp_dir, "holidays.json")
+        with open(calendar_service.CALENDAR_FILE, 'w') as f:
+            json.dump(settings, f)
+        calendar_service.reload_calendar()
+        try:
+            check(calendar_service)
+        finally:
+            calendar_service.CALENDAR_FILE = configured
+            calendar_service.reload_calendar()
+
+def check_month_mask():
+    # February 2024 starts on a Thursday and has 21 weekdays
+    def check(cal):
+        mask = cal.month_mask(2024, 2)
+        expect(bin(mask).count("1"), 21, "working days in February (one holiday, one make-up day)")
+        expect(bool(mask >> 0 & 1), True, "Thu 1 Feb is a working day")
+        expect(bool(mask >> 2 & 1), False, "Sat 3 Feb is off")
+        expect(bool(mask >> 9 & 1), True, "Sat 10 Feb is a make-up working day")
+        expect(bool(mask >> 13 & 1), False, "Wed 14 Feb is a holiday")
+        expect(mask >> 29, 0, "no bits past the last day")
+        expect(cal.is_working_day(datetime.date(2024, 2, 14)), False, "is_working_day on a holiday")
+        expect(cal.working_days(2024, 2, datetime.date(2024, 2, 15)), 11, "working days up to 15 Feb")
+
+    _with_calendar({'weekend': [5, 6], 'holidays': ['2024-02-14'], 'working_days': ['2024-02-10']}, check)
+
+def check_attendance_summary():
+    def check(cal):
+        dates = ['2024-02-01', '2024-02-03', '2024-02-10', '2024-02-14', '2024-02-20', '2024-03-01', '']
+        # Weekends, holidays, other months and days after today do not count
+        present, total, percentage = cal.attendance_summary(dates, 2024, 2, datetime.date(2024, 2, 15))
+        expect((present, total), (2, 11), "mid-month summary")
+        expect(round(percentage, 2), 18.18, "mid-month percentage")
+
+        present, total, _ = cal.attendance_summary(dates, 2024, 2, datetime.date(2024, 3, 5))
+        expect((present, total), (3, 21), "summary of a finished month")
+
+        expect(cal.attendance_summary(dates, 2024, 4, datetime.date(2024, 3, 5)), (0, 0, 0.0),
+               "summary of a month that has not started")
+
+    _with_calendar({'weekend': [5, 6], 'holidays': ['2024-02-14'], 'working_days': ['2024-02-10']}, check)
+
+# Attendance export (needs NumPy)
+
+def check_presence_matrix():
+    from attendance_export import month_days, month_span, presence_matrix
+
+    expect(month_span((2023, 11), (2024, 2)), [(2023, 11), (2023, 12), (2024, 1), (2024, 2)],
+           "months across a year boundary")
+
+    days = month_days([(2024, 2)])
+    expect((len(days), days[0], days[-1]), (29, datetime.date(2024, 2, 1), datetime.date(2024, 2, 29)),
+           "days of a leap-year February")
+
+    marks = [('s1', '2024-02-01'), ('s1', '2024-02-01'),  # a duplicate mark counts once
+             ('s2', '2024-02-29'),
+             ('gone', '2024-02-02'),                      # student no longer in the classroom
+             ('s3', '2024-03-01')]                        # outside the exported range
+    present = presence_matrix(['s1', 's2', 's3'], days, marks)
+    expect(present.shape, (3, 29), "matrix shape")
+    expect(int(present.sum()), 2, "marks kept")
+    expect((bool(present[0, 0]), bool(present[1, 28])), (True, True), "marked cells")
+    expect(int(present[2].sum()), 0, "student with no marks in range")
+
+    expect(int(presence_matrix(['s1'], days, []).sum()), 0, "no marks at all")
+
+def check_working_day_mask():
+    def check(cal):
+        from attendance_export import working_day_mask
+
+        # 21 working days in February, then Fri 1, Mon 4 and Tue 5 March up to today
+        mask = working_day_mask([(2024, 2), (2024, 3)], datetime.date(2024, 3, 5))
+        expect((len(mask), int(mask.sum())), (60, 24), "working days across two months")
+        expect((bool(mask[9]), bool(mask[13])), (True, False), "make-up day and holiday")
+        expect(int(mask[29 + 5:].sum()), 0, "no working days after today")
+
+    _with_calendar({'weekend': [5, 6], 'holidays': ['2024-02-14'], 'working_days': ['2024-02-10']}, check)
+
+CHECKS = [
+    ('pair_rides', check_pair_rides),
+    ('summarize_trips', check_summarize_trips),
+    ('month_mask', check_month_mask),
+    ('attendance_summary', check_attendance_summary),
+    ('presence_matrix', check_presence_matrix),
+    ('working_day_mask', check_working_day_mask),
+]
+
+def main():
+    parser = argparse.ArgumentParser(description="Checks for the job and report logic")
+    parser.add_argument("--only", choices=[name for name, _ in CHECKS], help="run a single check")
+    args = parser.parse_args()
+
+    failures = []
+    for name, check in CHECKS:
+        if args.only and name != args.only:
+            continue
+        try:
+            check()
+            print(f"{name:<24} ok")
+        except CheckFailed as e:
+            print(f"{name:<24} FAILED  {e}")
+            failures.append(name)
+        except Exception as e:
+            print(f"{name:<24} ERROR   {e}")
+            traceback.print_exc()
+            failures.append(name)
+
+    if failures:
+        print(f"\n{len(failures)} check(s) failed: {', '.join(failures)}")
+        return 1
+
+    print("\nAll checks passed")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Screen transition benchmark
+
+Walks the canteen, library and student screens through a fixed navigation
+cycle and times each transition (including the Tk redraw) two ways:
+rebuilding every screen from scratch, as before the screen manager, and
+raising the cached screen. The screens used here build without Firestore
+reads, so the numbers are pure widget cost. Needs a display (use xvfb-run
+on a headless machine).
+
+Usage: python benchmarks/screen_benchmark.py [--cycles N]
+"""
+import argparse
+import os
+import sys
+import time
+import tkinter as tk
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'src'))
+
+from components.screen_manager import get_screen_manager
+from components.canteen_ui import CanteenUI
+from components.library_ui import LibraryUI
+from components.student_ui import StudentUI
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+def navigation(canteen, library, student):
+    """(label, transition) pairs for one trip around the kiosk screens"""
+    return [
+        ('canteen menu', canteen.show_main_menu),
+        ('purchase', canteen.show_purchase_screen),
+        ('canteen menu', canteen.show_main_menu),
+        ('recharge', canteen.show_recharge_screen),
+        ('canteen menu', canteen.show_main_menu),
+        ('balance', canteen.show_balance_screen),
+        ('library menu', library.show_library_menu),
+        ('student rfid', student.show_rfid_input),
+    ]
+
+def run(root, cycles, rebuild):
+    screens = get_screen_manager(root)
+    canteen = CanteenUI(root, None, lambda: None)
+    library = LibraryUI(root, None, lambda: None)
+    student = StudentUI(root, None, lambda: None)
+    root.update()
+
+    timings = {}
+    for _ in range(cycles):
+        for label, transition in navigation(canteen, library, student):
+            start = time.perf_counter()
+            if rebuild:
+                # What every transition cost before: destroy everything, build again
+                screens.discard('')
+            transition()
+            root.update()
+            timings.setdefault(label, []).append((time.perf_counter() - start) * 1000)
+
+    screens.discard('')
+    return timings
+
+def report(title, timings):
+    print(f"\n{title}")
+    print(f"  {'screen':<14} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+    everything = []
+    for label, values in timings.items():
+        everything.extend(values)
+        print(f"  {label:<14} {percentile(values, 50):>8.2f} {percentile(values, 95):>8.2f} {max(values):>8.2f}")
+    print(f"  {'all':<14} {percentile(everything, 50):>8.2f} {percentile(everything, 95):>8.2f} {max(everything):>8.2f}")
+    return percentile(everything, 50)
+
+def main():
+    parser = argparse.ArgumentParser(description="Screen transition benchmark")
+    parser.add_argument("--cycles", type=int, default=20, help="navigation cycles per mode")
+    args = parser.parse_args()
+
+    root = tk.Tk()
+    root.geometry("800x600")
+
+    rebuild = report("Destroy and rebuild", run(root, args.cycles, rebuild=True))
+    reuse = report("Cached screens (tkraise)", run(root, args.cycles, rebuild=False))
+    root.destroy()
+
+    print(f"\nMedian transition: {rebuild:.2f} ms -> {reuse:.2f} ms "
+          f"({rebuild / reuse if reuse else float('inf'):.1f}x faster)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Startup import benchmark
+
+Imports each station module in a fresh interpreter with `-X importtime` and
+fails if it exceeds its time budget or pulls in the face recognition stack.
+
+Usage: python benchmarks/startup_benchmark.py [--runs N] [--scale FACTOR]
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_DIR = os.path.join(ROOT_DIR, 'src')
+
+# Cumulative import time budget per module, in milliseconds
+BUDGETS_MS = {
+    'utils': 800,
+    'components.canteen_ui': 1000,
+    'components.bus_ui': 1000,
+    'components.library_ui': 1000,
+    'components.student_ui': 1000,
+    'components.admin_ui': 1000,
+    'components.classroom_ui': 1000,
+}
+
+# Heavy modules that only the face module may load
+FORBIDDEN_MODULES = ('cv2', 'face_recognition', 'face_recognition_models', 'dlib', 'numpy', 'PIL', 'face')
+
+def measure_import(module):
+    """Import a module in a fresh interpreter; returns (cumulative_ms, imported, max_rss_kb)"""
+    code = (
+        "import sys, resource\n"
+        f"sys.path.insert(0, {SRC_DIR!r})\n"
+        f"import {module}\n"
+        "print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True, cwd=ROOT_DIR
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr else "import failed")
+
+    cumulative_ms = 0.0
+    imported = set()
+    for line in result.stderr.splitlines():
+        # Format: "import time: self [us] | cumulative | imported package"
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        try:
+            cumulative_us = int(fields[1])
+        except (IndexError, ValueError):
+            # Header line
+            continue
+        package = fields[2].strip()
+        imported.add(package.split(".")[0])
+        if package == module:
+            cumulative_ms = cumulative_us / 1000.0
+
+    max_rss_kb = int(result.stdout.strip().splitlines()[-1])
+    return cumulative_ms, imported, max_rss_kb
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup import-time benchmark")
+    parser.add_argument("--runs", type=int, default=3, help="fresh interpreters per module (best run is kept)")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply every budget, e.g. 2 on slow kiosks")
+    args = parser.parse_args()
+
+    failures = []
+    print(f"{'Module':<28} {'Import ms':>10} {'Budget ms':>10} {'Max RSS MB':>11}")
+
+    for module, budget in BUDGETS_MS.items():
+        budget *= args.scale
+        try:
+            runs = [measure_import(module) for _ in range(args.runs)]
+        except RuntimeError as e:
+            print(f"{module:<28} {'error':>10}   {e}")
+            failures.append(f"{module}: {e}")
+            continue
+
+        best_ms = min(run[0] for run in runs)
+        max_rss_mb = max(run[2] for run in runs) / 1024.0
+        heavy = sorted(set(FORBIDDEN_MODULES) & runs[0][1])
+
+        print(f"{module:<28} {best_ms:>10.1f} {budget:>10.0f} {max_rss_mb:>11.1f}")
+
+        if best_ms > budget:
+            failures.append(f"{module}: {best_ms:.1f} ms exceeds the {budget:.0f} ms budget")
+        if heavy:
+            failures.append(f"{module}: imports {', '.join(heavy)} at startup")
+
+    if failures:
+        print("\nFAILED")
+        for failure in failures:
+            print(f"  {failure}")
+        return 1
+
+    print("\nAll modules within budget")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
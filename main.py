@@ -11,10 +11,14 @@ import os
 import sys
 import json
 import datetime
+import argparse
 
 # Add src to path
 sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
 
+# Headless kiosks have no display to show error dialogs on
+HEADLESS = '--headless' in sys.argv
+
 # Initialize Firebase
 try:
     # Check if firebase config file exists, else create a placeholder
@@ -57,11 +61,14 @@ try:
     # Initialize Firebase with service account
     cred = credentials.Certificate("serviceAccountKey.json")
     firebase_admin.initialize_app(cred)
-    db = firestore.client()
+    # Record reads, writes and latency of every Firestore call (see Admin > Firestore Diagnostics)
+    from instrumentation import instrument
+    db = instrument(firestore.client())
     print("Firebase initialized successfully!")
 except Exception as e:
     print(f"Error initializing Firebase: {e}")
-    messagebox.showerror("Firebase Error", f"Could not initialize Firebase: {e}\nPlease update the firebase_config.json and serviceAccountKey.json files with your actual credentials.")
+    if not HEADLESS:
+        messagebox.showerror("Firebase Error", f"Could not initialize Firebase: {e}\nPlease update the firebase_config.json and serviceAccountKey.json files with your actual credentials.")
     db = None
 
 # Import UI modules after Firebase initialization
@@ -71,6 +78,11 @@ from components.canteen_ui import CanteenUI
 from components.library_ui import LibraryUI
 from components.bus_ui import BusUI
 from components.student_ui import StudentUI
+from components.screen_manager import get_screen_manager
+
+# Wrap the station handlers in spans/profilers when RFID_PROFILE is set
+import profiling
+profiling.install()
 
 # Function to initialize database with sample data
 def initialize_database():
@@ -292,15 +304,19 @@ class RFIDApp:
         self.style.configure('TButton', font=('Arial', 12))
         self.style.configure('TLabel', font=('Arial', 12), background='#f0f0f0')
         
+        # Screens are built once and raised on navigation; stations keep their UI objects
+        self.screens = get_screen_manager(self.root)
+        self.canteen_ui = None
+        self.library_ui = None
+        self.student_ui = None
+        
         self.create_main_menu()
     
     def create_main_menu(self):
-        # Clear any existing widgets
-        for widget in self.root.winfo_children():
-            widget.destroy()
-        
-        main_frame = ttk.Frame(self.root, padding="20")
-        main_frame.pack(fill=tk.BOTH, expand=True)
+        self.screens.show('main_menu', self.build_main_menu, title="RFID Student Wallet Application")
+    
+    def build_main_menu(self, main_frame):
+        main_frame.configure(padding="20")
         
         # Title
         title_label = ttk.Label(main_frame, text="RFID Student Wallet Application", font=('Arial', 18, 'bold'))
@@ -356,13 +372,19 @@ class RFIDApp:
     
     def open_canteen_ui(self):
         if db:
-            CanteenUI(self.root, db, self.create_main_menu)
+            if self.canteen_ui is None:
+                self.canteen_ui = CanteenUI(self.root, db, self.create_main_menu)
+            else:
+                self.canteen_ui.show_main_menu()
         else:
             messagebox.showerror("Firebase Error", "Database not initialized. Please check Firebase credentials.")
     
     def open_library_ui(self):
         if db:
-            LibraryUI(self.root, db, self.create_main_menu)
+            if self.library_ui is None:
+                self.library_ui = LibraryUI(self.root, db, self.create_main_menu)
+            else:
+                self.library_ui.show_library_menu()
         else:
             messagebox.showerror("Firebase Error", "Database not initialized. Please check Firebase credentials.")
     
@@ -374,7 +396,10 @@ class RFIDApp:
     
     def open_student_ui(self):
         if db:
-            StudentUI(self.root, db, self.create_main_menu)
+            if self.student_ui is None:
+                self.student_ui = StudentUI(self.root, db, self.create_main_menu)
+            else:
+                self.student_ui.show_rfid_input()
         else:
             messagebox.showerror("Firebase Error", "Database not initialized. Please check Firebase credentials.")
 
@@ -382,6 +407,22 @@ def main():
     """
     Main entry point for the application.
     """
+    parser = argparse.ArgumentParser(description="RFID Student Wallet Application")
+    parser.add_argument("--headless", action="store_true",
+                        help="serve station operations over HTTP/JSON instead of showing the GUI")
+    parser.add_argument("--host", default="127.0.0.1", help="address for the headless service")
+    parser.add_argument("--port", type=int, default=8080, help="port for the headless service")
+    parser.add_argument("--unix-socket", help="listen on a Unix socket instead of TCP")
+    args = parser.parse_args()
+    
+    if args.headless:
+        if not db:
+            print("Database not initialized. Please check Firebase credentials.")
+            sys.exit(1)
+        from kiosk_server import run_headless
+        run_headless(db, args.host, args.port, args.unix_socket)
+        return
+    
     root = tk.Tk()
     app = RFIDApp(root)
     root.mainloop()
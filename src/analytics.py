@@ -0,0 +1,251 @@
+import argparse
+import datetime
+import os
+import threading
+
+import numpy as np
+from firebase_admin import firestore
+
+# Columnar copy of the transactions collection, refreshed incrementally
+CACHE_PATH = os.environ.get("ANALYTICS_CACHE", "transactions_cache.npz")
+
+# Transactions fetched per page while refreshing
+PAGE_SIZE = 1000
+
+# Wallet balance bands (₹) for the low-balance report
+BALANCE_BANDS = (50, 100, 200, 500)
+
+WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+
+def _epoch(when):
+    # Stored naive local times come back tagged as UTC, so naive bounds are read the same way
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=datetime.timezone.utc)
+    return when.timestamp()
+
+class TransactionStore:
+    """Transactions as NumPy columns, cached on disk and extended from a timestamp watermark"""
+
+    def __init__(self, path=CACHE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.clear()
+        self.load()
+
+    def clear(self):
+        self.timestamp = np.zeros(0, dtype=np.float64)  # local wall-clock time as epoch seconds
+        self.amount = np.zeros(0, dtype=np.float64)
+        self.is_debit = np.zeros(0, dtype=bool)
+        self.location = np.zeros(0, dtype=np.int32)      # index into self.locations
+        self.student = np.zeros(0, dtype=np.int32)       # index into self.students
+        self.locations = []
+        self.students = []
+        # Ids of the transactions at the watermark, so a refresh starting there skips them
+        self.watermark_ids = set()
+
+    @property
+    def watermark(self):
+        return float(self.timestamp[-1]) if len(self.timestamp) else None
+
+    def __len__(self):
+        return len(self.timestamp)
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                self.timestamp = data['timestamp']
+                self.amount = data['amount']
+                self.is_debit = data['is_debit']
+                self.location = data['location']
+                self.student = data['student']
+                self.locations = data['locations'].tolist()
+                self.students = data['students'].tolist()
+                self.watermark_ids = set(data['watermark_ids'].tolist())
+        except Exception as e:
+            print(f"Error loading analytics cache, rebuilding: {e}")
+            self.clear()
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, timestamp=self.timestamp, amount=self.amount, is_debit=self.is_debit,
+                     location=self.location, student=self.student,
+                     locations=np.array(self.locations, dtype=str), students=np.array(self.students, dtype=str),
+                     watermark_ids=np.array(sorted(self.watermark_ids), dtype=str))
+        os.replace(tmp_path, self.path)
+
+    def refresh(self, db):
+        """Pull transactions newer than the watermark; returns how many were added"""
+        with self.lock:
+            location_index = {name: i for i, name in enumerate(self.locations)}
+            student_index = {name: i for i, name in enumerate(self.students)}
+            columns = {'timestamp': [], 'amount': [], 'is_debit': [], 'location': [], 'student': []}
+            watermark = self.watermark
+            # The query starts at the watermark (inclusive), so skip what was already cached there
+            cached_ids = self.watermark_ids
+            watermark_ids = set(cached_ids)
+
+            query = db.collection('transactions').order_by('timestamp').limit(PAGE_SIZE)
+            if watermark is not None:
+                since = datetime.datetime.fromtimestamp(watermark, tz=datetime.timezone.utc)
+                query = db.collection('transactions').where(
+                    filter=firestore.FieldFilter('timestamp', '>=', since)
+                ).order_by('timestamp').limit(PAGE_SIZE)
+
+            last_doc = None
+            while True:
+                page = query.start_after(last_doc) if last_doc else query
+                docs = list(page.stream())
+                for doc in docs:
+                    data = doc.to_dict()
+                    timestamp = data.get('timestamp')
+                    if timestamp is None:
+                        continue
+                    ts = timestamp.timestamp()
+                    if doc.id in cached_ids:
+                        continue
+                    if watermark is None or ts > watermark:
+                        watermark = ts
+                        watermark_ids = set()
+                    watermark_ids.add(doc.id)
+
+                    location = data.get('location') or 'Unknown'
+                    student_id = data.get('student_id') or ''
+                    columns['timestamp'].append(ts)
+                    columns['amount'].append(float(data.get('amount', 0) or 0))
+                    columns['is_debit'].append(data.get('type') == 'debit')
+                    columns['location'].append(location_index.setdefault(location, len(location_index)))
+                    columns['student'].append(student_index.setdefault(student_id, len(student_index)))
+                if len(docs) < PAGE_SIZE:
+                    break
+                last_doc = docs[-1]
+
+            added = len(columns['timestamp'])
+            if added:
+                self.timestamp = np.concatenate([self.timestamp, np.array(columns['timestamp'], dtype=np.float64)])
+                self.amount = np.concatenate([self.amount, np.array(columns['amount'], dtype=np.float64)])
+                self.is_debit = np.concatenate([self.is_debit, np.array(columns['is_debit'], dtype=bool)])
+                self.location = np.concatenate([self.location, np.array(columns['location'], dtype=np.int32)])
+                self.student = np.concatenate([self.student, np.array(columns['student'], dtype=np.int32)])
+                self.locations = sorted(location_index, key=location_index.get)
+                self.students = sorted(student_index, key=student_index.get)
+                self.watermark_ids = watermark_ids
+                self.save()
+            return added
+
+    def debits(self, start=None, end=None):
+        """Boolean mask of debits in [start, end) (datetimes)"""
+        mask = self.is_debit.copy()
+        if start is not None:
+            mask &= self.timestamp >= _epoch(start)
+        if end is not None:
+            mask &= self.timestamp < _epoch(end)
+        return mask
+
+# Reports
+
+def spend_by_location(store, start=None, end=None):
+    """[(location, total spent, transactions)] sorted by total, largest first"""
+    mask = store.debits(start, end)
+    size = len(store.locations)
+    totals = np.bincount(store.location[mask], weights=store.amount[mask], minlength=size)
+    counts = np.bincount(store.location[mask], minlength=size)
+    order = np.argsort(-totals)
+    return [(store.locations[i], float(totals[i]), int(counts[i])) for i in order if counts[i]]
+
+def peak_hours(store, start=None, end=None):
+    """Spend and transaction counts by local hour of day, plus a weekday x hour count grid"""
+    mask = store.debits(start, end)
+    # Timestamps already hold local wall-clock time, so no offset is applied
+    local = store.timestamp[mask]
+    hours = (local // 3600 % 24).astype(np.int64)
+    # 1970-01-01 was a Thursday (weekday 3)
+    weekdays = ((local // 86400 + 3) % 7).astype(np.int64)
+
+    return {
+        'spend': np.bincount(hours, weights=store.amount[mask], minlength=24),
+        'count': np.bincount(hours, minlength=24),
+        'weekday_hour': np.bincount(weekdays * 24 + hours, minlength=7 * 24).reshape(7, 24)
+    }
+
+def spend_percentiles(store, start=None, end=None, percentiles=(50, 75, 90, 95, 99)):
+    """Percentiles of single purchase amounts and of total spend per student"""
+    mask = store.debits(start, end)
+    amounts = store.amount[mask]
+    per_student = np.bincount(store.student[mask], weights=amounts, minlength=len(store.students))
+    per_student = per_student[per_student > 0]
+    return {
+        'transaction': dict(zip(percentiles, np.percentile(amounts, percentiles))) if len(amounts) else {},
+        'student': dict(zip(percentiles, np.percentile(per_student, percentiles))) if len(per_student) else {},
+        'transactions': int(len(amounts)),
+        'students': int(len(per_student)),
+        'total': float(amounts.sum())
+    }
+
+def low_balance_cohorts(db, bands=BALANCE_BANDS):
+    """Students per wallet balance band, overall and by department"""
+    department_index = {}
+    balances = []
+    codes = []
+    for doc in db.collection('students').select(['wallet_balance', 'department']).stream():
+        data = doc.to_dict()
+        department = data.get('department') or 'Unknown'
+        codes.append(department_index.setdefault(department, len(department_index)))
+        balances.append(float(data.get('wallet_balance', 0) or 0))
+    departments = sorted(department_index, key=department_index.get)
+
+    labels = [f"Under ₹{bands[0]}"] + [f"₹{low}-{high}" for low, high in zip(bands, bands[1:])] + [f"₹{bands[-1]}+"]
+    balances = np.array(balances, dtype=np.float64)
+    band = np.digitize(balances, bands)
+    codes = np.array(codes, dtype=np.int64)
+    grid = np.bincount(codes * len(labels) + band, minlength=len(departments) * len(labels)) \
+        .reshape(len(departments), len(labels)) if len(departments) else np.zeros((0, len(labels)), dtype=np.int64)
+
+    return {
+        'labels': labels,
+        'overall': np.bincount(band, minlength=len(labels)),
+        'departments': departments,
+        'by_department': grid
+    }
+
+def main():
+    from utils import init_firestore
+
+    parser = argparse.ArgumentParser(description="Campus-wide spending reports")
+    parser.add_argument("--days", type=int, default=30, help="report window")
+    parser.add_argument("--full", action="store_true", help="discard the cache and reload everything")
+    parser.add_argument("--key", default="serviceAccountKey.json", help="service account key file")
+    args = parser.parse_args()
+
+    db = init_firestore(args.key)
+    if args.full and os.path.exists(CACHE_PATH):
+        os.remove(CACHE_PATH)
+    store = TransactionStore()
+    added = store.refresh(db)
+    print(f"{added} new transactions; {len(store)} cached")
+
+    start = datetime.datetime.now() - datetime.timedelta(days=args.days)
+
+    print(f"\nSpend by location (last {args.days} days)")
+    for location, total, count in spend_by_location(store, start):
+        print(f"  {location:<20} ₹{total:>12,.2f}  {count:>7} purchases")
+
+    hours = peak_hours(store, start)
+    print("\nPurchases by hour")
+    for hour in np.argsort(-hours['count'])[:5]:
+        print(f"  {hour:02d}:00  {int(hours['count'][hour]):>7} purchases  ₹{hours['spend'][hour]:,.2f}")
+
+    report = spend_percentiles(store, start)
+    print(f"\nPercentiles ({report['transactions']} purchases, {report['students']} students)")
+    for pct, value in report['transaction'].items():
+        print(f"  p{pct:<3} purchase ₹{value:,.2f}   student total ₹{report['student'].get(pct, 0):,.2f}")
+
+    cohorts = low_balance_cohorts(db)
+    print("\nStudents by wallet balance")
+    for label, count in zip(cohorts['labels'], cohorts['overall']):
+        print(f"  {label:<12} {int(count)}")
+
+if __name__ == "__main__":
+    main()
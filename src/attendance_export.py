@@ -0,0 +1,191 @@
+import argparse
+import csv
+import datetime
+
+import numpy as np
+from firebase_admin import firestore
+
+from calendar_service import month_mask, days_in_month
+
+# Firestore accepts at most 30 values in an "in" filter
+IN_LIMIT = 30
+
+def parse_month(text):
+    """'YYYY-MM' -> (year, month)"""
+    year, month = text.strip().split("-")
+    year, month = int(year), int(month)
+    if not 1 <= month <= 12:
+        raise ValueError(f"Invalid month: {text}")
+    return year, month
+
+def month_days(months):
+    """Every calendar day of the given (year, month) pairs, in order"""
+    days = []
+    for year, month in months:
+        days.extend(datetime.date(year, month, day) for day in range(1, days_in_month(year, month) + 1))
+    return days
+
+def month_span(start, end):
+    """(year, month) pairs from start to end inclusive"""
+    months = []
+    year, month = start
+    while (year, month) <= end:
+        months.append((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+def classroom_from_key(key):
+    """Classroom info from a 'DEPARTMENT_YEAR_SECTION' key"""
+    department, year, section = key.rsplit("_", 2)
+    return {'department': department, 'year': int(year), 'section': section, 'key': key}
+
+def load_students(db, classroom_info):
+    """[(student_id, data)] for a classroom, sorted by name"""
+    query = db.collection('students').where(
+        filter=firestore.FieldFilter('department', '==', classroom_info['department'])
+    ).where(
+        filter=firestore.FieldFilter('section', '==', classroom_info['section'])
+    ).where(
+        # Years are stored as text by some screens and as numbers by others
+        filter=firestore.FieldFilter('year', 'in', [str(classroom_info['year']), classroom_info['year']])
+    ).select(['name', 'rfid', 'id'])
+    students = [(doc.id, doc.to_dict()) for doc in query.stream()]
+    students.sort(key=lambda item: str(item[1].get('name', '')).lower())
+    return students
+
+def load_marks(db, classroom_keys, first_day, last_day):
+    """{classroom_key: [(student_id, date)]} of attendance in the classrooms between two dates inclusive"""
+    marks = {key: [] for key in classroom_keys}
+    for start in range(0, len(classroom_keys), IN_LIMIT):
+        # Needs the (classroom_key, date) composite index from firestore.indexes.json
+        query = db.collection('attendance').where(
+            filter=firestore.FieldFilter('classroom_key', 'in', classroom_keys[start:start + IN_LIMIT])
+        ).where(
+            filter=firestore.FieldFilter('date', '>=', first_day.strftime("%Y-%m-%d"))
+        ).where(
+            filter=firestore.FieldFilter('date', '<=', last_day.strftime("%Y-%m-%d"))
+        ).select(['student_id', 'date', 'classroom_key'])
+        for doc in query.stream():
+            data = doc.to_dict()
+            if data.get('student_id') and data.get('date') and data.get('classroom_key') in marks:
+                marks[data['classroom_key']].append((data['student_id'], data['date']))
+    return marks
+
+def presence_matrix(student_ids, days, marks):
+    """Boolean students x days matrix of who was present when"""
+    row_of = {student_id: i for i, student_id in enumerate(student_ids)}
+    column_of = {day.strftime("%Y-%m-%d"): j for j, day in enumerate(days)}
+
+    rows, columns = [], []
+    for student_id, date_str in marks:
+        row = row_of.get(student_id)
+        column = column_of.get(date_str)
+        # Students who left the classroom and dates outside the range are dropped
+        if row is not None and column is not None:
+            rows.append(row)
+            columns.append(column)
+
+    present = np.zeros((len(student_ids), len(days)), dtype=bool)
+    present[np.array(rows, dtype=np.int64), np.array(columns, dtype=np.int64)] = True
+    return present
+
+def working_day_mask(months, today=None):
+    """Days of the months that count towards attendance: working days up to today"""
+    today = today or datetime.date.today()
+    bits = []
+    for year, month in months:
+        mask = month_mask(year, month)
+        bits.extend((mask >> day) & 1 for day in range(days_in_month(year, month)))
+    dates = np.array(month_days(months), dtype='datetime64[D]')
+    return np.array(bits, dtype=bool) & (dates <= np.datetime64(today))
+
+def export_rows(db, classrooms, months, today=None):
+    """Header and a generator of rows for the classrooms over the months"""
+    days = month_days(months)
+    working = working_day_mask(months, today)
+    working_count = int(working.sum())
+    today = today or datetime.date.today()
+    future = np.array(days, dtype='datetime64[D]') > np.datetime64(today)
+
+    header = ['Classroom', 'Roll No', 'Name', 'RFID'] + [day.strftime("%Y-%m-%d") for day in days] + \
+             ['Present', 'Absent', 'Working Days', 'Percentage']
+
+    classroom_keys = [info['key'] for info in classrooms]
+    marks = load_marks(db, classroom_keys, days[0], days[-1])
+
+    def rows():
+        for info in classrooms:
+            students = load_students(db, info)
+            if not students:
+                continue
+            present = presence_matrix([student_id for student_id, _ in students], days, marks[info['key']])
+
+            # Totals for the whole classroom at once
+            present_count = (present & working).sum(axis=1)
+            absent_count = working_count - present_count
+            percentage = present_count * 100.0 / working_count if working_count else np.zeros(len(students))
+
+            # P present, A absent on a working day, '-' weekend or holiday, blank still to come
+            cells = np.where(present, 'P', np.where(working, 'A', np.where(future, '', '-')))
+
+            for i, (student_id, data) in enumerate(students):
+                yield [info['key'], data.get('id', student_id), data.get('name', 'Unknown'), data.get('rfid', 'Unknown')] + \
+                      cells[i].tolist() + \
+                      [int(present_count[i]), int(absent_count[i]), working_count, f"{percentage[i]:.2f}%"]
+
+    return header, rows()
+
+def write_csv(path, header, rows):
+    """Write rows as they are produced"""
+    count = 0
+    with open(path, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(header)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    return count
+
+def write_xlsx(path, header, rows):
+    """Write rows with openpyxl's write-only workbook, which streams them to disk"""
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        raise RuntimeError("openpyxl is not installed: pip install openpyxl")
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Attendance")
+    sheet.append(header)
+    count = 0
+    for row in rows:
+        sheet.append(row)
+        count += 1
+    workbook.save(path)
+    return count
+
+def export_attendance(db, classrooms, months, path, today=None):
+    """Export the classrooms' attendance for the months to .csv or .xlsx; returns the number of students"""
+    header, rows = export_rows(db, classrooms, months, today)
+    if path.lower().endswith('.xlsx'):
+        return write_xlsx(path, header, rows)
+    return write_csv(path, header, rows)
+
+def main():
+    from utils import init_firestore
+
+    parser = argparse.ArgumentParser(description="Monthly attendance sheets")
+    parser.add_argument("--classroom", action="append", required=True,
+                        help="classroom key such as CSE_3_A (repeat for several)")
+    parser.add_argument("--from", dest="start", default=datetime.date.today().strftime("%Y-%m"), help="first month (YYYY-MM)")
+    parser.add_argument("--to", dest="end", help="last month (YYYY-MM), defaults to --from")
+    parser.add_argument("--out", required=True, help="output file (.csv or .xlsx)")
+    parser.add_argument("--key", default="serviceAccountKey.json", help="service account key file")
+    args = parser.parse_args()
+
+    months = month_span(parse_month(args.start), parse_month(args.end or args.start))
+    classrooms = [classroom_from_key(key) for key in args.classroom]
+    count = export_attendance(init_firestore(args.key), classrooms, months, args.out)
+    print(f"Exported {count} students over {len(months)} month(s) to {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+import atexit
+import datetime
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Attendance records wait in this SQLite file until Firestore acknowledges them
+SPOOL_PATH = os.environ.get("ATTENDANCE_SPOOL", "attendance_spool.db")
+
+# A batch is committed when this many records are waiting or the oldest has waited this long
+FLUSH_SIZE = 25
+FLUSH_INTERVAL = 2
+
+# Firestore allows at most 500 writes per batch
+BATCH_SIZE = 400
+
+# Retry schedule for failed commits
+BACKOFF_BASE = 2
+BACKOFF_MAX = 60
+
+def attendance_doc_id(student_id, date_str):
+    """One attendance document per student per day, so a retried write lands on the same document"""
+    return f"{student_id}_{date_str}"
+
+def _encode(value):
+    if isinstance(value, datetime.datetime):
+        return {'__datetime__': value.isoformat()}
+    raise TypeError(f"Cannot spool {type(value).__name__}")
+
+def _decode(value):
+    if '__datetime__' in value:
+        return datetime.datetime.fromisoformat(value['__datetime__'])
+    return value
+
+class AttendanceSpool:
+    """SQLite-backed queue of attendance records not yet committed to Firestore"""
+
+    def __init__(self, path=SPOOL_PATH):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS spool (
+                doc_id TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL,
+                last_error TEXT
+            )
+        """)
+        self.conn.commit()
+
+    def add(self, doc_id, data):
+        """Spool a record; returns False if the same document is already waiting"""
+        now = time.time()
+        with self.lock:
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO spool (doc_id, data, created_at, next_attempt_at) VALUES (?, ?, ?, ?)",
+                (doc_id, json.dumps(data, default=_encode), now, now)
+            )
+            self.conn.commit()
+            return cursor.rowcount > 0
+
+    def due(self, limit=BATCH_SIZE):
+        """Records whose next attempt is due, oldest first"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT doc_id, data, attempts FROM spool WHERE next_attempt_at <= ? ORDER BY created_at LIMIT ?",
+                (time.time(), limit)
+            ).fetchall()
+        return [{'doc_id': r[0], 'data': json.loads(r[1], object_hook=_decode), 'attempts': r[2]} for r in rows]
+
+    def remove(self, doc_ids):
+        with self.lock:
+            self.conn.executemany("DELETE FROM spool WHERE doc_id = ?", [(doc_id,) for doc_id in doc_ids])
+            self.conn.commit()
+
+    def mark_failed(self, items, error):
+        now = time.time()
+        with self.lock:
+            for item in items:
+                attempts = item['attempts'] + 1
+                delay = min(BACKOFF_BASE * (2 ** (attempts - 1)), BACKOFF_MAX)
+                self.conn.execute(
+                    "UPDATE spool SET attempts = ?, next_attempt_at = ?, last_error = ? WHERE doc_id = ?",
+                    (attempts, now + delay, str(error), item['doc_id'])
+                )
+            self.conn.commit()
+
+    def due_summary(self):
+        """(number of due records, seconds the oldest of them has waited)"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT COUNT(*), MIN(created_at) FROM spool WHERE next_attempt_at <= ?", (time.time(),)
+            ).fetchone()
+        if not row[0]:
+            return 0, None
+        return row[0], time.time() - row[1]
+
+    def count(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM spool").fetchone()[0]
+
+class AttendanceWriter:
+    """Commit spooled attendance records in batches from a background thread"""
+
+    def __init__(self, db, spool_path=SPOOL_PATH, flush_size=FLUSH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.db = db
+        self.spool = AttendanceSpool(spool_path)
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.wakeup = threading.Condition()
+        self.stopping = False
+        self.thread = None
+
+    def start(self):
+        """Start the flush thread (records left from a previous run are sent first)"""
+        if self.thread is not None:
+            return
+        self.stopping = False
+        self.thread = threading.Thread(target=self._worker, name="attendance-writer", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=5):
+        """Stop the flush thread after one last attempt to commit what is waiting"""
+        with self.wakeup:
+            self.stopping = True
+            self.wakeup.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+    def enqueue(self, doc_id, data):
+        """Spool a record for the next batch; it is durable once this returns"""
+        self.spool.add(doc_id, data)
+        if self.spool.count() >= self.flush_size:
+            with self.wakeup:
+                self.wakeup.notify()
+
+    def flush(self):
+        """Commit one batch of due records; returns how many were written"""
+        items = self.spool.due()
+        if not items:
+            return 0
+
+        try:
+            batch = self.db.batch()
+            for item in items:
+                # set() rather than create(): replaying a batch whose ack was lost rewrites the same documents
+                batch.set(self.db.collection('attendance').document(item['doc_id']), item['data'])
+            batch.commit()
+        except Exception as e:
+            print(f"Error writing {len(items)} attendance records, will retry: {e}")
+            self.spool.mark_failed(items, e)
+            return 0
+
+        self.spool.remove([item['doc_id'] for item in items])
+        return len(items)
+
+    def wait_idle(self, timeout=30):
+        """Block until the spool is empty or timeout passes; returns the number still spooled"""
+        deadline = time.time() + timeout
+        with self.wakeup:
+            self.wakeup.notify()
+        remaining = self.spool.count()
+        while remaining and time.time() < deadline:
+            time.sleep(0.2)
+            remaining = self.spool.count()
+        return remaining
+
+    def _worker(self):
+        while True:
+            with self.wakeup:
+                if self.stopping:
+                    break
+                # Flush once enough records are waiting or the oldest has waited long enough
+                due, age = self.spool.due_summary()
+                if due < self.flush_size and (age is None or age < self.flush_interval):
+                    wait = self.flush_interval - age if age is not None else self.flush_interval
+                    self.wakeup.wait(timeout=max(wait, 0.05))
+                    continue
+            self.flush()
+
+        # Last chance before the process exits; anything left stays spooled for the next start
+        try:
+            while self.flush():
+                pass
+        except Exception as e:
+            print(f"Error flushing attendance records on shutdown: {e}")
+
+_writer = None
+_writer_lock = threading.Lock()
+
+def get_attendance_writer(db):
+    """Return the process-wide attendance writer, starting it on first use"""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = AttendanceWriter(db)
+            _writer.start()
+            atexit.register(_writer.stop)
+        return _writer
@@ -0,0 +1,345 @@
+import argparse
+import datetime
+import time
+from firebase_admin import firestore
+
+from utils import init_firestore
+from route_cache import get_route_cache
+from stations import trip_id, trip_run
+
+# Activity is read in pages of this size
+PAGE_SIZE = 500
+
+# Firestore allows at most 500 writes per batch
+BATCH_SIZE = 400
+
+# Days reconciled on the first run, before any watermark exists
+INITIAL_DAYS = 7
+
+# The job remembers the last reconciled day here
+STATE_COLLECTION = 'job_state'
+STATE_DOCUMENT = 'bus_reconciliation'
+
+EXIT_ACTIONS = ('exit', 'auto_exit')
+
+def _naive(value):
+    # Stored naive local times come back tagged as UTC; keep the wall-clock time
+    if getattr(value, 'tzinfo', None) is not None:
+        return value.replace(tzinfo=None)
+    return value
+
+def iter_route_activity(db, route_id, start, end, page_size=PAGE_SIZE):
+    """Yield a route's bus activity with start <= timestamp < end, oldest first"""
+    # Needs the (route_num, timestamp) composite index from firestore.indexes.json
+    query = db.collection('bus_activity').where(
+        filter=firestore.FieldFilter('route_num', '==', route_id)
+    ).where(
+        filter=firestore.FieldFilter('timestamp', '>=', start)
+    ).where(
+        filter=firestore.FieldFilter('timestamp', '<', end)
+    ).order_by('timestamp')
+
+    last_doc = None
+    while True:
+        page_query = query.limit(page_size)
+        if last_doc is not None:
+            page_query = page_query.start_after(last_doc)
+
+        docs = list(page_query.stream())
+        for doc in docs:
+            yield doc
+
+        if len(docs) < page_size:
+            break
+        last_doc = docs[-1]
+
+def load_events(activity_docs):
+    """Board and exit events as small dicts, skipping malformed activity"""
+    events = []
+    for doc in activity_docs:
+        data = doc.to_dict()
+        if not data.get('student_id') or not data.get('timestamp'):
+            continue
+        if data.get('action') != 'board' and data.get('action') not in EXIT_ACTIONS:
+            continue
+        events.append({
+            'id': doc.id,
+            'student_id': data['student_id'],
+            'student_name': data.get('student_name'),
+            'action': data['action'],
+            'stop': data.get('stop'),
+            'timestamp': _naive(data['timestamp'])
+        })
+    return events
+
+def pair_rides(events):
+    """
+    Sort-merge one route's boards against its exits, per student.
+    Each board is paired with the student's first exit after it and before their next board.
+    Returns (rides, orphan_exits) where rides are (board, exit or None).
+    """
+    key = lambda event: (event['student_id'], event['timestamp'])
+    boards = sorted((e for e in events if e['action'] == 'board'), key=key)
+    exits = sorted((e for e in events if e['action'] in EXIT_ACTIONS), key=key)
+
+    rides = []
+    orphans = []
+    j = 0
+    for i, board in enumerate(boards):
+        # Exits before this board belong to nobody (the boarding tap was missed)
+        while j < len(exits) and key(exits[j]) < key(board):
+            orphans.append(exits[j])
+            j += 1
+
+        next_board = boards[i + 1] if i + 1 < len(boards) else None
+        if next_board is not None and next_board['student_id'] != board['student_id']:
+            next_board = None
+
+        if j < len(exits) and exits[j]['student_id'] == board['student_id'] and \
+                (next_board is None or exits[j]['timestamp'] <= next_board['timestamp']):
+            rides.append((board, exits[j]))
+            j += 1
+        else:
+            rides.append((board, None))
+
+    orphans.extend(exits[j:])
+    return rides, orphans
+
+def summarize_trips(route_id, rides, orphans):
+    """Per-trip counts and ride times, keyed by trip id"""
+    summaries = {}
+
+    def summary_for(when):
+        return summaries.setdefault(trip_id(route_id, when), {
+            'route_id': route_id,
+            'date': when.strftime("%Y-%m-%d"),
+            'run': trip_run(when),
+            'boardings': 0,
+            'exits': 0,
+            'completed_rides': 0,
+            'dangling': 0,
+            'orphan_exits': 0,
+            'riders': set(),
+            'ride_minutes': [],
+            'first_event': None,
+            'last_event': None
+        })
+
+    def touch(summary, when):
+        if summary['first_event'] is None or when < summary['first_event']:
+            summary['first_event'] = when
+        if summary['last_event'] is None or when > summary['last_event']:
+            summary['last_event'] = when
+
+    for board, exit_event in rides:
+        summary = summary_for(board['timestamp'])
+        summary['boardings'] += 1
+        summary['riders'].add(board['student_id'])
+        touch(summary, board['timestamp'])
+        if exit_event is None or exit_event['action'] == 'auto_exit':
+            # Closed by an earlier run of this job, so a rerun reports the same trip
+            summary['dangling'] += 1
+        else:
+            summary['exits'] += 1
+            summary['completed_rides'] += 1
+            summary['ride_minutes'].append((exit_event['timestamp'] - board['timestamp']).total_seconds() / 60)
+            touch(summary, exit_event['timestamp'])
+
+    for exit_event in orphans:
+        if exit_event['action'] == 'auto_exit':
+            continue
+        summary = summary_for(exit_event['timestamp'])
+        summary['exits'] += 1
+        summary['orphan_exits'] += 1
+        touch(summary, exit_event['timestamp'])
+
+    for summary in summaries.values():
+        minutes = summary.pop('ride_minutes')
+        summary['riders'] = len(summary['riders'])
+        summary['avg_ride_minutes'] = round(sum(minutes) / len(minutes), 1) if minutes else None
+        summary['max_ride_minutes'] = round(max(minutes), 1) if minutes else None
+
+    return summaries
+
+def _load_students(db, student_ids, chunk_size=100):
+    """Fetch student documents in bulk instead of one read per student"""
+    students = {}
+    student_ids = list(student_ids)
+
+    for i in range(0, len(student_ids), chunk_size):
+        refs = [db.collection('students').document(sid) for sid in student_ids[i:i + chunk_size]]
+        for doc in db.get_all(refs):
+            if doc.exists:
+                students[doc.id] = doc.to_dict()
+
+    return students
+
+def _commit_in_batches(db, operations, batch_size=BATCH_SIZE):
+    """Apply (action, ref, data) operations using as few batches as possible"""
+    batch = db.batch()
+    pending = 0
+    committed = 0
+
+    for action, ref, data in operations:
+        if action == 'set':
+            batch.set(ref, data)
+        elif action == 'merge':
+            batch.set(ref, data, merge=True)
+        elif action == 'update':
+            batch.update(ref, data)
+        pending += 1
+
+        if pending >= batch_size:
+            batch.commit()
+            committed += pending
+            batch = db.batch()
+            pending = 0
+
+    if pending:
+        batch.commit()
+        committed += pending
+
+    return committed
+
+def reconcile_day(db, day, route_ids=None):
+    """Pair a day's taps, close rides that never got an exit and write trip summaries"""
+    start = datetime.datetime.combine(day, datetime.time.min)
+    end = start + datetime.timedelta(days=1)
+    closed_at = end - datetime.timedelta(seconds=1)
+    now = datetime.datetime.now()
+
+    if route_ids is None:
+        route_ids = [route['route_id'] for route in get_route_cache(db).all() if route.get('route_id')]
+
+    summaries = {}
+    dangling = []
+    event_count = 0
+    for route_id in route_ids:
+        events = load_events(iter_route_activity(db, route_id, start, end))
+        event_count += len(events)
+        rides, orphans = pair_rides(events)
+        summaries.update(summarize_trips(route_id, rides, orphans))
+        dangling.extend((route_id, board) for board, exit_event in rides if exit_event is None)
+
+    # Only reset students whose last tap is still the dangling board
+    students = _load_students(db, {board['student_id'] for _, board in dangling})
+    closed = 0
+
+    def operations():
+        nonlocal closed
+        for trip, summary in summaries.items():
+            yield 'merge', db.collection('bus_trips').document(trip), {
+                'route_id': summary['route_id'],
+                'date': summary['date'],
+                'run': summary['run'],
+                'summary': {**summary, 'reconciled_at': now},
+                'closed': True,
+                # Nobody is left on a bus once its day is reconciled
+                'riders': firestore.DELETE_FIELD,
+                'headcount': 0
+            }
+
+        for route_id, board in dangling:
+            student = students.get(board['student_id'])
+            if not student or student.get('bus_status') != 'inside':
+                continue
+            last = student.get('last_bus_action') or {}
+            if last.get('action') != 'board' or last.get('route') != route_id or \
+                    _naive(last.get('timestamp')) != board['timestamp']:
+                continue
+
+            # The document id makes a rerun rewrite the same closing activity
+            activity_id = f"auto_exit_{board['id']}"
+            yield 'set', db.collection('bus_activity').document(activity_id), {
+                'student_id': board['student_id'],
+                'student_name': board.get('student_name'),
+                'action': 'auto_exit',
+                'route_num': route_id,
+                'stop': None,
+                'timestamp': closed_at,
+                'boarding_id': board['id']
+            }
+            yield 'update', db.collection('students').document(board['student_id']), {
+                'bus_status': 'outside',
+                'last_bus_action': {
+                    'action': 'auto_exit',
+                    'timestamp': closed_at,
+                    'route': route_id,
+                    'stop': None
+                }
+            }
+            closed += 1
+
+    written = _commit_in_batches(db, operations())
+    print(f"Bus reconciliation for {day}: {event_count} taps, {len(summaries)} trips, "
+          f"{len(dangling)} rides without an exit, {closed} students closed, {written} writes")
+    return summaries
+
+def _state_ref(db):
+    return db.collection(STATE_COLLECTION).document(STATE_DOCUMENT)
+
+def run_reconciliation(db, through=None):
+    """Reconcile every day after the watermark up to and including through (default yesterday)"""
+    if through is None:
+        through = datetime.date.today() - datetime.timedelta(days=1)
+
+    try:
+        state = _state_ref(db).get()
+        watermark = state.to_dict().get('reconciled_through') if state.exists else None
+        if watermark:
+            day = datetime.datetime.strptime(watermark, "%Y-%m-%d").date() + datetime.timedelta(days=1)
+        else:
+            day = through - datetime.timedelta(days=INITIAL_DAYS - 1)
+
+        days = 0
+        while day <= through:
+            reconcile_day(db, day)
+            # Advance after every day so an interrupted run resumes where it stopped
+            _state_ref(db).set({'reconciled_through': day.strftime("%Y-%m-%d"),
+                                'updated_at': datetime.datetime.now()})
+            day += datetime.timedelta(days=1)
+            days += 1
+
+        if not days:
+            print(f"Bus activity already reconciled through {watermark}")
+        return days
+
+    except Exception as e:
+        print(f"Error reconciling bus activity: {e}")
+        import traceback
+        traceback.print_exc()
+        return None
+
+def run_daily(db, run_at="00:30"):
+    """Reconcile the previous day once a day at the given HH:MM time"""
+    hour, minute = [int(part) for part in run_at.split(":")]
+
+    while True:
+        now = datetime.datetime.now()
+        next_run = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if next_run <= now:
+            next_run += datetime.timedelta(days=1)
+
+        print(f"Next bus reconciliation at {next_run.strftime('%Y-%m-%d %H:%M')}")
+        time.sleep((next_run - now).total_seconds())
+        run_reconciliation(db)
+
+def main():
+    parser = argparse.ArgumentParser(description="End-of-day bus trip reconciliation")
+    parser.add_argument("--once", action="store_true", help="catch up to yesterday and exit")
+    parser.add_argument("--at", default="00:30", help="daily run time (HH:MM)")
+    parser.add_argument("--date", help="reconcile one day (YYYY-MM-DD) again without moving the watermark")
+    parser.add_argument("--key", default="serviceAccountKey.json", help="service account key file")
+    args = parser.parse_args()
+
+    db = init_firestore(args.key)
+
+    if args.date:
+        reconcile_day(db, datetime.datetime.strptime(args.date, "%Y-%m-%d").date())
+    elif args.once:
+        run_reconciliation(db)
+    else:
+        run_daily(db, args.at)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import calendar
+import datetime
+import functools
+import json
+import os
+
+# Academic calendar: which weekdays are off, plus dated holidays and make-up working days
+#   {"weekend": [5, 6], "holidays": ["2024-01-26"], "working_days": ["2024-02-10"]}
+# Weekdays are numbered as in datetime.weekday() (0 = Monday). Without the file only weekends are off.
+CALENDAR_FILE = os.environ.get("ACADEMIC_CALENDAR", "holidays.json")
+DEFAULT_WEEKEND = (5, 6)
+
+@functools.lru_cache(maxsize=1)
+def _load_calendar():
+    """(weekend weekdays, holiday dates, extra working dates) from the calendar file"""
+    settings = {}
+    if os.path.exists(CALENDAR_FILE):
+        try:
+            with open(CALENDAR_FILE) as f:
+                settings = json.load(f) or {}
+        except Exception as e:
+            print(f"Error reading {CALENDAR_FILE}: {e}")
+
+    weekend = frozenset(settings.get('weekend', DEFAULT_WEEKEND))
+    holidays = frozenset(_parse_dates(settings.get('holidays', [])))
+    extra_days = frozenset(_parse_dates(settings.get('working_days', [])))
+    return weekend, holidays, extra_days
+
+def _parse_dates(values):
+    dates = []
+    for value in values:
+        try:
+            dates.append(datetime.datetime.strptime(str(value), "%Y-%m-%d").date())
+        except ValueError:
+            print(f"Ignoring invalid date in {CALENDAR_FILE}: {value}")
+    return dates
+
+def reload_calendar():
+    """Forget cached months so the next lookup rereads the calendar file"""
+    _load_calendar.cache_clear()
+    month_mask.cache_clear()
+
+def days_in_month(year, month):
+    return calendar.monthrange(year, month)[1]
+
+@functools.lru_cache(maxsize=256)
+def month_mask(year, month):
+    """Working days of a month as a bitmask: bit 0 is the 1st, bit 1 the 2nd, ..."""
+    weekend, holidays, extra_days = _load_calendar()
+    mask = 0
+    for day in range(1, days_in_month(year, month) + 1):
+        date = datetime.date(year, month, day)
+        if date in extra_days or (date.weekday() not in weekend and date not in holidays):
+            mask |= 1 << (day - 1)
+    return mask
+
+def _popcount(mask):
+    return bin(mask).count("1")
+
+def _until_mask(year, month, today):
+    """Bits for the days of the month that have already started"""
+    if (year, month) < (today.year, today.month):
+        return (1 << days_in_month(year, month)) - 1
+    if (year, month) > (today.year, today.month):
+        return 0
+    return (1 << today.day) - 1
+
+def is_working_day(date):
+    return bool(month_mask(date.year, date.month) >> (date.day - 1) & 1)
+
+def working_days(year, month, today=None):
+    """Working days in the month up to and including today"""
+    today = today or datetime.date.today()
+    return _popcount(month_mask(year, month) & _until_mask(year, month, today))
+
+def dates_mask(date_strs, year, month):
+    """Bitmask of the given 'YYYY-MM-DD' dates that fall in the month"""
+    prefix = f"{year:04d}-{month:02d}-"
+    mask = 0
+    for date_str in date_strs:
+        if date_str and date_str.startswith(prefix):
+            mask |= 1 << (int(date_str[8:10]) - 1)
+    return mask
+
+def attendance_summary(date_strs, year, month, today=None):
+    """(days present, working days, percentage) for one month; only working days count"""
+    today = today or datetime.date.today()
+    working = month_mask(year, month) & _until_mask(year, month, today)
+    total = _popcount(working)
+    present = _popcount(dates_mask(date_strs, year, month) & working)
+    percentage = present * 100.0 / total if total else 0.0
+    return present, total, percentage
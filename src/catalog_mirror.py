@@ -0,0 +1,268 @@
+import argparse
+import atexit
+import datetime
+import json
+import os
+import sqlite3
+import threading
+import time
+from firebase_admin import firestore
+
+# Local copy of the books collection; library screens read from here instead of Firestore
+MIRROR_PATH = os.environ.get("CATALOG_MIRROR", "catalog_mirror.db")
+
+# The whole catalog is re-read this often, which also drops books deleted while no desk was listening
+FULL_SYNC_DAYS = 7
+
+# Books are read in pages of this size during a full sync
+PAGE_SIZE = 500
+
+# How long a read waits for the very first sync of an empty mirror
+FIRST_SYNC_TIMEOUT = 30
+
+# Deltas are requested from a little before the watermark, so writes committed out of order are not missed
+WATERMARK_OVERLAP = datetime.timedelta(minutes=5)
+
+def _encode(value):
+    if isinstance(value, datetime.datetime):
+        return {'__datetime__': value.isoformat()}
+    return str(value)
+
+def _decode(value):
+    if '__datetime__' in value:
+        return datetime.datetime.fromisoformat(value['__datetime__'])
+    return value
+
+def _plain(fields):
+    # Server timestamps are filled in by Firestore; the listener brings the real value
+    return {key: value for key, value in fields.items() if value is not firestore.SERVER_TIMESTAMP}
+
+class CatalogMirror:
+    """SQLite mirror of the books collection, kept current by updated_at deltas and a snapshot listener"""
+
+    def __init__(self, db, path=MIRROR_PATH):
+        self.db = db
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS books (
+                doc_id TEXT PRIMARY KEY,
+                book_id TEXT,
+                category TEXT,
+                title TEXT,
+                data TEXT NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS books_book_id ON books (book_id)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS books_category ON books (category, title)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.conn.commit()
+
+        self.synced = threading.Event()
+        if self._get_meta('full_sync_at'):
+            self.synced.set()
+        self.watch = None
+        self.thread = None
+
+    # Local storage
+
+    def _get_meta(self, key):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key, value):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+            self.conn.commit()
+
+    def _row(self, doc_id, data):
+        return (doc_id, str(data.get('book_id', '')), data.get('category'), str(data.get('title', '')).lower(),
+                json.dumps(data, default=_encode))
+
+    def _upsert(self, docs, replace_all=False):
+        """Store (doc_id, data) pairs; replace_all drops every book not in docs"""
+        with self.lock:
+            if replace_all:
+                self.conn.execute("DELETE FROM books")
+            self.conn.executemany("INSERT OR REPLACE INTO books (doc_id, book_id, category, title, data) "
+                                  "VALUES (?, ?, ?, ?, ?)", [self._row(doc_id, data) for doc_id, data in docs])
+            self.conn.commit()
+
+    def _advance_watermark(self, docs):
+        latest = [data['updated_at'] for _, data in docs if isinstance(data.get('updated_at'), datetime.datetime)]
+        if not latest:
+            return
+        current = self._watermark()
+        newest = max(latest)
+        if current is None or newest > current:
+            self._set_meta('watermark', newest.isoformat())
+
+    def _watermark(self):
+        value = self._get_meta('watermark')
+        return datetime.datetime.fromisoformat(value) if value else None
+
+    # Syncing
+
+    def start(self):
+        """Bring the mirror up to date in the background, then follow changes"""
+        if self.thread is not None:
+            return
+        self.thread = threading.Thread(target=self._sync, name="catalog-mirror", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.watch is not None:
+            try:
+                self.watch.unsubscribe()
+            except Exception as e:
+                print(f"Error stopping catalog listener: {e}")
+            self.watch = None
+
+    def _needs_full_sync(self):
+        last = self._get_meta('full_sync_at')
+        if not last or self._watermark() is None:
+            return True
+        return datetime.datetime.now() - datetime.datetime.fromisoformat(last) > datetime.timedelta(days=FULL_SYNC_DAYS)
+
+    def full_sync(self):
+        """Re-read the whole catalog (paged) and replace the mirror"""
+        started = datetime.datetime.now(datetime.timezone.utc)
+        docs = []
+        query = self.db.collection('books').order_by('__name__')
+        last_doc = None
+        while True:
+            page_query = query.limit(PAGE_SIZE)
+            if last_doc is not None:
+                page_query = page_query.start_after(last_doc)
+            page = list(page_query.stream())
+            docs.extend((doc.id, doc.to_dict()) for doc in page)
+            if len(page) < PAGE_SIZE:
+                break
+            last_doc = page[-1]
+
+        self._upsert(docs, replace_all=True)
+        # Books written without updated_at still need a starting point for deltas
+        self._set_meta('watermark', started.isoformat())
+        self._advance_watermark(docs)
+        self._set_meta('full_sync_at', datetime.datetime.now().isoformat())
+        return len(docs)
+
+    def _sync(self):
+        try:
+            if self._needs_full_sync():
+                count = self.full_sync()
+                print(f"Catalog mirror loaded {count} books")
+        except Exception as e:
+            # Keep serving whatever the mirror already holds; the listener below retries on its own
+            print(f"Error syncing catalog mirror, using local copy: {e}")
+        finally:
+            self.synced.set()
+
+        watermark = self._watermark() or datetime.datetime.now(datetime.timezone.utc)
+        try:
+            # The first snapshot is the delta since the watermark; later ones are live changes
+            self.watch = self.db.collection('books').where(
+                filter=firestore.FieldFilter('updated_at', '>=', watermark - WATERMARK_OVERLAP)
+            ).on_snapshot(self._on_snapshot)
+        except Exception as e:
+            print(f"Error listening to catalog changes: {e}")
+
+    def _on_snapshot(self, docs, changes, read_time):
+        changed = []
+        removed = []
+        for change in changes:
+            if change.type.name == 'REMOVED':
+                removed.append(change.document.id)
+            else:
+                changed.append((change.document.id, change.document.to_dict()))
+        if changed:
+            self._upsert(changed)
+            self._advance_watermark(changed)
+        for doc_id in removed:
+            self.discard(doc_id)
+
+    def _wait_first_sync(self):
+        if not self.synced.is_set():
+            self.start()
+            self.synced.wait(FIRST_SYNC_TIMEOUT)
+
+    # Reads
+
+    def _decode_rows(self, rows):
+        return [(doc_id, json.loads(data, object_hook=_decode)) for doc_id, data in rows]
+
+    def get(self, doc_id):
+        """Book data by document id (with 'id'), or None"""
+        self._wait_first_sync()
+        with self.lock:
+            rows = self.conn.execute("SELECT doc_id, data FROM books WHERE doc_id = ?", (doc_id,)).fetchall()
+        for doc_id, data in self._decode_rows(rows):
+            return {**data, 'id': doc_id}
+        return None
+
+    def get_book(self, book_id):
+        """Book data by its book_id field, falling back to the document id; None if unknown"""
+        self._wait_first_sync()
+        with self.lock:
+            rows = self.conn.execute("SELECT doc_id, data FROM books WHERE book_id = ? LIMIT 1",
+                                     (str(book_id),)).fetchall()
+        for doc_id, data in self._decode_rows(rows):
+            return {**data, 'id': doc_id}
+        return self.get(str(book_id))
+
+    def list_books(self, category=None):
+        """[(doc_id, data)] sorted by title, optionally for one category"""
+        self._wait_first_sync()
+        with self.lock:
+            if category:
+                rows = self.conn.execute("SELECT doc_id, data FROM books WHERE category = ? ORDER BY title",
+                                         (category,)).fetchall()
+            else:
+                rows = self.conn.execute("SELECT doc_id, data FROM books ORDER BY title").fetchall()
+        return self._decode_rows(rows)
+
+    def count(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM books").fetchone()[0]
+
+    # Local writes
+
+    def apply(self, doc_id, fields):
+        """Apply a write made by this desk now instead of waiting for the listener to echo it"""
+        current = self.get(doc_id) or {}
+        current.pop('id', None)
+        self._upsert([(doc_id, {**current, **_plain(fields)})])
+
+    def discard(self, doc_id):
+        with self.lock:
+            self.conn.execute("DELETE FROM books WHERE doc_id = ?", (doc_id,))
+            self.conn.commit()
+
+_mirror = None
+_mirror_lock = threading.Lock()
+
+def get_catalog_mirror(db):
+    """Return the process-wide catalog mirror, starting its sync on first use"""
+    global _mirror
+    with _mirror_lock:
+        if _mirror is None:
+            _mirror = CatalogMirror(db)
+            _mirror.start()
+            atexit.register(_mirror.stop)
+        return _mirror
+
+def main():
+    from utils import init_firestore
+
+    parser = argparse.ArgumentParser(description="Rebuild the local book catalog mirror")
+    parser.add_argument("--key", default="serviceAccountKey.json", help="service account key file")
+    args = parser.parse_args()
+
+    mirror = CatalogMirror(init_firestore(args.key))
+    started = time.time()
+    count = mirror.full_sync()
+    print(f"Mirrored {count} books to {MIRROR_PATH} in {time.time() - started:.1f}s")
+
+if __name__ == "__main__":
+    main()
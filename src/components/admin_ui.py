@@ -4,6 +4,9 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from utils import validate_rfid, authenticate_admin, create_entry_with_label, get_student_by_rfid
+from components.virtual_list import VirtualTreeview
+from components.screen_manager import clear_screen
+from route_cache import get_route_cache
 import csv
 import datetime
 from firebase_admin import firestore
@@ -15,8 +18,7 @@ class AdminUI:
         self.return_callback = return_callback
         
         # Clear the window
-        for widget in self.root.winfo_children():
-            widget.destroy()
+        clear_screen(self.root)
             
         self.root.title("Admin Interface - RFID Student Wallet Application")
         
@@ -72,8 +74,7 @@ class AdminUI:
     def show_admin_menu(self):
         """Show the admin menu after successful authentication"""
         # Clear the window
-        for widget in self.root.winfo_children():
-            widget.destroy()
+        clear_screen(self.root)
             
         admin_frame = ttk.Frame(self.root, padding=20)
         admin_frame.pack(fill=tk.BOTH, expand=True)
@@ -95,6 +96,14 @@ class AdminUI:
                                command=self.export_data)
         export_btn.pack(fill=tk.X, pady=5)
         
+        analytics_btn = ttk.Button(admin_frame, text="Spending Analytics", 
+                                   command=self.show_spending_analytics)
+        analytics_btn.pack(fill=tk.X, pady=5)
+        
+        diagnostics_btn = ttk.Button(admin_frame, text="Firestore Diagnostics", 
+                                     command=self.show_diagnostics)
+        diagnostics_btn.pack(fill=tk.X, pady=5)
+        
         clear_btn = ttk.Button(admin_frame, text="Clear Database", 
                               command=self.confirm_clear_database)
         clear_btn.pack(fill=tk.X, pady=5)
@@ -107,8 +116,7 @@ class AdminUI:
     def manage_students(self):
         """Show the student management interface"""
         # Clear the window
-        for widget in self.root.winfo_children():
-            widget.destroy()
+        clear_screen(self.root)
             
         student_frame = ttk.Frame(self.root, padding=20)
         student_frame.pack(fill=tk.BOTH, expand=True)
@@ -142,8 +150,7 @@ class AdminUI:
     def add_student(self):
         """Show form to add a new student"""
         # Clear the window
-        for widget in self.root.winfo_children():
-            widget.destroy()
+        clear_screen(self.root)
             
         form_frame = ttk.Frame(self.root, padding=20)
         form_frame.pack(fill=tk.BOTH, expand=True)
@@ -219,7 +226,7 @@ class AdminUI:
         import sys
         import os
         sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-        from utils import capture_face, encode_face_to_base64
+        from face import capture_face
         
         # Show a prompt to the user
         messagebox.showinfo("Face Registration - Enhanced Security", 
@@ -317,7 +324,7 @@ class AdminUI:
         import sys
         import os
         sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-        from utils import encode_face_to_base64
+        from face import encode_face_to_base64
         
         # Encode face data if available
         face_encoding_base64 = None
@@ -349,11 +356,8 @@ class AdminUI:
                 messagebox.showerror("Error", "Bus route ID is required for students with bus pass!")
                 return
             
-            # Verify bus route exists by checking route_id field
-            query = self.db.collection('bus_routes').where(filter=firestore.FieldFilter('route_id', '==', route_id)).limit(1)
-            routes = query.get()
-            
-            if not routes or len(routes) == 0:
+            # Verify bus route exists (memory lookup in the shared route cache)
+            if not get_route_cache(self.db).exists(route_id):
                 messagebox.showerror("Error", f"Bus route with ID {route_id} does not exist!")
                 return
                 
@@ -370,8 +374,7 @@ class AdminUI:
     def update_student(self):
         """Show search interface to find a student to update"""
         # Clear the window
-        for widget in self.root.winfo_children():
-            widget.destroy()
+        clear_screen(self.root)
             
         search_frame = ttk.Frame(self.root, padding=20)
         search_frame.pack(fill=tk.BOTH, expand=True)
@@ -422,8 +425,7 @@ class AdminUI:
     def show_update_form(self, student):
         """Show form to update student data"""
         # Clear the window
-        for widget in self.root.winfo_children():
-            widget.destroy()
+        clear_screen(self.root)
             
         update_frame = ttk.Frame(self.root, padding=20)
         update_frame.pack(fill=tk.BOTH, expand=True)
@@ -604,7 +606,7 @@ class AdminUI:
         import sys
         import os
         sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-        from utils import capture_face, encode_face_to_base64
+        from face import capture_face, encode_face_to_base64
         
         # Show a prompt to the user
         messagebox.showinfo("Face Registration Update - Enhanced Security", 
@@ -699,12 +701,7 @@ class AdminUI:
                 
             if has_bus_pass:
                 # Verify bus route exists
-                query = self.db.collection('bus_routes').where(
-                    filter=firestore.FieldFilter('route_id', '==', bus_route)
-                ).limit(1)
-                routes = query.get()
-                
-                if not routes or len(routes) == 0:
+                if not get_route_cache(self.db).exists(bus_route):
                     self.status_var.set(f"Bus route with ID {bus_route} does not exist!")
                     return
             
@@ -749,8 +746,7 @@ class AdminUI:
     def delete_student(self):
         """Show interface to delete a student"""
         # Clear the window
-        for widget in self.root.winfo_children():
-            widget.destroy()
+        clear_screen(self.root)
             
         delete_frame = ttk.Frame(self.root, padding=20)
         delete_frame.pack(fill=tk.BOTH, expand=True)
@@ -812,8 +808,7 @@ class AdminUI:
     def list_students(self):
         """Show a list of all students"""
         # Clear the window
-        for widget in self.root.winfo_children():
-            widget.destroy()
+        clear_screen(self.root)
             
         list_frame = ttk.Frame(self.root, padding=20)
         list_frame.pack(fill=tk.BOTH, expand=True)
@@ -822,47 +817,28 @@ class AdminUI:
         title_label = ttk.Label(list_frame, text="Student List", font=('Arial', 16, 'bold'))
         title_label.pack(pady=(0, 20))
         
-        # Create tree view
-        columns = ('name', 'rfid', 'department', 'year', 'section', 'balance')
-        tree = ttk.Treeview(list_frame, columns=columns, show='headings')
-        
-        # Define headings
-        tree.heading('name', text='Name')
-        tree.heading('rfid', text='RFID')
-        tree.heading('department', text='Department')
-        tree.heading('year', text='Year')
-        tree.heading('section', text='Section')
-        tree.heading('balance', text='Wallet Balance')
-        
-        # Column widths
-        tree.column('name', width=150)
-        tree.column('rfid', width=100)
-        tree.column('department', width=100)
-        tree.column('year', width=50)
-        tree.column('section', width=50)
-        tree.column('balance', width=100)
-        
-        # Add scrollbar
-        scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=tree.yview)
-        tree.configure(yscroll=scrollbar.set)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        tree.pack(fill=tk.BOTH, expand=True)
-        
-        # Fetch and display students
-        try:
-            students_ref = self.db.collection('students').get()
-            for student in students_ref:
-                data = student.to_dict()
-                tree.insert('', tk.END, values=(
-                    data.get('name', 'Unknown'),
-                    data.get('rfid', 'Unknown'),
-                    data.get('department', ''),
-                    data.get('year', ''),
-                    data.get('section', ''),
-                    f"₹ {data.get('wallet_balance', 0):.2f}"
-                ))
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to fetch students: {e}")
+        # Students are paged in as the list scrolls; click a heading to sort
+        status_var = tk.StringVar()
+        columns = [('name', 'Name', 150), ('rfid', 'RFID', 100), ('department', 'Department', 100),
+                   ('year', 'Year', 50), ('section', 'Section', 50), ('balance', 'Wallet Balance', 100)]
+        student_list = VirtualTreeview(
+            list_frame, columns,
+            query_factory=lambda: self.db.collection('students'),
+            row_builder=lambda doc_id, data: (
+                data.get('name', 'Unknown'),
+                data.get('rfid', 'Unknown'),
+                data.get('department', ''),
+                data.get('year', ''),
+                data.get('section', ''),
+                f"₹ {data.get('wallet_balance', 0):.2f}"
+            ),
+            sort_fields={'name': 'name', 'rfid': 'rfid', 'department': 'department', 'balance': 'wallet_balance'},
+            default_sort='name',
+            status_callback=status_var.set
+        )
+        student_list.pack(fill=tk.BOTH, expand=True)
+        
+        ttk.Label(list_frame, textvariable=status_var).pack(pady=(5, 0))
         
         # Back button
         back_btn = ttk.Button(list_frame, text="Back", 
@@ -872,8 +848,7 @@ class AdminUI:
     def manage_bus_routes(self):
         """Show interface to manage bus routes"""
         # Clear the window
-        for widget in self.root.winfo_children():
-            widget.destroy()
+        clear_screen(self.root)
             
         route_frame = ttk.Frame(self.root, padding=20)
         route_frame.pack(fill=tk.BOTH, expand=True)
@@ -899,16 +874,82 @@ class AdminUI:
                              command=self.list_bus_routes)
         list_btn.pack(fill=tk.X, pady=5)
         
+        occupancy_btn = ttk.Button(route_frame, text="Today's Bus Occupancy", 
+                                  command=self.show_bus_occupancy)
+        occupancy_btn.pack(fill=tk.X, pady=5)
+        
         # Back button
         back_btn = ttk.Button(route_frame, text="Back to Admin Menu", 
                              command=self.show_admin_menu)
         back_btn.pack(fill=tk.X, pady=(20, 0))
     
+    def show_bus_occupancy(self):
+        """Show headcounts of today's bus trips"""
+        # Clear the window
+        clear_screen(self.root)
+        
+        occupancy_frame = ttk.Frame(self.root, padding=20)
+        occupancy_frame.pack(fill=tk.BOTH, expand=True)
+        
+        # Title
+        title_label = ttk.Label(occupancy_frame, text="Today's Bus Occupancy", font=('Arial', 16, 'bold'))
+        title_label.pack(pady=(0, 20))
+        
+        columns = ('route', 'run', 'headcount', 'boardings', 'exits', 'riders')
+        tree = ttk.Treeview(occupancy_frame, columns=columns, show='headings', height=15)
+        tree.heading('route', text='Route')
+        tree.heading('run', text='Run')
+        tree.heading('headcount', text='On Board')
+        tree.heading('boardings', text='Boarded')
+        tree.heading('exits', text='Exited')
+        tree.heading('riders', text='Students On Board')
+        tree.column('route', width=80)
+        tree.column('run', width=60)
+        tree.column('headcount', width=80)
+        tree.column('boardings', width=80)
+        tree.column('exits', width=80)
+        tree.column('riders', width=400)
+        tree.pack(fill=tk.BOTH, expand=True)
+        
+        status_var = tk.StringVar()
+        ttk.Label(occupancy_frame, textvariable=status_var).pack(pady=5)
+        
+        try:
+            # One manifest document per route and run
+            today = datetime.date.today().strftime("%Y-%m-%d")
+            trips = self.db.collection('bus_trips').where(
+                filter=firestore.FieldFilter('date', '==', today)
+            ).stream()
+            
+            rows = []
+            for trip in trips:
+                data = trip.to_dict()
+                names = sorted(str(rider.get('name', 'Unknown')) for rider in data.get('riders', {}).values())
+                rows.append((
+                    data.get('route_id', ''),
+                    data.get('run', '').upper(),
+                    data.get('headcount', 0),
+                    data.get('boardings', 0),
+                    data.get('exits', 0),
+                    ', '.join(names)
+                ))
+            
+            rows.sort(key=lambda row: (str(row[0]), row[1]))
+            for row in rows:
+                tree.insert('', tk.END, values=row)
+            status_var.set(f"{len(rows)} trips today, {sum(row[2] for row in rows)} students on board")
+        except Exception as e:
+            status_var.set(f"Error loading bus occupancy: {e}")
+        
+        # Back button
+        back_btn = ttk.Button(occupancy_frame, text="Back", 
+                             command=self.manage_bus_routes)
+        back_btn.pack(pady=(10, 0))
+    
     def add_bus_route(self):
         """Show form to add a new bus route"""
         # Clear the window
-        for widget in self.root.winfo_children():
-            widget.destroy()
+        clear_screen(self.root)
             
         add_route_frame = ttk.Frame(self.root, padding=20)
         add_route_frame.pack(fill=tk.BOTH, expand=True)
@@ -986,8 +1027,7 @@ class AdminUI:
             return
         
         # Check if route ID already exists
-        existing_routes = self.db.collection('bus_routes').where(filter=firestore.FieldFilter('route_id', '==', route_id)).limit(1).get()
-        if len(list(existing_routes)) > 0:
+        if get_route_cache(self.db).exists(route_id):
             self.status_var.set(f"Route ID '{route_id}' already exists. Please use a different ID.")
             return
         
@@ -1001,7 +1041,8 @@ class AdminUI:
             }
             
             # Add to Firestore
-            self.db.collection('bus_routes').add(route_data)
+            route_ref = self.db.collection('bus_routes').add(route_data)[1]
+            get_route_cache(self.db).put(route_ref.id, {'route_id': route_id, 'name': name, 'stops': stops})
             
             # Show success message
             messagebox.showinfo("Success", f"Bus route '{name}' added successfully!")
@@ -1013,8 +1054,7 @@ class AdminUI:
     def update_bus_route(self):
         """Show interface to update a bus route"""
         # Clear the window
-        for widget in self.root.winfo_children():
-            widget.destroy()
+        clear_screen(self.root)
             
         update_frame = ttk.Frame(self.root, padding=20)
         update_frame.pack(fill=tk.BOTH, expand=True)
@@ -1034,17 +1074,15 @@ class AdminUI:
         # Get all routes for dropdown
         self.routes_data = {}
         try:
-            routes = self.db.collection('bus_routes').get()
             route_ids = ["-- Select Route --"]
             
-            for route in routes:
-                route_data = route.to_dict()
+            for route_data in get_route_cache(self.db).all():
                 route_id = route_data.get('route_id')
                 if route_id:
                     route_ids.append(route_id)
                     # Store route data with document ID for later use
                     self.routes_data[route_id] = {
-                        'doc_id': route.id,
+                        'doc_id': route_data['doc_id'],
                         'data': route_data
                     }
         except Exception as e:
@@ -1170,6 +1208,7 @@ class AdminUI:
             }
             
             self.db.collection('bus_routes').document(doc_id).update(route_data)
+            get_route_cache(self.db).put(doc_id, {'name': name, 'stops': stops})
             
             # Show success message
             messagebox.showinfo("Success", f"Bus route '{name}' updated successfully!")
@@ -1197,6 +1236,7 @@ class AdminUI:
         try:
             # Delete the route
             self.db.collection('bus_routes').document(doc_id).delete()
+            get_route_cache(self.db).discard(doc_id)
             
             # Show success message
             messagebox.showinfo("Success", f"Bus route '{name}' deleted successfully!")
@@ -1213,8 +1253,7 @@ class AdminUI:
     def list_bus_routes(self):
         """Show a list of all bus routes"""
         # Clear the window
-        for widget in self.root.winfo_children():
-            widget.destroy()
+        clear_screen(self.root)
             
         list_frame = ttk.Frame(self.root, padding=20)
         list_frame.pack(fill=tk.BOTH, expand=True)
@@ -1227,30 +1266,27 @@ class AdminUI:
         routes_frame = ttk.Frame(list_frame)
         routes_frame.pack(fill=tk.BOTH, expand=True)
         
-        # Create treeview for routes
-        columns = ('route_id', 'name', 'stops')
-        self.routes_tree = ttk.Treeview(routes_frame, columns=columns, show='headings', height=10)
-        
-        # Define headings
-        self.routes_tree.heading('route_id', text='Route ID')
-        self.routes_tree.heading('name', text='Route Name')
-        self.routes_tree.heading('stops', text='Stops')
-        
-        # Define columns
-        self.routes_tree.column('route_id', width=100)
-        self.routes_tree.column('name', width=150)
-        self.routes_tree.column('stops', width=400)
-        
-        # Add scrollbar
-        scrollbar = ttk.Scrollbar(routes_frame, orient=tk.VERTICAL, command=self.routes_tree.yview)
-        self.routes_tree.configure(yscroll=scrollbar.set)
-        
-        # Pack treeview and scrollbar
-        self.routes_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        # Status message
+        self.status_var = tk.StringVar()
         
-        # Load routes data
-        self.load_bus_routes()
+        # Routes come from the shared route cache
+        columns = [('route_id', 'Route ID', 100), ('name', 'Route Name', 150), ('stops', 'Stops', 400)]
+        route_cache = get_route_cache(self.db)
+        self.routes_list = VirtualTreeview(
+            routes_frame, columns,
+            query_factory=None,
+            rows_factory=lambda: [(route['doc_id'], route) for route in route_cache.all()],
+            row_builder=lambda doc_id, data: (
+                data.get('route_id', ''),
+                data.get('name', ''),
+                ', '.join(data.get('stops', []))
+            ),
+            sort_fields={'route_id': 'route_id', 'name': 'name'},
+            default_sort='route_id',
+            height=10,
+            status_callback=self.status_var.set
+        )
+        self.routes_list.pack(fill=tk.BOTH, expand=True)
         
         # Export button
         export_btn = ttk.Button(list_frame, text="Export to CSV", 
@@ -1262,36 +1298,12 @@ class AdminUI:
                              command=self.manage_bus_routes)
         back_btn.pack(side=tk.RIGHT, pady=10)
         
-        # Status message
-        self.status_var = tk.StringVar()
         status_label = ttk.Label(list_frame, textvariable=self.status_var)
         status_label.pack(pady=5)
     
     def load_bus_routes(self):
-        """Load bus routes into the treeview"""
-        try:
-            # Clear existing data
-            for item in self.routes_tree.get_children():
-                self.routes_tree.delete(item)
-                
-            # Fetch bus routes
-            routes = self.db.collection('bus_routes').get()
-            
-            count = 0
-            for route in routes:
-                route_data = route.to_dict()
-                route_id = route_data.get('route_id', '')
-                name = route_data.get('name', '')
-                stops = ', '.join(route_data.get('stops', []))
-                
-                # Insert into treeview
-                self.routes_tree.insert('', tk.END, values=(route_id, name, stops))
-                count += 1
-                
-            self.status_var.set(f"Loaded {count} bus routes.")
-            
-        except Exception as e:
-            self.status_var.set(f"Error loading bus routes: {e}")
+        """Reload the bus routes list from the first page"""
+        self.routes_list.reload()
     
     def export_routes_csv(self):
         """Export bus routes to CSV file"""
@@ -1303,8 +1315,8 @@ class AdminUI:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             filename = f"bus_routes_{timestamp}.csv"
             
-            # Fetch routes data
-            routes = self.db.collection('bus_routes').get()
+            # Routes from the shared route cache
+            routes = get_route_cache(self.db).all()
             
             # Write to CSV
             with open(filename, 'w', newline='') as csvfile:
@@ -1314,8 +1326,7 @@ class AdminUI:
                 writer.writerow(['Route ID', 'Route Name', 'Stops'])
                 
                 # Write data
-                for route in routes:
-                    route_data = route.to_dict()
+                for route_data in routes:
                     route_id = route_data.get('route_id', '')
                     name = route_data.get('name', '')
                     stops = ', '.join(route_data.get('stops', []))
@@ -1330,8 +1341,7 @@ class AdminUI:
     def export_data(self):
         """Show interface to export data"""
         # Clear the window
-        for widget in self.root.winfo_children():
-            widget.destroy()
+        clear_screen(self.root)
             
         export_frame = ttk.Frame(self.root, padding=20)
         export_frame.pack(fill=tk.BOTH, expand=True)
@@ -1449,6 +1459,206 @@ class AdminUI:
         except Exception as e:
             messagebox.showerror("Export Error", f"Failed to export data: {e}")
     
+    def show_spending_analytics(self):
+        """Show campus-wide spending reports"""
+        try:
+            import analytics
+        except ImportError as e:
+            messagebox.showerror("Analytics Unavailable", f"Spending analytics needs NumPy: {e}")
+            return
+        
+        # Clear the window
+        clear_screen(self.root)
+            
+        analytics_frame = ttk.Frame(self.root, padding=20)
+        analytics_frame.pack(fill=tk.BOTH, expand=True)
+        
+        # Title
+        title_label = ttk.Label(analytics_frame, text="Spending Analytics", font=('Arial', 16, 'bold'))
+        title_label.pack(pady=(0, 10))
+        
+        # Period selection
+        controls_frame = ttk.Frame(analytics_frame)
+        controls_frame.pack(fill=tk.X, pady=(0, 10))
+        
+        ttk.Label(controls_frame, text="Period:").pack(side=tk.LEFT, padx=5)
+        periods = {'Last 7 days': 7, 'Last 30 days': 30, 'Last 90 days': 90, 'All time': None}
+        period_var = tk.StringVar(value='Last 30 days')
+        period_combo = ttk.Combobox(controls_frame, textvariable=period_var, values=list(periods),
+                                    state='readonly', width=15)
+        period_combo.pack(side=tk.LEFT, padx=5)
+        
+        status_label = ttk.Label(controls_frame, text="")
+        status_label.pack(side=tk.RIGHT, padx=5)
+        
+        # One tab per report
+        notebook = ttk.Notebook(analytics_frame)
+        notebook.pack(fill=tk.BOTH, expand=True)
+        
+        def make_tree(title, columns):
+            tab = ttk.Frame(notebook)
+            notebook.add(tab, text=title)
+            tree = ttk.Treeview(tab, columns=[c[0] for c in columns], show='headings')
+            for column, heading, width in columns:
+                tree.heading(column, text=heading)
+                tree.column(column, width=width)
+            scrollbar = ttk.Scrollbar(tab, orient=tk.VERTICAL, command=tree.yview)
+            tree.configure(yscroll=scrollbar.set)
+            scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+            tree.pack(fill=tk.BOTH, expand=True)
+            return tree
+        
+        location_tree = make_tree("By Location", [('location', 'Location', 200), ('total', 'Total Spent', 150),
+                                                  ('count', 'Purchases', 100), ('avg', 'Average', 100)])
+        hours_tree = make_tree("Peak Hours", [('hour', 'Hour', 80), ('count', 'Purchases', 100),
+                                              ('total', 'Total Spent', 150), ('busiest', 'Busiest Day', 100)])
+        percentile_tree = make_tree("Percentiles", [('pct', 'Percentile', 100), ('purchase', 'Purchase', 150),
+                                                    ('student', 'Student Total', 150)])
+        cohort_tree = make_tree("Low Balance", [('department', 'Department', 200)])
+        
+        store = analytics.TransactionStore()
+        
+        def show_reports():
+            days = periods[period_var.get()]
+            start = datetime.datetime.now() - datetime.timedelta(days=days) if days else None
+            
+            location_tree.delete(*location_tree.get_children())
+            for location, total, count in analytics.spend_by_location(store, start):
+                location_tree.insert('', tk.END, values=(location, f"₹ {total:,.2f}", count, f"₹ {total / count:,.2f}"))
+            
+            hours_tree.delete(*hours_tree.get_children())
+            hours = analytics.peak_hours(store, start)
+            for hour in range(24):
+                if hours['count'][hour]:
+                    busiest = analytics.WEEKDAYS[int(hours['weekday_hour'][:, hour].argmax())]
+                    hours_tree.insert('', tk.END, values=(f"{hour:02d}:00", int(hours['count'][hour]),
+                                                          f"₹ {hours['spend'][hour]:,.2f}", busiest))
+            
+            percentile_tree.delete(*percentile_tree.get_children())
+            report = analytics.spend_percentiles(store, start)
+            for pct, value in report['transaction'].items():
+                percentile_tree.insert('', tk.END, values=(f"p{pct}", f"₹ {value:,.2f}",
+                                                           f"₹ {report['student'].get(pct, 0):,.2f}"))
+            
+            status_label.config(text=f"{report['transactions']} purchases by {report['students']} students, "
+                                     f"₹ {report['total']:,.2f}")
+        
+        def show_cohorts():
+            cohorts = analytics.low_balance_cohorts(self.db)
+            columns = ['department'] + [f"band{i}" for i in range(len(cohorts['labels']))]
+            cohort_tree.configure(columns=columns)
+            cohort_tree.heading('department', text='Department')
+            for i, label in enumerate(cohorts['labels']):
+                cohort_tree.heading(f"band{i}", text=label)
+                cohort_tree.column(f"band{i}", width=90)
+            cohort_tree.delete(*cohort_tree.get_children())
+            cohort_tree.insert('', tk.END, values=['All'] + [int(c) for c in cohorts['overall']])
+            for department, row in zip(cohorts['departments'], cohorts['by_department']):
+                cohort_tree.insert('', tk.END, values=[department] + [int(c) for c in row])
+        
+        def refresh():
+            try:
+                status_label.config(text="Loading new transactions...")
+                self.root.update_idletasks()
+                added = store.refresh(self.db)
+                show_reports()
+                show_cohorts()
+                print(f"Analytics refresh added {added} transactions ({len(store)} cached)")
+            except Exception as e:
+                messagebox.showerror("Error", f"Failed to refresh analytics: {e}")
+        
+        period_combo.bind('<<ComboboxSelected>>', lambda event: show_reports())
+        
+        # Buttons
+        button_frame = ttk.Frame(analytics_frame)
+        button_frame.pack(fill=tk.X, pady=(10, 0))
+        ttk.Button(button_frame, text="Refresh", command=refresh).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Back to Admin Menu", command=self.show_admin_menu).pack(side=tk.RIGHT, padx=5)
+        
+        refresh()
+    
+    def show_diagnostics(self):
+        """Show Firestore reads, writes and latency per screen"""
+        from instrumentation import get_metrics
+        
+        # Clear the window
+        clear_screen(self.root)
+            
+        diag_frame = ttk.Frame(self.root, padding=20)
+        diag_frame.pack(fill=tk.BOTH, expand=True)
+        
+        # Title
+        title_label = ttk.Label(diag_frame, text="Firestore Diagnostics", font=('Arial', 16, 'bold'))
+        title_label.pack(pady=(0, 10))
+        
+        summary_label = ttk.Label(diag_frame, text="")
+        summary_label.pack(pady=(0, 10))
+        
+        # Create tree view
+        columns = ('caller', 'collection', 'op', 'calls', 'docs', 'kb', 'avg_ms', 'max_ms')
+        tree = ttk.Treeview(diag_frame, columns=columns, show='headings')
+        
+        headings = {'caller': 'Called From', 'collection': 'Collection', 'op': 'Operation', 'calls': 'Calls',
+                    'docs': 'Documents', 'kb': 'KB', 'avg_ms': 'Avg ms', 'max_ms': 'Max ms'}
+        widths = {'caller': 220, 'collection': 120, 'op': 70}
+        for column in columns:
+            tree.heading(column, text=headings[column])
+            tree.column(column, width=widths.get(column, 70))
+        
+        # Add scrollbar
+        scrollbar = ttk.Scrollbar(diag_frame, orient=tk.VERTICAL, command=tree.yview)
+        tree.configure(yscroll=scrollbar.set)
+        
+        def refresh():
+            tree.delete(*tree.get_children())
+            metrics = get_metrics()
+            rows = metrics.snapshot()
+            for row in rows:
+                tree.insert('', tk.END, values=(
+                    row['caller'],
+                    row['collection'],
+                    row['op'],
+                    row['calls'],
+                    row['docs'],
+                    f"{row['bytes'] / 1024:.1f}",
+                    f"{row['seconds'] / row['calls'] * 1000:.1f}",
+                    f"{row['max_seconds'] * 1000:.1f}"
+                ))
+            reads = sum(row['docs'] for row in rows if row['op'] in ('get', 'query', 'stream', 'get_all'))
+            writes = sum(row['docs'] for row in rows if row['op'] not in ('get', 'query', 'stream', 'get_all'))
+            summary_label.config(text=f"Since {metrics.started_at.strftime('%Y-%m-%d %H:%M:%S')}: "
+                                      f"{reads} documents read, {writes} written")
+        
+        def reset():
+            get_metrics().reset()
+            refresh()
+        
+        def save_json():
+            filename = filedialog.asksaveasfilename(
+                defaultextension=".json",
+                filetypes=[("JSON files", "*.json"), ("All files", "*.*")]
+            )
+            if filename:
+                try:
+                    get_metrics().dump(filename)
+                    messagebox.showinfo("Saved", f"Diagnostics saved to {filename}")
+                except Exception as e:
+                    messagebox.showerror("Error", f"Failed to save diagnostics: {e}")
+        
+        # Buttons
+        button_frame = ttk.Frame(diag_frame)
+        button_frame.pack(side=tk.BOTTOM, fill=tk.X, pady=(10, 0))
+        
+        ttk.Button(button_frame, text="Refresh", command=refresh).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Reset Counters", command=reset).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Save as JSON", command=save_json).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Back to Admin Menu", command=self.show_admin_menu).pack(side=tk.RIGHT, padx=5)
+        
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        tree.pack(fill=tk.BOTH, expand=True)
+        
+        refresh()
+    
     def confirm_clear_database(self):
         """Confirm database clearing"""
         confirm = messagebox.askyesno("Confirm Clear Database", 
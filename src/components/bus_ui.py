@@ -3,8 +3,11 @@ from tkinter import ttk, messagebox
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from utils import validate_rfid, get_student_by_rfid, send_email
-import datetime
+from utils import validate_rfid, get_student_by_rfid
+from stations import BusStation, StationError
+from route_cache import get_route_cache
+from components.virtual_list import VirtualTreeview
+from components.screen_manager import clear_screen
 from google.cloud import firestore
 
 class BusUI:
@@ -14,8 +17,7 @@ class BusUI:
         self.return_callback = return_callback
         
         # Clear the window
-        for widget in self.root.winfo_children():
-            widget.destroy()
+        clear_screen(self.root)
             
         self.root.title("Bus Interface - RFID Student Wallet Application")
         
@@ -25,8 +27,7 @@ class BusUI:
     def show_bus_route_selection(self):
         """Show interface to select bus route"""
         # Clear the window
-        for widget in self.root.winfo_children():
-            widget.destroy()
+        clear_screen(self.root)
             
         selection_frame = ttk.Frame(self.root, padding=20)
         selection_frame.pack(fill=tk.BOTH, expand=True)
@@ -69,36 +70,23 @@ class BusUI:
     def load_bus_routes(self):
         """Load and display available bus routes"""
         try:
-            # Create treeview for bus routes
-            columns = ('route_id', 'name', 'stops')
-            routes_tree = ttk.Treeview(self.routes_frame, columns=columns, show='headings')
-            
-            # Define headings
-            routes_tree.heading('route_id', text='Route ID')
-            routes_tree.heading('name', text='Route Name')
-            routes_tree.heading('stops', text='Stops')
-            
-            # Column widths
-            routes_tree.column('route_id', width=100)
-            routes_tree.column('name', width=150) 
-            routes_tree.column('stops', width=350)
-            
-            # Add scrollbar
-            scrollbar = ttk.Scrollbar(self.routes_frame, orient=tk.VERTICAL, command=routes_tree.yview)
-            routes_tree.configure(yscroll=scrollbar.set)
-            scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-            routes_tree.pack(fill=tk.BOTH, expand=True)
-            
-            # Fetch routes from database
-            routes_ref = self.db.collection('bus_routes').get()
-            
-            for route in routes_ref:
-                route_data = route.to_dict()
-                route_id = route_data.get('route_id', 'Unknown')
-                name = route_data.get('name', 'Unknown')
-                stops = ', '.join(route_data.get('stops', []))
-                
-                routes_tree.insert('', tk.END, values=(route_id, name, stops))
+            # Routes come from the shared route cache, sorted by route ID
+            columns = [('route_id', 'Route ID', 100), ('name', 'Route Name', 150), ('stops', 'Stops', 350)]
+            route_cache = get_route_cache(self.db)
+            self.routes_list = VirtualTreeview(
+                self.routes_frame, columns,
+                query_factory=None,
+                rows_factory=lambda: [(route['doc_id'], route) for route in route_cache.all()],
+                row_builder=lambda doc_id, route: (
+                    route.get('route_id', 'Unknown'),
+                    route.get('name', 'Unknown'),
+                    ', '.join(route.get('stops', []))
+                ),
+                sort_fields={'route_id': 'route_id', 'name': 'name'},
+                default_sort='route_id',
+                height=10
+            )
+            self.routes_list.pack(fill=tk.BOTH, expand=True)
                 
         except Exception as e:
             error_label = ttk.Label(self.routes_frame, text=f"Error loading bus routes: {e}", foreground="red")
@@ -113,32 +101,21 @@ class BusUI:
             return
         
         try:
-            # Check if route exists by querying for route_id field
-            routes_ref = self.db.collection('bus_routes')
-            query = routes_ref.where(filter=firestore.FieldFilter('route_id', '==', route_id)).limit(1)
-            routes = query.get()
-            
-            if not routes or len(routes) == 0:
-                messagebox.showerror("Invalid Route", f"Bus route with ID {route_id} does not exist.")
-                return
-            
             # Store route data and proceed to boarding interface
-            route_doc = routes[0]
-            self.route_data = route_doc.to_dict()
-            
-            # Make sure route_id is accessible
-            self.route_data['route_id'] = route_id
+            self.route_data = BusStation.find_route(self.db, route_id)
+            self.station = BusStation(self.db, self.route_data)
             
             self.show_boarding_ui()
             
+        except StationError as e:
+            messagebox.showerror(e.title, e.message)
         except Exception as e:
             messagebox.showerror("Error", f"Failed to process route selection: {e}")
     
     def show_boarding_ui(self):
         """Show interface for student boarding/offboarding"""
         # Clear the window
-        for widget in self.root.winfo_children():
-            widget.destroy()
+        clear_screen(self.root)
             
         boarding_frame = ttk.Frame(self.root, padding=20)
         boarding_frame.pack(fill=tk.BOTH, expand=True)
@@ -151,7 +128,20 @@ class BusUI:
         # Display stops
         stops_text = "Stops: " + ', '.join(self.route_data.get('stops', []))
         stops_label = ttk.Label(boarding_frame, text=stops_text)
-        stops_label.pack(pady=(0, 20))
+        stops_label.pack(pady=(0, 10))
+        
+        # Headcount for the current run, from the trip manifest
+        occupancy_frame = ttk.Frame(boarding_frame)
+        occupancy_frame.pack(pady=(0, 10))
+        
+        self.headcount_var = tk.StringVar()
+        headcount_label = ttk.Label(occupancy_frame, textvariable=self.headcount_var, font=('Arial', 12, 'bold'))
+        headcount_label.pack(side=tk.LEFT, padx=5)
+        
+        manifest_btn = ttk.Button(occupancy_frame, text="Show Manifest", 
+                                 command=self.show_manifest)
+        manifest_btn.pack(side=tk.LEFT, padx=5)
+        self.load_headcount()
         
         # RFID input
         rfid_frame = ttk.Frame(boarding_frame)
@@ -212,6 +202,63 @@ class BusUI:
                              command=self.show_bus_route_selection)
         back_btn.pack(pady=(10, 0))
     
+    def show_headcount(self, result):
+        """Show the headcount from a tap result, if the tap changed the current run"""
+        if result.get('trip_id') == self.station.trip_ref().id:
+            self.headcount_var.set(f"On board: {result['headcount']}")
+        else:
+            # An exit from an earlier run; the current run's count is read again
+            self.load_headcount()
+    
+    def load_headcount(self):
+        """Show how many students are on the bus for the current run"""
+        try:
+            manifest = self.station.manifest()
+            self.headcount_var.set(f"On board: {manifest['headcount']}")
+        except Exception as e:
+            print(f"Error loading headcount: {e}")
+            self.headcount_var.set("On board: unknown")
+    
+    def show_manifest(self):
+        """List the students currently on the bus"""
+        try:
+            manifest = self.station.manifest()
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to load manifest: {e}")
+            return
+        
+        self.headcount_var.set(f"On board: {manifest['headcount']}")
+        
+        window = tk.Toplevel(self.root)
+        window.title(f"Manifest - Route {self.route_data['route_id']}")
+        
+        summary = f"On board: {manifest['headcount']} | Boarded: {manifest['boardings']} | Exited: {manifest['exits']}"
+        ttk.Label(window, text=summary).pack(padx=10, pady=(10, 0))
+        
+        columns = ('name', 'rfid', 'stop', 'boarded')
+        tree = ttk.Treeview(window, columns=columns, show='headings', height=15)
+        tree.heading('name', text='Student Name')
+        tree.heading('rfid', text='RFID')
+        tree.heading('stop', text='Boarded At')
+        tree.heading('boarded', text='Time')
+        tree.column('name', width=180)
+        tree.column('rfid', width=100)
+        tree.column('stop', width=150)
+        tree.column('boarded', width=80)
+        tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        
+        riders = sorted(manifest['riders'].items(), key=lambda item: str(item[1].get('name', '')).lower())
+        for student_id, rider in riders:
+            boarded_at = rider.get('boarded_at')
+            tree.insert('', tk.END, iid=student_id, values=(
+                rider.get('name', 'Unknown'),
+                rider.get('rfid', 'Unknown'),
+                rider.get('stop', 'Unknown'),
+                boarded_at.strftime("%H:%M:%S") if boarded_at else "Unknown"
+            ))
+        
+        ttk.Button(window, text="Close", command=window.destroy).pack(pady=(0, 10))
+    
     def load_recent_activity(self):
         """Load recent bus activity for this route"""
         try:
@@ -219,34 +266,36 @@ class BusUI:
             for item in self.log_tree.get_children():
                 self.log_tree.delete(item)
             
-            # Fetch recent activity
+            # Newest 20 for this route (uses the route_num/timestamp composite index)
             activity_ref = self.db.collection('bus_activity')
             query = activity_ref.where(
                 filter=firestore.FieldFilter('route_num', '==', self.route_data['route_id'])
-            )
-            
-            # Get results first, then sort them in memory (to avoid composite index requirement)
-            results = list(query.get())
-            # Sort results by timestamp (newest first)
-            results.sort(key=lambda doc: doc.to_dict().get('timestamp') if doc.to_dict().get('timestamp') else datetime.datetime.min, reverse=True)
-            # Limit to 20 results after sorting
-            results = results[:20]
+            ).order_by('timestamp', direction=firestore.Query.DESCENDING).limit(20)
             
-            for doc in results:
-                data = doc.to_dict()
-                time_str = data.get('timestamp').strftime("%H:%M:%S") if data.get('timestamp') else "Unknown"
-                
-                self.log_tree.insert('', tk.END, values=(
-                    time_str,
-                    data.get('student_name', 'Unknown'),
-                    data.get('student_rfid', 'Unknown'),
-                    data.get('action', 'Unknown'),
-                    data.get('stop', 'Unknown')
-                ))
+            for doc in query.stream():
+                self.show_activity_row(doc.id, doc.to_dict())
                 
         except Exception as e:
             print(f"Error loading recent activity: {e}")
     
+    def show_activity_row(self, activity_id, data, newest=False):
+        """Add one activity to the log; new taps go on top and the list stays at 20 rows"""
+        time_str = data.get('timestamp').strftime("%H:%M:%S") if data.get('timestamp') else "Unknown"
+        values = (
+            time_str,
+            data.get('student_name', 'Unknown'),
+            data.get('student_rfid', 'Unknown'),
+            data.get('action', 'Unknown'),
+            data.get('stop', 'Unknown')
+        )
+        if self.log_tree.exists(activity_id):
+            self.log_tree.item(activity_id, values=values)
+            return
+        
+        self.log_tree.insert('', 0 if newest else tk.END, iid=activity_id, values=values)
+        for item in self.log_tree.get_children()[20:]:
+            self.log_tree.delete(item)
+    
     def process_student_rfid(self):
         """Process student RFID for bus boarding/offboarding"""
         rfid = self.board_rfid_entry.get().strip()
@@ -267,20 +316,11 @@ class BusUI:
             error_label.pack(anchor=tk.W, pady=5)
             return
         
-        # Check if student has bus pass
-        if not student.get('has_bus_pass', False):
-            error_label = ttk.Label(self.student_info_frame, 
-                                  text=f"Student {student.get('name')} does not have a bus pass.", 
-                                  foreground="red")
-            error_label.pack(anchor=tk.W, pady=5)
-            return
-        
-        # Check if student is assigned to this route
-        student_route = student.get('bus_route')
-        if student_route != self.route_data['route_id']:
-            error_label = ttk.Label(self.student_info_frame, 
-                                  text=f"Student {student.get('name')} is assigned to route {student_route}, not route {self.route_data['route_id']}.", 
-                                  foreground="red")
+        # Check the student has a bus pass for this route
+        try:
+            self.station.check_rider(student)
+        except StationError as e:
+            error_label = ttk.Label(self.student_info_frame, text=e.message, foreground="red")
             error_label.pack(anchor=tk.W, pady=5)
             return
         
@@ -348,55 +388,14 @@ class BusUI:
                 return
         
         try:
-            # Update student status
-            now = datetime.datetime.now()
-            
-            self.db.collection('students').document(student['id']).update({
-                'bus_status': 'inside',
-                'last_bus_action': {
-                    'action': 'board',
-                    'timestamp': now,
-                    'route': self.route_data['route_id'],
-                    'stop': selected_stop
-                }
-            })
-            
-            # Record bus activity
-            activity_data = {
-                'student_id': student['id'],
-                'student_name': student.get('name'),
-                'student_rfid': student.get('rfid'),
-                'action': 'board',
-                'route_num': self.route_data['route_id'],
-                'stop': selected_stop,
-                'timestamp': now,
-                'email_sent': False
-            }
-            
-            activity_ref = self.db.collection('bus_activity').add(activity_data)
-            
-            # Send email notification
-            parent_email = student.get('parent_email')
-            if parent_email:
-                subject = "Bus Boarding Notification"
-                message = f"""
-                Dear Parent/Guardian,
-                
-                This is to inform you that {student.get('name')} has boarded the bus (Route {self.route_data['route_id']}) at {selected_stop} at {now.strftime('%H:%M:%S')}.
-                
-                This is an automated message from the Student RFID System.
-                """
-                
-                email_sent = send_email(parent_email, subject, message)
-                
-                # Just skip updating the email_sent status to avoid errors
-                # The main functionality (boarding) has already been completed
+            result = self.station.board(student, selected_stop)
+            self.show_headcount(result)
             
             # Show success message
             messagebox.showinfo("Success", f"Student {student.get('name')} successfully boarded the bus at {selected_stop}.")
             
-            # Update activity log
-            self.load_recent_activity()
+            # Show the new activity from the write result instead of re-reading the log
+            self.show_activity_row(result['id'], result, newest=True)
             
             # Clear RFID entry for next student
             self.board_rfid_entry.delete(0, tk.END)
@@ -406,6 +405,8 @@ class BusUI:
             for widget in self.student_info_frame.winfo_children():
                 widget.destroy()
                 
+        except StationError as e:
+            messagebox.showerror(e.title, e.message)
         except Exception as e:
             messagebox.showerror("Error", f"Failed to process boarding: {e}")
     
@@ -426,55 +427,14 @@ class BusUI:
                 return
         
         try:
-            # Update student status
-            now = datetime.datetime.now()
-            
-            self.db.collection('students').document(student['id']).update({
-                'bus_status': 'outside',
-                'last_bus_action': {
-                    'action': 'exit',
-                    'timestamp': now,
-                    'route': self.route_data['route_id'],
-                    'stop': selected_stop
-                }
-            })
-            
-            # Record bus activity
-            activity_data = {
-                'student_id': student['id'],
-                'student_name': student.get('name'),
-                'student_rfid': student.get('rfid'),
-                'action': 'exit',
-                'route_num': self.route_data['route_id'],
-                'stop': selected_stop,
-                'timestamp': now,
-                'email_sent': False
-            }
-            
-            activity_ref = self.db.collection('bus_activity').add(activity_data)
-            
-            # Send email notification
-            parent_email = student.get('parent_email')
-            if parent_email:
-                subject = "Bus Offboarding Notification"
-                message = f"""
-                Dear Parent/Guardian,
-                
-                This is to inform you that {student.get('name')} has exited the bus (Route {self.route_data['route_id']}) at {selected_stop} at {now.strftime('%H:%M:%S')}.
-                
-                This is an automated message from the Student RFID System.
-                """
-                
-                email_sent = send_email(parent_email, subject, message)
-                
-                # Just skip updating the email_sent status to avoid errors
-                # The main functionality (offboarding) has already been completed
+            result = self.station.offboard(student, selected_stop)
+            self.show_headcount(result)
             
             # Show success message
             messagebox.showinfo("Success", f"Student {student.get('name')} successfully exited the bus at {selected_stop}.")
             
-            # Update activity log
-            self.load_recent_activity()
+            # Show the new activity from the write result instead of re-reading the log
+            self.show_activity_row(result['id'], result, newest=True)
             
             # Clear RFID entry for next student
             self.board_rfid_entry.delete(0, tk.END)
@@ -484,5 +444,7 @@ class BusUI:
             for widget in self.student_info_frame.winfo_children():
                 widget.destroy()
                 
+        except StationError as e:
+            messagebox.showerror(e.title, e.message)
         except Exception as e:
             messagebox.showerror("Error", f"Failed to process offboarding: {e}") 
\ No newline at end of file
@@ -8,37 +8,36 @@ from firebase_admin import firestore
 # Add parent directory to path for imports
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from utils import validate_rfid, read_rfid_input, get_student_by_rfid, format_currency, get_spending_pattern, recommend_recharge_amount
+from stations import CanteenStation, StationError
+from idempotency import new_idempotency_key
+from components.screen_manager import get_screen_manager
 
 class CanteenUI:
     def __init__(self, root, db, go_back_callback=None):
         self.root = root
         self.db = db
         self.go_back_callback = go_back_callback
+        self.station = CanteenStation(db)
         
-        # Clear the current window
-        for widget in self.root.winfo_children():
-            widget.destroy()
-            
-        self.root.title("RFID Student Wallet - Canteen")
-        
-        # Create a frame for the main content
-        self.main_frame = ttk.Frame(self.root)
-        self.main_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=20)
+        # Screens are built once and raised again on every visit
+        self.screens = get_screen_manager(root)
+        self.screens.discard('canteen.')
         
         # Show the main menu
         self.show_main_menu()
     
     def show_main_menu(self):
-        # Clear the main frame
-        for widget in self.main_frame.winfo_children():
-            widget.destroy()
-            
+        self.screens.show('canteen.menu', self._build_main_menu, title="RFID Student Wallet - Canteen")
+    
+    def _build_main_menu(self, frame):
+        frame.configure(padding=20)
+        
         # Title
-        title_label = ttk.Label(self.main_frame, text="Canteen Management", font=("Helvetica", 16, "bold"))
+        title_label = ttk.Label(frame, text="Canteen Management", font=("Helvetica", 16, "bold"))
         title_label.pack(pady=10)
         
         # Options frame
-        options_frame = ttk.Frame(self.main_frame)
+        options_frame = ttk.Frame(frame)
         options_frame.pack(pady=20)
         
         # Buttons for different operations
@@ -51,37 +50,87 @@ class CanteenUI:
         
         # Back button
         if self.go_back_callback:
-            ttk.Button(self.main_frame, text="Back to Main Menu", 
+            ttk.Button(frame, text="Back to Main Menu", 
                       command=self.go_back_callback).pack(pady=20)
     
+    def _build_student_info(self, parent_frame):
+        """Name, department and balance labels; returns their StringVars"""
+        info = {'name': tk.StringVar(), 'department': tk.StringVar(), 'balance': tk.StringVar()}
+        ttk.Label(parent_frame, textvariable=info['name'], 
+                 font=("Helvetica", 12)).pack(anchor=tk.W, padx=5)
+        ttk.Label(parent_frame, textvariable=info['department'], 
+                 font=("Helvetica", 10)).pack(anchor=tk.W, padx=5)
+        ttk.Label(parent_frame, textvariable=info['balance'], 
+                 font=("Helvetica", 12, "bold")).pack(anchor=tk.W, padx=5)
+        return info
+    
+    def _set_student_info(self, info, student):
+        if student is None:
+            for var in info.values():
+                var.set("")
+            return
+        info['name'].set(f"Student: {student.get('name', 'N/A')}")
+        info['department'].set(f"Department: {student.get('department', 'N/A')} - {student.get('year', 'N/A')} Year")
+        info['balance'].set(f"Current Balance: {format_currency(student.get('wallet_balance', 0))}")
+    
     def show_purchase_screen(self):
-        # Clear the main frame
-        for widget in self.main_frame.winfo_children():
-            widget.destroy()
-            
+        self.screens.show('canteen.purchase', self._build_purchase_screen, refresh=self._reset_purchase_screen)
+    
+    def _build_purchase_screen(self, frame):
+        frame.configure(padding=20)
+        
         # Title
-        title_label = ttk.Label(self.main_frame, text="Process Purchase", font=("Helvetica", 16, "bold"))
+        title_label = ttk.Label(frame, text="Process Purchase", font=("Helvetica", 16, "bold"))
         title_label.pack(pady=10)
         
         # Frame for RFID input
-        rfid_frame = ttk.Frame(self.main_frame)
+        rfid_frame = ttk.Frame(frame)
         rfid_frame.pack(pady=10, fill=tk.X)
         
         ttk.Label(rfid_frame, text="Student RFID:").pack(side=tk.LEFT, padx=5)
         self.student_rfid_entry = ttk.Entry(rfid_frame, width=15)
         self.student_rfid_entry.pack(side=tk.LEFT, padx=5)
-        self.student_rfid_entry.focus()
         
-        # Frame for student info (will be populated after RFID is entered)
-        self.student_info_frame = ttk.Frame(self.main_frame)
+        # Frame for student info (filled in after RFID is entered)
+        self.student_info_frame = ttk.Frame(frame)
         self.student_info_frame.pack(pady=10, fill=tk.X)
+        self.purchase_info = self._build_student_info(self.student_info_frame)
         
-        # Frame for transaction details
-        self.transaction_frame = ttk.Frame(self.main_frame)
+        # Frame for transaction details; its contents are only shown once a student is found
+        self.transaction_frame = ttk.Frame(frame)
         self.transaction_frame.pack(pady=10, fill=tk.X)
+        self.purchase_details = ttk.Frame(self.transaction_frame)
+        
+        ttk.Label(self.purchase_details, text="Enter Purchase Details:", 
+                 font=("Helvetica", 12)).pack(anchor=tk.W, padx=5, pady=5)
+        
+        # Amount frame
+        amount_frame = ttk.Frame(self.purchase_details)
+        amount_frame.pack(fill=tk.X, pady=5)
+        
+        ttk.Label(amount_frame, text="Amount (₹):").pack(side=tk.LEFT, padx=5)
+        self.amount_entry = ttk.Entry(amount_frame, width=10)
+        self.amount_entry.pack(side=tk.LEFT, padx=5)
+        
+        # Item description frame
+        desc_frame = ttk.Frame(self.purchase_details)
+        desc_frame.pack(fill=tk.X, pady=5)
+        
+        ttk.Label(desc_frame, text="Description:").pack(side=tk.LEFT, padx=5)
+        self.desc_entry = ttk.Entry(desc_frame, width=30)
+        self.desc_entry.pack(side=tk.LEFT, padx=5)
+        
+        # Process button
+        ttk.Button(self.purchase_details, text="Process Payment", 
+                  command=lambda: self.process_payment(self.purchase_student, self.payment_key)).pack(pady=10)
+        
+        # Recent transactions
+        ttk.Label(self.purchase_details, text="Recent Transactions:", 
+                 font=("Helvetica", 11)).pack(anchor=tk.W, padx=5, pady=(15,5))
+        self.purchase_transactions_tree = self.create_transactions_tree(self.purchase_details)
         
         # Back button
-        ttk.Button(self.main_frame, text="Back", 
+        ttk.Button(frame, text="Back", 
                   command=self.show_main_menu).pack(pady=10)
         
         # Bind Enter key to the callback
@@ -91,12 +140,17 @@ class CanteenUI:
         ttk.Button(rfid_frame, text="Submit", 
                   command=self.process_rfid_for_purchase).pack(side=tk.LEFT, padx=5)
     
+    def _reset_purchase_screen(self):
+        self.purchase_student = None
+        self.student_rfid_entry.delete(0, tk.END)
+        self._set_student_info(self.purchase_info, None)
+        self.purchase_details.pack_forget()
+        self.student_rfid_entry.focus()
+    
     def process_rfid_for_purchase(self):
-        # Clear previous content in frames
-        for widget in self.student_info_frame.winfo_children():
-            widget.destroy()
-        for widget in self.transaction_frame.winfo_children():
-            widget.destroy()
+        # Clear the previous student
+        self._set_student_info(self.purchase_info, None)
+        self.purchase_details.pack_forget()
             
         rfid = self.student_rfid_entry.get().strip()
         
@@ -112,45 +166,20 @@ class CanteenUI:
             return
             
         # Display student info
-        ttk.Label(self.student_info_frame, text=f"Student: {student.get('name', 'N/A')}", 
-                 font=("Helvetica", 12)).pack(anchor=tk.W, padx=5)
-        ttk.Label(self.student_info_frame, text=f"Department: {student.get('department', 'N/A')} - {student.get('year', 'N/A')} Year", 
-                 font=("Helvetica", 10)).pack(anchor=tk.W, padx=5)
-        ttk.Label(self.student_info_frame, text=f"Current Balance: {format_currency(student.get('wallet_balance', 0))}", 
-                 font=("Helvetica", 12, "bold")).pack(anchor=tk.W, padx=5)
-        
-        # Transaction details frame
-        ttk.Label(self.transaction_frame, text="Enter Purchase Details:", 
-                 font=("Helvetica", 12)).pack(anchor=tk.W, padx=5, pady=5)
-        
-        # Amount frame
-        amount_frame = ttk.Frame(self.transaction_frame)
-        amount_frame.pack(fill=tk.X, pady=5)
+        self._set_student_info(self.purchase_info, student)
         
-        ttk.Label(amount_frame, text="Amount (₹):").pack(side=tk.LEFT, padx=5)
-        self.amount_entry = ttk.Entry(amount_frame, width=10)
-        self.amount_entry.pack(side=tk.LEFT, padx=5)
-        
-        # Item description frame
-        desc_frame = ttk.Frame(self.transaction_frame)
-        desc_frame.pack(fill=tk.X, pady=5)
-        
-        ttk.Label(desc_frame, text="Description:").pack(side=tk.LEFT, padx=5)
-        self.desc_entry = ttk.Entry(desc_frame, width=30)
-        self.desc_entry.pack(side=tk.LEFT, padx=5)
-        
-        # Process button
-        ttk.Button(self.transaction_frame, text="Process Payment", 
-                  command=lambda: self.process_payment(student)).pack(pady=10)
-        
-        # Recent transactions
-        ttk.Label(self.transaction_frame, text="Recent Transactions:", 
-                 font=("Helvetica", 11)).pack(anchor=tk.W, padx=5, pady=(15,5))
+        # A new key per student read makes a repeated click on the same payment a no-op
+        self.purchase_student = student
+        self.payment_key = new_idempotency_key()
+        self.amount_entry.delete(0, tk.END)
+        self.desc_entry.delete(0, tk.END)
+        self.purchase_details.pack(fill=tk.X)
         
         # Display recent transactions
-        self.display_recent_transactions(self.transaction_frame, student['id'])
+        self.load_recent_transactions(self.purchase_transactions_tree, student['id'])
     
-    def display_recent_transactions(self, parent_frame, student_id):
+    def create_transactions_tree(self, parent_frame):
+        """Recent transactions table; filled by load_recent_transactions"""
         # Create a frame for transactions
         transactions_frame = ttk.Frame(parent_frame)
         transactions_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
@@ -182,6 +211,11 @@ class CanteenUI:
         # Pack the treeview and scrollbar
         tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        return tree
+    
+    def load_recent_transactions(self, tree, student_id):
+        """Replace the rows of a transactions table with the student's latest transactions"""
+        tree.delete(*tree.get_children())
         
         # Fetch recent transactions from Firestore
         try:
@@ -215,66 +249,20 @@ class CanteenUI:
                 
         except Exception as e:
             print(f"Error loading recent transactions: {e}")
-            error_label = ttk.Label(transactions_frame, text=f"Error loading transactions: {str(e)}", 
-                                  foreground="red")
-            error_label.pack(pady=10)
+            tree.insert("", tk.END, values=("Error", "", "", f"Error loading transactions: {str(e)}"))
     
-    def process_payment(self, student):
+    def display_recent_transactions(self, parent_frame, student_id):
+        tree = self.create_transactions_tree(parent_frame)
+        self.load_recent_transactions(tree, student_id)
+    
+    def process_payment(self, student, idempotency_key=None):
         try:
-            amount_str = self.amount_entry.get().strip()
-            description = self.desc_entry.get().strip()
-            
-            # Validate input
-            if not amount_str:
-                messagebox.showerror("Invalid Input", "Please enter a valid amount.")
-                return
-                
-            try:
-                amount = float(amount_str)
-                if amount <= 0:
-                    messagebox.showerror("Invalid Amount", "Amount must be greater than zero.")
-                    return
-            except ValueError:
-                messagebox.showerror("Invalid Amount", "Please enter a valid number for amount.")
-                return
-                
-            # Check if student has sufficient balance
-            current_balance = student.get('wallet_balance', 0)
-            if amount > current_balance:
-                messagebox.showerror("Insufficient Balance", 
-                                    f"Student has insufficient balance.\nCurrent Balance: {format_currency(current_balance)}\nRequired: {format_currency(amount)}")
-                return
-                
-            # Process the transaction
-            transaction = {
-                'student_id': student['id'],
-                'amount': amount,
-                'type': 'debit',
-                'description': description if description else 'Canteen Purchase',
-                'location': 'Canteen',
-                'timestamp': datetime.datetime.now()
-            }
-            
-            # Update student's wallet balance
-            new_balance = current_balance - amount
-            
-            # Perform the database operations in a transaction
-            transaction_batch = self.db.batch()
-            
-            # Add transaction
-            transaction_ref = self.db.collection('transactions').document()
-            transaction_batch.set(transaction_ref, transaction)
-            
-            # Update student balance
-            student_ref = self.db.collection('students').document(student['id'])
-            transaction_batch.update(student_ref, {'wallet_balance': new_balance})
-            
-            # Commit the batch
-            transaction_batch.commit()
+            result = self.station.pay(student, self.amount_entry.get().strip(), self.desc_entry.get().strip(),
+                                      idempotency_key)
             
             # Show success message
             messagebox.showinfo("Payment Successful", 
-                              f"Payment of {format_currency(amount)} processed successfully.\nNew Balance: {format_currency(new_balance)}")
+                              f"Payment of {format_currency(result['amount'])} processed successfully.\nNew Balance: {format_currency(result['new_balance'])}")
                               
             # Clear entries
             self.amount_entry.delete(0, tk.END)
@@ -283,37 +271,72 @@ class CanteenUI:
             # Refresh the student info and transactions display
             self.process_rfid_for_purchase()
             
+        except StationError as e:
+            messagebox.showerror(e.title, e.message)
         except Exception as e:
             messagebox.showerror("Error", f"An error occurred while processing payment: {str(e)}")
     
     def show_recharge_screen(self):
-        # Clear the main frame
-        for widget in self.main_frame.winfo_children():
-            widget.destroy()
-            
+        self.screens.show('canteen.recharge', self._build_recharge_screen, refresh=self._reset_recharge_screen)
+    
+    def _build_recharge_screen(self, frame):
+        frame.configure(padding=20)
+        
         # Title
-        title_label = ttk.Label(self.main_frame, text="Recharge Wallet", font=("Helvetica", 16, "bold"))
+        title_label = ttk.Label(frame, text="Recharge Wallet", font=("Helvetica", 16, "bold"))
         title_label.pack(pady=10)
         
         # Frame for RFID input
-        rfid_frame = ttk.Frame(self.main_frame)
+        rfid_frame = ttk.Frame(frame)
         rfid_frame.pack(pady=10, fill=tk.X)
         
         ttk.Label(rfid_frame, text="Student RFID:").pack(side=tk.LEFT, padx=5)
         self.recharge_rfid_entry = ttk.Entry(rfid_frame, width=15)
         self.recharge_rfid_entry.pack(side=tk.LEFT, padx=5)
-        self.recharge_rfid_entry.focus()
         
-        # Frame for student info (will be populated after RFID is entered)
-        self.recharge_student_info_frame = ttk.Frame(self.main_frame)
+        # Frame for student info (filled in after RFID is entered)
+        self.recharge_student_info_frame = ttk.Frame(frame)
         self.recharge_student_info_frame.pack(pady=10, fill=tk.X)
+        self.recharge_info = self._build_student_info(self.recharge_student_info_frame)
         
-        # Frame for recharge details
-        self.recharge_details_frame = ttk.Frame(self.main_frame)
+        # Frame for recharge details; its contents are only shown once a student is found
+        self.recharge_details_frame = ttk.Frame(frame)
         self.recharge_details_frame.pack(pady=10, fill=tk.X)
+        self.recharge_details = ttk.Frame(self.recharge_details_frame)
+        
+        ttk.Label(self.recharge_details, text="Enter Recharge Details:", 
+                 font=("Helvetica", 12)).pack(anchor=tk.W, padx=5, pady=5)
+        
+        # Amount frame
+        amount_frame = ttk.Frame(self.recharge_details)
+        amount_frame.pack(fill=tk.X, pady=5)
+        
+        ttk.Label(amount_frame, text="Amount (₹):").pack(side=tk.LEFT, padx=5)
+        self.recharge_amount_entry = ttk.Entry(amount_frame, width=10)
+        self.recharge_amount_entry.pack(side=tk.LEFT, padx=5)
+        
+        # Method frame
+        method_frame = ttk.Frame(self.recharge_details)
+        method_frame.pack(fill=tk.X, pady=5)
+        
+        ttk.Label(method_frame, text="Method:").pack(side=tk.LEFT, padx=5)
+        self.recharge_method_var = tk.StringVar(value="Cash")
+        methods = ["Cash", "UPI", "Card"]
+        method_combobox = ttk.Combobox(method_frame, textvariable=self.recharge_method_var, 
+                                      values=methods, width=10, state="readonly")
+        method_combobox.pack(side=tk.LEFT, padx=5)
+        
+        # Process button
+        ttk.Button(self.recharge_details, text="Process Recharge", 
+                  command=lambda: self.process_recharge(self.recharge_student, self.recharge_key)).pack(pady=10)
+        
+        # Recent transactions
+        ttk.Label(self.recharge_details, text="Recent Transactions:", 
+                 font=("Helvetica", 11)).pack(anchor=tk.W, padx=5, pady=(15,5))
+        self.recharge_transactions_tree = self.create_transactions_tree(self.recharge_details)
         
         # Back button
-        ttk.Button(self.main_frame, text="Back", 
+        ttk.Button(frame, text="Back", 
                   command=self.show_main_menu).pack(pady=10)
         
         # Bind Enter key to the callback
@@ -323,12 +346,17 @@ class CanteenUI:
         ttk.Button(rfid_frame, text="Submit", 
                   command=self.process_rfid_for_recharge).pack(side=tk.LEFT, padx=5)
     
+    def _reset_recharge_screen(self):
+        self.recharge_student = None
+        self.recharge_rfid_entry.delete(0, tk.END)
+        self._set_student_info(self.recharge_info, None)
+        self.recharge_details.pack_forget()
+        self.recharge_rfid_entry.focus()
+    
     def process_rfid_for_recharge(self):
-        # Clear previous content in frames
-        for widget in self.recharge_student_info_frame.winfo_children():
-            widget.destroy()
-        for widget in self.recharge_details_frame.winfo_children():
-            widget.destroy()
+        # Clear the previous student
+        self._set_student_info(self.recharge_info, None)
+        self.recharge_details.pack_forget()
             
         rfid = self.recharge_rfid_entry.get().strip()
         
@@ -344,128 +372,61 @@ class CanteenUI:
             return
             
         # Display student info
-        ttk.Label(self.recharge_student_info_frame, text=f"Student: {student.get('name', 'N/A')}", 
-                 font=("Helvetica", 12)).pack(anchor=tk.W, padx=5)
-        ttk.Label(self.recharge_student_info_frame, text=f"Department: {student.get('department', 'N/A')} - {student.get('year', 'N/A')} Year", 
-                 font=("Helvetica", 10)).pack(anchor=tk.W, padx=5)
-        ttk.Label(self.recharge_student_info_frame, text=f"Current Balance: {format_currency(student.get('wallet_balance', 0))}", 
-                 font=("Helvetica", 12, "bold")).pack(anchor=tk.W, padx=5)
-        
-        # Recharge details frame
-        ttk.Label(self.recharge_details_frame, text="Enter Recharge Details:", 
-                 font=("Helvetica", 12)).pack(anchor=tk.W, padx=5, pady=5)
-        
-        # Amount frame
-        amount_frame = ttk.Frame(self.recharge_details_frame)
-        amount_frame.pack(fill=tk.X, pady=5)
+        self._set_student_info(self.recharge_info, student)
         
-        ttk.Label(amount_frame, text="Amount (₹):").pack(side=tk.LEFT, padx=5)
-        self.recharge_amount_entry = ttk.Entry(amount_frame, width=10)
-        self.recharge_amount_entry.pack(side=tk.LEFT, padx=5)
-        
-        # Method frame
-        method_frame = ttk.Frame(self.recharge_details_frame)
-        method_frame.pack(fill=tk.X, pady=5)
-        
-        ttk.Label(method_frame, text="Method:").pack(side=tk.LEFT, padx=5)
-        self.recharge_method_var = tk.StringVar(value="Cash")
-        methods = ["Cash", "UPI", "Card"]
-        method_combobox = ttk.Combobox(method_frame, textvariable=self.recharge_method_var, 
-                                      values=methods, width=10, state="readonly")
-        method_combobox.pack(side=tk.LEFT, padx=5)
-        
-        # Process button
-        ttk.Button(self.recharge_details_frame, text="Process Recharge", 
-                  command=lambda: self.process_recharge(student)).pack(pady=10)
-        
-        # Transaction history (will be added in the future)
-        ttk.Label(self.recharge_details_frame, text="Recent Transactions:", 
-                 font=("Helvetica", 11)).pack(anchor=tk.W, padx=5, pady=(15,5))
+        # Fresh entries and idempotency key for this student
+        self.recharge_student = student
+        self.recharge_key = new_idempotency_key()
+        self.recharge_amount_entry.delete(0, tk.END)
+        self.recharge_method_var.set("Cash")
+        self.recharge_details.pack(fill=tk.X)
         
         # Display recent transactions
-        self.display_recent_transactions(self.recharge_details_frame, student['id'])
+        self.load_recent_transactions(self.recharge_transactions_tree, student['id'])
     
-    def process_recharge(self, student):
+    def process_recharge(self, student, idempotency_key=None):
         try:
-            amount = self.recharge_amount_entry.get().strip()
-            try:
-                amount = float(amount)
-                if amount <= 0:
-                    messagebox.showerror("Invalid Amount", "Please enter a positive amount.")
-                    return
-            except ValueError:
-                messagebox.showerror("Invalid Amount", "Please enter a valid number.")
-                return
-                
-            # Get student reference
-            student_ref = self.db.collection('students').document(student['id'])
-            
-            # Get current balance
-            current_balance = student.get('wallet_balance', 0)
-            new_balance = current_balance + amount
-            
-            # Process the transaction
-            transaction = {
-                'student_id': student['id'],
-                'student_name': student.get('name', 'Unknown'),
-                'student_rfid': student.get('rfid', 'Unknown'),
-                'type': 'credit',
-                'amount': amount,
-                'description': f"Wallet Recharge",
-                'location': 'Canteen',
-                'timestamp': datetime.datetime.now(),
-                'balance_after': new_balance
-            }
-            
-            # Perform the database operations in a transaction
-            transaction_batch = self.db.batch()
-            
-            # Add transaction
-            transaction_ref = self.db.collection('transactions').document()
-            transaction_batch.set(transaction_ref, transaction)
-            
-            # Update student balance
-            transaction_batch.update(student_ref, {'wallet_balance': new_balance})
-            
-            # Commit the transaction
-            transaction_batch.commit()
+            result = self.station.recharge(student, self.recharge_amount_entry.get().strip(),
+                                           idempotency_key=idempotency_key)
             
             messagebox.showinfo("Recharge Successful", 
-                              f"Wallet recharged with {format_currency(amount)}.\nNew balance: {format_currency(new_balance)}")
+                              f"Wallet recharged with {format_currency(result['amount'])}.\nNew balance: {format_currency(result['new_balance'])}")
             
             # Refresh the student info and transactions display
             self.process_rfid_for_recharge()
+        except StationError as e:
+            messagebox.showerror(e.title, e.message)
         except Exception as e:
             messagebox.showerror("Error", f"Failed to process recharge: {e}")
     
     def show_balance_screen(self):
-        # Clear the main frame
-        for widget in self.main_frame.winfo_children():
-            widget.destroy()
-            
+        self.screens.show('canteen.balance', self._build_balance_screen, refresh=self._reset_balance_screen)
+    
+    def _build_balance_screen(self, frame):
+        frame.configure(padding=20)
+        
         # Title
-        title_label = ttk.Label(self.main_frame, text="Check Balance", font=("Helvetica", 16, "bold"))
+        title_label = ttk.Label(frame, text="Check Balance", font=("Helvetica", 16, "bold"))
         title_label.pack(pady=10)
         
         # Frame for RFID input
-        rfid_frame = ttk.Frame(self.main_frame)
+        rfid_frame = ttk.Frame(frame)
         rfid_frame.pack(pady=10, fill=tk.X)
         
         ttk.Label(rfid_frame, text="Student RFID:").pack(side=tk.LEFT, padx=5)
         self.balance_rfid_entry = ttk.Entry(rfid_frame, width=15)
         self.balance_rfid_entry.pack(side=tk.LEFT, padx=5)
-        self.balance_rfid_entry.focus()
         
         # Frame for student info (will be populated after RFID is entered)
-        self.balance_student_info_frame = ttk.Frame(self.main_frame)
+        self.balance_student_info_frame = ttk.Frame(frame)
         self.balance_student_info_frame.pack(pady=10, fill=tk.X)
         
         # Frame for balance details
-        self.balance_details_frame = ttk.Frame(self.main_frame)
+        self.balance_details_frame = ttk.Frame(frame)
         self.balance_details_frame.pack(pady=10, fill=tk.X)
         
         # Back button
-        ttk.Button(self.main_frame, text="Back", 
+        ttk.Button(frame, text="Back", 
                   command=self.show_main_menu).pack(pady=10)
         
         # Bind Enter key to the callback
@@ -475,6 +436,12 @@ class CanteenUI:
         ttk.Button(rfid_frame, text="Submit", 
                   command=self.check_balance).pack(side=tk.LEFT, padx=5)
     
+    def _reset_balance_screen(self):
+        self.balance_rfid_entry.delete(0, tk.END)
+        for widget in self.balance_details_frame.winfo_children():
+            widget.destroy()
+        self.balance_rfid_entry.focus()
+    
     def check_balance(self):
         # Clear previous content in frames
         for widget in self.balance_details_frame.winfo_children():
@@ -537,8 +504,9 @@ class CanteenUI:
                             foreground="#555555", font=("Helvetica", 9)).pack(anchor=tk.W, pady=(5,0))
                 
                 # Add a quick recharge button with the suggested amount
+                quick_key = new_idempotency_key()
                 ttk.Button(suggestion_frame, text=f"Recharge {format_currency(suggested_amount)}", 
-                          command=lambda: self.quick_recharge(student, suggested_amount)).pack(anchor=tk.W, pady=10)
+                          command=lambda: self.quick_recharge(student, suggested_amount, quick_key)).pack(anchor=tk.W, pady=10)
             except Exception as e:
                 # In case of any error, provide a default recommendation
                 print(f"Error getting spending pattern: {e}")
@@ -556,8 +524,9 @@ class CanteenUI:
                          foreground="#D35400", font=("Helvetica", 10, "bold")).pack(anchor=tk.W)
                 
                 # Add a quick recharge button with the default amount
+                quick_key = new_idempotency_key()
                 ttk.Button(suggestion_frame, text=f"Recharge {format_currency(default_amount)}", 
-                          command=lambda: self.quick_recharge(student, default_amount)).pack(anchor=tk.W, pady=10)
+                          command=lambda: self.quick_recharge(student, default_amount, quick_key)).pack(anchor=tk.W, pady=10)
         
         # Transaction history
         ttk.Label(self.balance_details_frame, text="Recent Transactions:", 
@@ -566,46 +535,18 @@ class CanteenUI:
         # Display recent transactions
         self.display_recent_transactions(self.balance_details_frame, student['id'])
 
-    def quick_recharge(self, student, amount):
+    def quick_recharge(self, student, amount, idempotency_key=None):
         """Process a quick recharge with suggested amount"""
         try:
-            # Get student reference
-            student_ref = self.db.collection('students').document(student['id'])
-            
-            # Get current balance
-            current_balance = student.get('wallet_balance', 0)
-            new_balance = current_balance + amount
-            
-            # Process the transaction
-            transaction = {
-                'student_id': student['id'],
-                'student_name': student.get('name', 'Unknown'),
-                'student_rfid': student.get('rfid', 'Unknown'),
-                'type': 'credit',
-                'amount': amount,
-                'description': f"Quick Wallet Recharge",
-                'location': 'Canteen',
-                'timestamp': datetime.datetime.now(),
-                'balance_after': new_balance
-            }
-            
-            # Perform the database operations in a transaction
-            transaction_batch = self.db.batch()
-            
-            # Add transaction
-            transaction_ref = self.db.collection('transactions').document()
-            transaction_batch.set(transaction_ref, transaction)
-            
-            # Update student balance
-            transaction_batch.update(student_ref, {'wallet_balance': new_balance})
-            
-            # Commit the transaction
-            transaction_batch.commit()
+            result = self.station.recharge(student, amount, description="Quick Wallet Recharge",
+                                           idempotency_key=idempotency_key)
             
             messagebox.showinfo("Recharge Successful", 
-                               f"Wallet recharged with {format_currency(amount)}.\nNew balance: {format_currency(new_balance)}")
+                               f"Wallet recharged with {format_currency(result['amount'])}.\nNew balance: {format_currency(result['new_balance'])}")
             
             # Refresh the student info and transactions display
             self.check_balance()
+        except StationError as e:
+            messagebox.showerror(e.title, e.message)
         except Exception as e:
-            messagebox.showerror("Error", f"Failed to process quick recharge: {e}") 
\ No newline at end of file
+            messagebox.showerror("Error", f"Failed to process quick recharge: {e}")
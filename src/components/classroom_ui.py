@@ -1,11 +1,15 @@
 import tkinter as tk
-from tkinter import ttk, messagebox, filedialog
+from tkinter import ttk, messagebox, filedialog, simpledialog
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from utils import validate_rfid, get_student_by_rfid, check_attendance_exists, verify_face, decode_base64_to_face
+from utils import validate_rfid, get_student_by_rfid
+from stations import ClassroomStation, StationError
+from components.screen_manager import clear_screen
+from attendance_writer import get_attendance_writer
+from calendar_service import attendance_summary
 import datetime
-import csv
+import queue
 from firebase_admin import firestore
 
 class ClassroomUI:
@@ -16,8 +20,7 @@ class ClassroomUI:
         self.classroom_info = None
         
         # Clear the window
-        for widget in self.root.winfo_children():
-            widget.destroy()
+        clear_screen(self.root)
             
         self.root.title("Classroom Interface - RFID Student Wallet Application")
         
@@ -73,47 +76,22 @@ class ClassroomUI:
     
     def enter_classroom(self):
         """Process classroom selection and enter classroom"""
-        department = self.dept_entry.get().strip().upper()
-        year = self.year_entry.get().strip()
-        section = self.section_entry.get().strip().upper()
-        
-        # Basic validation
-        if not all([department, year, section]):
-            messagebox.showerror("Error", "All fields are required!")
-            return
-        
         try:
-            year = int(year)
-            if year < 1 or year > 5:
-                raise ValueError("Year must be between 1 and 5")
-        except ValueError as e:
-            messagebox.showerror("Invalid Year", str(e))
+            self.classroom_info = ClassroomStation.open_classroom(
+                self.db, self.dept_entry.get(), self.year_entry.get(), self.section_entry.get()
+            )
+        except StationError as e:
+            messagebox.showerror(e.title, e.message)
             return
         
-        if len(section) != 1 or not section.isalpha():
-            messagebox.showerror("Invalid Section", "Section must be a single letter.")
-            return
+        # Marks are confirmed on screen at once and committed to Firestore in batches
+        self.station = ClassroomStation(self.db, self.classroom_info, writer=get_attendance_writer(self.db))
         
-        # Store classroom info
-        self.classroom_info = {
-            'department': department,
-            'year': year,
-            'section': section,
-            'key': f"{department}_{year}_{section}"
-        }
-        
-        # Check if classroom exists, if not create it
-        classroom_ref = self.db.collection('classrooms').document(self.classroom_info['key'])
-        classroom_doc = classroom_ref.get()
-        
-        if not classroom_doc.exists:
-            # Create new classroom record
-            classroom_ref.set({
-                'department': department,
-                'year': year,
-                'section': section,
-                'created_at': datetime.datetime.now()
-            })
+        # Roster, face templates and today's marks are loaded once so taps need no reads
+        try:
+            self.station.load_roster()
+        except Exception as e:
+            print(f"Error preloading classroom roster, falling back to per-tap lookups: {e}")
         
         # Show classroom interface
         self.show_classroom_ui()
@@ -121,8 +99,7 @@ class ClassroomUI:
     def show_classroom_ui(self):
         """Show the main classroom interface"""
         # Clear the window
-        for widget in self.root.winfo_children():
-            widget.destroy()
+        clear_screen(self.root)
             
         classroom_frame = ttk.Frame(self.root, padding=20)
         classroom_frame.pack(fill=tk.BOTH, expand=True)
@@ -162,8 +139,7 @@ class ClassroomUI:
     def mark_attendance_ui(self):
         """Show interface to mark attendance"""
         # Clear the window
-        for widget in self.root.winfo_children():
-            widget.destroy()
+        clear_screen(self.root)
             
         attendance_frame = ttk.Frame(self.root, padding=20)
         attendance_frame.pack(fill=tk.BOTH, expand=True)
@@ -233,100 +209,122 @@ class ClassroomUI:
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         self.attendance_tree.pack(fill=tk.BOTH, expand=True)
         
-        # Load today's attendance
-        self.load_today_attendance()
+        # Keep the board in sync with every entrance marking this classroom
+        self.attendance_tree.bind('<Destroy>', lambda event: self.stop_live_board())
+        self.start_live_board()
         
         # Back button
         back_btn = ttk.Button(attendance_frame, text="Back", 
                              command=self.show_classroom_ui)
         back_btn.pack(pady=(10, 0))
     
-    def load_today_attendance(self):
-        """Load today's attendance records for the classroom"""
+    def start_live_board(self):
+        """Listen to today's attendance for the classroom and mirror it into the treeview"""
+        self.stop_live_board()
+        self.board_date = datetime.datetime.now().strftime("%Y-%m-%d")
+        self.board_events = queue.Queue()
+        
+        for item in self.attendance_tree.get_children():
+            self.attendance_tree.delete(item)
+        
         try:
-            today_str = datetime.datetime.now().strftime("%Y-%m-%d")
-            
-            # Clear existing tree items
-            for item in self.attendance_tree.get_children():
-                self.attendance_tree.delete(item)
-            
-            # Query for today's attendance for this classroom
-            attendance_ref = self.db.collection('attendance')
-            query = attendance_ref.where(
+            query = self.db.collection('attendance').where(
                 filter=firestore.FieldFilter('classroom_key', '==', self.classroom_info['key'])
             ).where(
-                filter=firestore.FieldFilter('date', '==', today_str)
+                filter=firestore.FieldFilter('date', '==', self.board_date)
             )
-            
-            results = query.get()
-            
-            for doc in results:
-                data = doc.to_dict()
-                time_str = data.get('timestamp').strftime("%H:%M:%S") if data.get('timestamp') else "Unknown"
-                self.attendance_tree.insert('', tk.END, values=(
-                    time_str,
-                    data.get('student_name', 'Unknown'),
-                    data.get('student_rfid', 'Unknown'),
-                    "Present"
-                ))
+            # The first snapshot delivers the day so far; later ones only the changes
+            self.board_watch = query.on_snapshot(self._on_attendance_snapshot)
         except Exception as e:
-            print(f"Error loading attendance records: {e}")
-    
-    def process_attendance(self):
-        """Process student attendance with RFID and face verification"""
-        rfid = self.attendance_rfid_entry.get().strip()
+            print(f"Error listening to attendance records: {e}")
         
-        if not validate_rfid(rfid):
-            self.status_label.config(text="Invalid RFID format. Please try again.", foreground="red")
+        self.board_poll = self.root.after(200, self._apply_board_events)
+    
+    def stop_live_board(self):
+        """Unsubscribe the listener and stop applying its changes"""
+        watch = getattr(self, 'board_watch', None)
+        if watch is not None:
+            self.board_watch = None
+            try:
+                watch.unsubscribe()
+            except Exception as e:
+                print(f"Error stopping attendance listener: {e}")
+        
+        poll = getattr(self, 'board_poll', None)
+        if poll is not None:
+            self.board_poll = None
+            try:
+                self.root.after_cancel(poll)
+            except Exception:
+                pass
+    
+    def _on_attendance_snapshot(self, docs, changes, read_time):
+        # Runs on the listener's thread; Tk widgets may only be touched from the main loop
+        for change in changes:
+            self.board_events.put((change.type.name, change.document.id, change.document.to_dict()))
+    
+    def _apply_board_events(self):
+        """Apply queued listener changes to the treeview (runs on the Tk main loop)"""
+        self.board_poll = None
+        if not self.attendance_tree.winfo_exists():
             return
         
-        # Check if student exists
-        student = get_student_by_rfid(self.db, rfid)
-        
-        if not student:
-            self.status_label.config(text=f"No student found with RFID {rfid}.", foreground="red")
+        # Past midnight the board follows the new day
+        if datetime.datetime.now().strftime("%Y-%m-%d") != self.board_date:
+            self.start_live_board()
             return
         
-        # Check if student belongs to this classroom
-        if student.get('department') != self.classroom_info['department'] or \
-           int(student.get('year')) != self.classroom_info['year'] or \
-           student.get('section') != self.classroom_info['section']:
+        while True:
+            try:
+                change, doc_id, data = self.board_events.get_nowait()
+            except queue.Empty:
+                break
             
-            self.status_label.config(
-                text=f"Student {student.get('name')} does not belong to this classroom.",
-                foreground="red"
-            )
-            return
-        
-        # Check if attendance already marked for today
-        today_str = datetime.datetime.now().strftime("%Y-%m-%d")
-        already_marked = check_attendance_exists(self.db, student['id'], today_str)
+            if change == 'REMOVED':
+                if self.attendance_tree.exists(doc_id):
+                    self.attendance_tree.delete(doc_id)
+            else:
+                self._show_attendance_row(doc_id, data)
+                # Marks from other entrances also count for this station's duplicate check
+                self.station.note_present(data.get('student_id'), data.get('date'))
         
-        if already_marked:
-            self.status_label.config(
-                text=f"Attendance for {student.get('name')} already marked today.",
-                foreground="orange"
-            )
+        self.board_poll = self.root.after(200, self._apply_board_events)
+    
+    def _show_attendance_row(self, doc_id, data, pending=False):
+        """Insert or update one attendance record; rows stay newest first"""
+        timestamp = data.get('timestamp')
+        time_str = timestamp.strftime("%H:%M:%S") if timestamp else "Unknown"
+        status = "Present (Face Verified)" if data.get('verification_method') == 'face_recognition' else "Present"
+        if pending:
+            status += " - saving"
+        values = (time_str, data.get('student_name', 'Unknown'), data.get('student_rfid', 'Unknown'), status)
+        
+        if self.attendance_tree.exists(doc_id):
+            self.attendance_tree.item(doc_id, values=values)
             return
         
-        # Get the stored face data
-        face_data_base64 = student.get('face_data')
+        # HH:MM:SS strings sort in time order
+        index = 0
+        for item in self.attendance_tree.get_children():
+            if self.attendance_tree.item(item, 'values')[0] <= time_str:
+                break
+            index += 1
+        self.attendance_tree.insert('', index, iid=doc_id, values=values)
+    
+    def process_attendance(self):
+        """Process student attendance with RFID and face verification"""
+        rfid = self.attendance_rfid_entry.get().strip()
         
-        if not face_data_base64:
-            self.status_label.config(
-                text=f"No face data registered for {student.get('name')}. Cannot verify identity.",
-                foreground="red"
-            )
+        if not validate_rfid(rfid):
+            self.status_label.config(text="Invalid RFID format. Please try again.", foreground="red")
             return
         
-        # Decode face data
-        known_face_encodings = decode_base64_to_face(face_data_base64)
-        
-        if known_face_encodings is None:
-            self.status_label.config(
-                text=f"Error decoding face data for {student.get('name')}.",
-                foreground="red"
-            )
+        # Check the student belongs here, is not yet marked and has a usable face template
+        try:
+            student = self.station.check_in(rfid)
+            known_face_encodings = self.station.load_face_encodings(student)
+        except StationError as e:
+            self.status_label.config(text=e.message, foreground="orange" if e.level == "warning" else "red")
             return
         
         # Show message before face verification
@@ -340,7 +338,7 @@ class ClassroomUI:
         
         # Perform face verification with very strict tolerance
         # Use 0.4 for even stricter matching if needed
-        face_verified = verify_face(known_face_encodings, camera_index=0, tolerance=0.45)
+        face_verified = self.station.verify(known_face_encodings)
         
         if not face_verified:
             self.status_label.config(
@@ -354,28 +352,9 @@ class ClassroomUI:
             return
         
         # All checks passed, mark attendance
-        now = datetime.datetime.now()
-        
-        attendance_data = {
-            'student_id': student['id'],
-            'student_name': student.get('name'),
-            'student_rfid': rfid,
-            'classroom_key': self.classroom_info['key'],
-            'department': self.classroom_info['department'],
-            'year': self.classroom_info['year'],
-            'section': self.classroom_info['section'],
-            'date': today_str,
-            'timestamp': now,
-            'time_str': now.strftime("%H:%M:%S"),
-            'status': 'present',
-            'verification_method': 'face_recognition',
-            'verification_strictness': 'high',
-            'course': f"{self.classroom_info['department']} Year {self.classroom_info['year']} Section {self.classroom_info['section']}"
-        }
-        
         try:
-            # Add to database
-            self.db.collection('attendance').add(attendance_data)
+            attendance_data = self.station.mark_present(student)
+            now = attendance_data['timestamp']
             
             # Update UI
             self.status_label.config(
@@ -384,13 +363,8 @@ class ClassroomUI:
                 foreground="green"
             )
             
-            # Add to treeview
-            self.attendance_tree.insert('', 0, values=(
-                now.strftime("%H:%M:%S"),
-                student.get('name'),
-                rfid,
-                "Present (Face Verified)"
-            ))
+            # Show it right away; the listener's copy of the record replaces the row once it is committed
+            self._show_attendance_row(attendance_data['id'], attendance_data, pending=True)
             
             # Clear RFID entry for next student
             self.attendance_rfid_entry.delete(0, tk.END)
@@ -405,8 +379,7 @@ class ClassroomUI:
     def check_attendance_ui(self):
         """Show interface to check a student's attendance"""
         # Clear the window
-        for widget in self.root.winfo_children():
-            widget.destroy()
+        clear_screen(self.root)
             
         check_frame = ttk.Frame(self.root, padding=20)
         check_frame.pack(fill=tk.BOTH, expand=True)
@@ -564,27 +537,12 @@ class ClassroomUI:
                     "Present"
                 ))
             
-            # Calculate attendance percentage
-            # Get days in month
-            days_in_month = 0
-            if month_num in [1, 3, 5, 7, 8, 10, 12]:
-                days_in_month = 31
-            elif month_num in [4, 6, 9, 11]:
-                days_in_month = 30
-            elif month_num == 2:
-                # Simple leap year check
-                if year % 4 == 0 and (year % 100 != 0 or year % 400 == 0):
-                    days_in_month = 29
-                else:
-                    days_in_month = 28
-            
-            # For a simple implementation, assume all days are working days
-            # A real application would account for holidays, weekends, etc.
-            working_days = days_in_month  # Simplified
-            present_days = len(month_records)
+            # Calculate attendance percentage over working days from the shared calendar
+            present_days, working_days, attendance_percentage = attendance_summary(
+                [record.get('date') for record in month_records], year, month_num
+            )
             
             if working_days > 0:
-                attendance_percentage = (present_days / working_days) * 100
                 self.summary_label.config(
                     text=f"Present: {present_days} days out of {working_days} working days ({attendance_percentage:.2f}%)",
                     foreground="black"
@@ -604,106 +562,44 @@ class ClassroomUI:
     def export_attendance(self):
         """Export attendance sheet for the classroom"""
         try:
+            # Ask for the months to export, this month by default
+            this_month = datetime.date.today().strftime("%Y-%m")
+            months_text = simpledialog.askstring(
+                "Export Attendance",
+                "Month (YYYY-MM) or range (YYYY-MM to YYYY-MM):",
+                initialvalue=this_month,
+                parent=self.root
+            )
+            if not months_text:
+                return  # User canceled
+
+            # Loaded here so NumPy is only imported when someone exports
+            from attendance_export import parse_month, month_span, export_attendance
+
+            parts = [part for part in months_text.replace(" to ", " ").split() if part]
+            start = parse_month(parts[0])
+            end = parse_month(parts[-1])
+            months = month_span(start, end)
+            if not months:
+                messagebox.showerror("Export Error", "The first month must not be after the last month.")
+                return
+
             # Ask for save location
             filename = filedialog.asksaveasfilename(
                 defaultextension=".csv",
-                filetypes=[("CSV files", "*.csv"), ("All files", "*.*")]
+                initialfile=f"attendance_{self.classroom_info['key']}_{parts[0]}.csv",
+                filetypes=[("CSV files", "*.csv"), ("Excel workbooks", "*.xlsx"), ("All files", "*.*")]
             )
-            
+
             if not filename:
                 return  # User canceled
-            
-            # Get month and year for export
-            today = datetime.datetime.now()
-            month_num = today.month
-            year = today.year
-            
-            # Fetch students in this classroom
-            students_ref = self.db.collection('students')
-            query = students_ref.where(
-                filter=firestore.FieldFilter('department', '==', self.classroom_info['department'])
-            ).where(
-                filter=firestore.FieldFilter('year', '==', str(self.classroom_info['year']))
-            ).where(
-                filter=firestore.FieldFilter('section', '==', self.classroom_info['section'])
-            )
-            
-            students = {}
-            for doc in query.get():
-                student_data = doc.to_dict()
-                students[doc.id] = student_data
-            
-            if not students:
+
+            count = export_attendance(self.db, [self.classroom_info], months, filename)
+            if not count:
                 messagebox.showinfo("Export", "No students found in this classroom.")
                 return
-            
-            # Fetch attendance records for this classroom
-            attendance_ref = self.db.collection('attendance')
-            query = attendance_ref.where(
-                filter=firestore.FieldFilter('classroom_key', '==', self.classroom_info['key'])
-            )
-            
-            all_records = query.get()
-            
-            # Filter by month/year manually
-            month_records = {}
-            for doc in all_records:
-                data = doc.to_dict()
-                date_obj = datetime.datetime.strptime(data.get('date', ''), "%Y-%m-%d")
-                
-                if date_obj.month == month_num and date_obj.year == year:
-                    student_id = data.get('student_id')
-                    date = data.get('date')
-                    
-                    if student_id not in month_records:
-                        month_records[student_id] = set()
-                    
-                    month_records[student_id].add(date)
-            
-            # Get all dates in the month
-            days_in_month = 31  # Simplification - a real app would calculate correctly
-            all_days = []
-            for day in range(1, days_in_month + 1):
-                date_str = f"{year}-{month_num:02d}-{day:02d}"
-                all_days.append(date_str)
-            
-            # Prepare data for CSV
-            csv_data = []
-            headers = ['Roll No', 'Name', 'RFID'] + [f'{day}' for day in range(1, days_in_month + 1)] + ['Present', 'Absent', 'Percentage']
-            
-            for student_id, student_data in students.items():
-                row = [
-                    student_data.get('id', 'Unknown'),
-                    student_data.get('name', 'Unknown'),
-                    student_data.get('rfid', 'Unknown')
-                ]
-                
-                # Add attendance for each day
-                present_count = 0
-                for day_str in all_days:
-                    if student_id in month_records and day_str in month_records[student_id]:
-                        row.append('P')
-                        present_count += 1
-                    else:
-                        row.append('A')
-                
-                # Add summary
-                absent_count = days_in_month - present_count
-                if days_in_month > 0:
-                    percentage = (present_count / days_in_month) * 100
-                else:
-                    percentage = 0
-                
-                row.extend([present_count, absent_count, f"{percentage:.2f}%"])
-                csv_data.append(row)
-            
-            # Write to CSV
-            with open(filename, 'w', newline='') as csvfile:
-                writer = csv.writer(csvfile)
-                writer.writerow(headers)
-                writer.writerows(csv_data)
-            
+
             messagebox.showinfo("Export Successful", f"Attendance sheet exported successfully to {filename}!")
-            
+
         except Exception as e:
             messagebox.showerror("Export Error", f"Failed to export attendance: {e}") 
\ No newline at end of file
@@ -4,6 +4,10 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from utils import validate_rfid, validate_pin, get_student_by_rfid, get_similar_books, get_book_recommendations
+from stations import LibraryStation, StationError, MAX_BORROWED_BOOKS
+from catalog_mirror import get_catalog_mirror
+from components.virtual_list import VirtualTreeview
+from components.screen_manager import get_screen_manager, clear_screen
 import datetime
 from google.cloud import firestore
 import csv
@@ -14,24 +18,24 @@ class LibraryUI:
         self.root = root
         self.db = db
         self.return_callback = return_callback
+        # Catalog reads are served from the local mirror, which keeps working through short outages
+        self.catalog = get_catalog_mirror(db)
+        self.station = LibraryStation(db, catalog=self.catalog)
         
-        # Clear the window
-        for widget in self.root.winfo_children():
-            widget.destroy()
-            
-        self.root.title("Library Interface - RFID Student Wallet Application")
+        # The menu is built once and raised again on every visit
+        self.screens = get_screen_manager(root)
+        self.screens.discard('library.')
         
         # Show main library UI
         self.show_library_menu()
     
     def show_library_menu(self):
         """Show the main library menu"""
-        # Clear the window
-        for widget in self.root.winfo_children():
-            widget.destroy()
-            
-        library_frame = ttk.Frame(self.root, padding=20)
-        library_frame.pack(fill=tk.BOTH, expand=True)
+        self.screens.show('library.menu', self._build_library_menu,
+                          title="Library Interface - RFID Student Wallet Application")
+    
+    def _build_library_menu(self, library_frame):
+        library_frame.configure(padding=20)
         
         # Title
         title_label = ttk.Label(library_frame, text="Library Management", font=('Arial', 16, 'bold'))
@@ -62,8 +66,7 @@ class LibraryUI:
     def show_lend_ui(self):
         """Show interface to lend a book"""
         # Clear the window
-        for widget in self.root.winfo_children():
-            widget.destroy()
+        clear_screen(self.root)
             
         lend_frame = ttk.Frame(self.root, padding=20)
         lend_frame.pack(fill=tk.BOTH, expand=True)
@@ -136,38 +139,7 @@ class LibraryUI:
             widget.destroy()
         
         try:
-            # Fetch book by book_id field
-            book_query = self.db.collection('books').where(
-                filter=firestore.FieldFilter('book_id', '==', book_id)
-            ).limit(1)
-            books = book_query.get()
-            
-            if not books or len(books) == 0:
-                error_label = ttk.Label(self.book_info_frame, text=f"No book found with ID {book_id}.", foreground="red")
-                error_label.pack(anchor=tk.W, pady=5)
-                self.book_data = None
-                self.check_can_process()
-                return
-            
-            # Get book data
-            book_doc = books[0]
-            self.book_data = book_doc.to_dict()
-            self.book_data['id'] = book_doc.id  # Store document ID for reference
-            self.book_data['book_id'] = book_id  # Ensure book_id is saved
-            
-            # Check if already lent
-            if self.book_data.get('status') == 'lent':
-                lent_date = self.book_data.get('lent_date', 'Unknown')
-                due_date = self.book_data.get('due_date', 'Unknown')
-                student_id = self.book_data.get('lent_to', 'Unknown')
-                
-                error_label = ttk.Label(self.book_info_frame, 
-                                     text=f"This book is already lent to student ID {student_id}.\nLent on: {lent_date}, Due: {due_date}", 
-                                     foreground="red")
-                error_label.pack(anchor=tk.W, pady=5)
-                self.book_data = None
-                self.check_can_process()
-                return
+            self.book_data = self.station.find_book_for_lending(book_id)
             
             # Display book info
             info_text = f"Title: {self.book_data.get('title', 'Unknown')}\n"
@@ -181,6 +153,11 @@ class LibraryUI:
             # Check if we can proceed
             self.check_can_process()
             
+        except StationError as e:
+            error_label = ttk.Label(self.book_info_frame, text=e.message, foreground="red")
+            error_label.pack(anchor=tk.W, pady=5)
+            self.book_data = None
+            self.check_can_process()
         except Exception as e:
             error_label = ttk.Label(self.book_info_frame, text=f"Error fetching book: {e}", foreground="red")
             error_label.pack(anchor=tk.W, pady=5)
@@ -222,17 +199,9 @@ class LibraryUI:
         
         # Check number of books already borrowed
         try:
-            records_ref = self.db.collection('library_records')
-            query = records_ref.where(
-                filter=firestore.FieldFilter('student_id', '==', student['id'])
-            ).where(
-                filter=firestore.FieldFilter('status', '==', 'lent')
-            )
+            borrowed_count = self.station.borrowed_count(student['id'])
             
-            results = query.get()
-            borrowed_count = len(results)
-            
-            if borrowed_count >= 3:  # Maximum 3 books allowed at a time
+            if borrowed_count >= MAX_BORROWED_BOOKS:
                 warning_label = ttk.Label(self.student_info_frame, 
                                        text=f"Warning: Student already has {borrowed_count} books borrowed.", 
                                        foreground="orange")
@@ -256,57 +225,25 @@ class LibraryUI:
             return
         
         try:
-            # Set lending dates
-            now = datetime.datetime.now()
-            lent_date = now.strftime("%Y-%m-%d")
-            
-            # Set due date (14 days from now)
-            due_date = (now + datetime.timedelta(days=14)).strftime("%Y-%m-%d")
-            
-            # Get document reference using the stored document ID
-            book_ref = self.db.collection('books').document(self.book_data['id'])
-            book_ref.update({
-                'status': 'lent',
-                'lent_to': self.student_data['id'],
-                'lent_date': lent_date,
-                'due_date': due_date,
-                'available': False  # Set available to False when lending
-            })
-            
-            # Create lending record
-            lending_data = {
-                'book_id': self.book_data.get('book_id', self.book_data['id']),  # Use book_id field or document ID
-                'book_title': self.book_data.get('title', 'Unknown'),
-                'student_id': self.student_data['id'],
-                'student_name': self.student_data.get('name', 'Unknown'),
-                'student_rfid': self.student_data.get('rfid', 'Unknown'),
-                'lent_date': lent_date,
-                'due_date': due_date,
-                'status': 'lent',
-                'timestamp': now
-            }
-            
-            # Add to lendings collection (new approach)
-            self.db.collection('lendings').add(lending_data)
-            
-            # Also add to library_records for backward compatibility
-            self.db.collection('library_records').add(lending_data)
+            lending_data = self.station.lend(self.book_data, self.student_data)
             
             # Show success message
             messagebox.showinfo("Success", 
-                              f"Book '{self.book_data.get('title')}' successfully lent to {self.student_data.get('name')}.\nDue date: {due_date}")
+                              f"Book '{self.book_data.get('title')}' successfully lent to {self.student_data.get('name')}.\nDue date: {lending_data['due_date']}")
             
             # Return to library menu
             self.show_library_menu()
             
+        except StationError as e:
+            # Another desk lent the book after it was looked up
+            messagebox.showerror(e.title, e.message)
         except Exception as e:
             messagebox.showerror("Error", f"Failed to process lending: {e}")
     
     def show_return_ui(self):
         """Show the book return interface"""
         # Clear the window
-        for widget in self.root.winfo_children():
-            widget.destroy()
+        clear_screen(self.root)
             
         return_frame = ttk.Frame(self.root, padding=20)
         return_frame.pack(fill=tk.BOTH, expand=True)
@@ -359,187 +296,10 @@ class LibraryUI:
             return
         
         try:
-            # First try to search in lending records (most reliable)
-            lending_ref = self.db.collection('lendings')
-            query = lending_ref.where(
-                filter=firestore.FieldFilter('book_id', '==', book_id)
-            ).where(
-                filter=firestore.FieldFilter('status', '==', 'lent')
-            ).limit(1)
-            
-            lending_results = list(query.get())
-            
-            if lending_results:
-                lending_doc = lending_results[0]
-                lending_data = lending_doc.to_dict()
-                
-                # Get the book details using book_id
-                book_query = self.db.collection('books').where(
-                    filter=firestore.FieldFilter('book_id', '==', book_id)
-                ).limit(1)
-                
-                book_results = list(book_query.get())
-                
-                if book_results:
-                    book_doc = book_results[0]
-                    book_data = book_doc.to_dict()
-                    book_data['id'] = book_doc.id
-                    book_data['lending_id'] = lending_doc.id
-                    book_data['student_id'] = lending_data.get('student_id')
-                    book_data['lent_to'] = lending_data.get('student_name', 'Unknown')
-                    book_data['lent_date'] = lending_data.get('lent_date')
-                    book_data['due_date'] = lending_data.get('due_date')
-                    self.display_return_book_info(book_data)
-                    return
-                else:
-                    # If book not found by book_id, try direct document ID
-                    book_ref = self.db.collection('books').document(lending_data.get('book_id'))
-                    book_doc = book_ref.get()
-                    
-                    if book_doc.exists:
-                        book_data = book_doc.to_dict()
-                        book_data['id'] = book_doc.id
-                        book_data['lending_id'] = lending_doc.id
-                        book_data['student_id'] = lending_data.get('student_id')
-                        book_data['lent_to'] = lending_data.get('student_name', 'Unknown')
-                        book_data['lent_date'] = lending_data.get('lent_date')
-                        book_data['due_date'] = lending_data.get('due_date')
-                        self.display_return_book_info(book_data)
-                        return
-            
-            # Try to get the book directly by document ID
-            book_ref = self.db.collection('books').document(book_id)
-            book_doc = book_ref.get()
-            
-            # If direct match found
-            if book_doc.exists:
-                book_data = book_doc.to_dict()
-                book_data['id'] = book_doc.id
-                
-                # Check if the book is actually lent out
-                if book_data.get('status') == 'lent':
-                    # Get student data
-                    student_id = book_data.get('lent_to')
-                    
-                    # Look for the lending record
-                    lending_query = self.db.collection('lendings').where(
-                        filter=firestore.FieldFilter('book_id', '==', book_id)
-                    ).where(
-                        filter=firestore.FieldFilter('status', '==', 'lent')
-                    ).limit(1)
-                    
-                    lending_results = list(lending_query.get())
-                    if lending_results:
-                        lending_doc = lending_results[0]
-                        book_data['lending_id'] = lending_doc.id
-                    
-                    if student_id:
-                        student_ref = self.db.collection('students').document(student_id)
-                        student_doc = student_ref.get()
-                        if student_doc.exists:
-                            student_data = student_doc.to_dict()
-                            book_data['lent_to'] = student_data.get('name', 'Unknown')
-                            book_data['student_id'] = student_id
-                        
-                    self.display_return_book_info(book_data)
-                    return
-                else:
-                    messagebox.showerror("Book Not Lent", f"Book '{book_data.get('title', 'Unknown')}' is not currently lent out.")
-                    return
-            
-            # Check by book_id field in the books collection
-            books_query = self.db.collection('books').where(
-                filter=firestore.FieldFilter('book_id', '==', book_id)
-            ).limit(1)
-            
-            books_results = list(books_query.get())
-            
-            if books_results:
-                book_doc = books_results[0]
-                book_data = book_doc.to_dict()
-                book_data['id'] = book_doc.id
-                
-                # Check if the book is actually lent out
-                if book_data.get('status') == 'lent':
-                    # Get student data
-                    student_id = book_data.get('lent_to')
-                    
-                    # Look for the lending record
-                    lending_query = self.db.collection('lendings').where(
-                        filter=firestore.FieldFilter('book_id', '==', book_id)
-                    ).where(
-                        filter=firestore.FieldFilter('status', '==', 'lent')
-                    ).limit(1)
-                    
-                    lending_results = list(lending_query.get())
-                    if lending_results:
-                        lending_doc = lending_results[0]
-                        book_data['lending_id'] = lending_doc.id
-                    
-                    if student_id:
-                        student_ref = self.db.collection('students').document(student_id)
-                        student_doc = student_ref.get()
-                        if student_doc.exists:
-                            student_data = student_doc.to_dict()
-                            book_data['lent_to'] = student_data.get('name', 'Unknown')
-                            book_data['student_id'] = student_id
-                        
-                    self.display_return_book_info(book_data)
-                    return
-            else:
-                    messagebox.showerror("Book Not Lent", f"Book '{book_data.get('title', 'Unknown')}' is not currently lent out.")
-                    return
-                
-            # Check for library_records as a fallback
-            records_ref = self.db.collection('library_records')
-            query = records_ref.where(
-                filter=firestore.FieldFilter('book_id', '==', book_id)
-            ).where(
-                filter=firestore.FieldFilter('status', '==', 'lent')
-            ).limit(1)
-            
-            record_results = list(query.get())
-            
-            if record_results:
-                record_doc = record_results[0]
-                record_data = record_doc.to_dict()
-                
-                # Get the book details
-                book_id_from_record = record_data.get('book_id')
-                
-                # Try to find the book
-                book_query = self.db.collection('books').where(
-                    filter=firestore.FieldFilter('book_id', '==', book_id_from_record)
-                ).limit(1)
-                
-                book_results = list(book_query.get())
-                book_data = None
-                
-                if book_results:
-                    book_doc = book_results[0]
-                    book_data = book_doc.to_dict()
-                    book_data['id'] = book_doc.id
-                else:
-                    # Try by document ID
-                    book_ref = self.db.collection('books').document(book_id_from_record)
-                    book_doc = book_ref.get()
-                    
-                    if book_doc.exists:
-                        book_data = book_doc.to_dict()
-                        book_data['id'] = book_doc.id
-                
-                if book_data:
-                    book_data['library_record_id'] = record_doc.id
-                    book_data['student_id'] = record_data.get('student_id')
-                    book_data['lent_to'] = record_data.get('student_name', 'Unknown')
-                    book_data['lent_date'] = record_data.get('lent_date')
-                    book_data['due_date'] = record_data.get('due_date')
-                    self.display_return_book_info(book_data)
-                    return
-            
-            # No book found
-            messagebox.showerror("Book Not Found", f"No book with ID '{book_id}' is currently checked out.")
+            self.display_return_book_info(self.station.find_lent_book(book_id))
             
+        except StationError as e:
+            messagebox.showerror(e.title, e.message)
         except Exception as e:
             print(f"Error finding book: {e}")
             import traceback
@@ -559,130 +319,10 @@ class LibraryUI:
             self.root.config(cursor="wait")
             self.root.update()
             
-            book_id = self.return_book_data['id']  # This is the document ID
-            book_id_field = self.return_book_data.get('book_id', book_id)  # Use the book_id field if available
-            
-            # Create a batch for all Firestore operations
-            batch = self.db.batch()
-            
-            # Update book status to available
-            book_ref = self.db.collection('books').document(book_id)
-            book_doc = book_ref.get()
-            
-            if not book_doc.exists:
-                self.root.config(cursor="")
-                messagebox.showerror("Error", "Book not found in database.")
-                return
-                
-            # Update book status
-            now = datetime.datetime.now()
-            return_date = now.strftime("%Y-%m-%d")
-            student_id = self.return_book_data.get('student_id')
-            student_name = self.return_book_data.get('lent_to', 'Unknown')
-            book_title = self.return_book_data.get('title', 'Unknown Book')
-            
-            # Add book update to batch
-            batch.update(book_ref, {
-                'status': 'available',
-                'lent_to': None,
-                'lent_date': None,
-                'due_date': None,
-                'available': True,
-                'last_updated': now
-            })
-            
-            # Track which records were updated
-            lending_record_id = None
-            library_record_updated = False
-            
-            # Process lending record - prefer the one in return_book_data
-            if 'lending_id' in self.return_book_data:
-                lending_ref = self.db.collection('lendings').document(self.return_book_data['lending_id'])
-                # Add lending update to batch
-                batch.update(lending_ref, {
-                    'status': 'returned',
-                    'return_date': return_date,
-                    'return_timestamp': now
-                })
-                lending_record_id = self.return_book_data['lending_id']
-            else:
-                # Try to find the lending record - limit to 1 to improve performance
-                lending_query = self.db.collection('lendings').where(
-                    filter=firestore.FieldFilter('book_id', '==', book_id_field)
-            ).where(
-                filter=firestore.FieldFilter('status', '==', 'lent')
-                ).limit(1)
-                
-                lending_results = list(lending_query.get())
-                
-                if lending_results:
-                    lending_doc = lending_results[0]
-                    lending_data = lending_doc.to_dict()
-                    student_id = lending_data.get('student_id', student_id)
-                    student_name = lending_data.get('student_name', student_name)
-                    lending_record_id = lending_doc.id
-                    
-                    # Add lending update to batch
-                    batch.update(lending_doc.reference, {
-                    'status': 'returned',
-                        'return_date': return_date,
-                    'return_timestamp': now
-                })
-                
-            # Update library_records if we have a library_record_id
-            if 'library_record_id' in self.return_book_data:
-                record_ref = self.db.collection('library_records').document(self.return_book_data['library_record_id'])
-                # Add record update to batch
-                batch.update(record_ref, {
-                    'status': 'returned',
-                    'return_date': return_date,
-                    'return_timestamp': now
-                })
-                library_record_updated = True
-            else:
-                # Only perform this query if no record ID was found earlier
-                # Limit to 3 records to improve performance (in case of duplicates)
-                records_query = self.db.collection('library_records').where(
-                    filter=firestore.FieldFilter('book_id', '==', book_id_field)
-                ).where(
-                    filter=firestore.FieldFilter('status', '==', 'lent')
-                ).limit(3)
-                
-                records_results = list(records_query.get())
-                
-                for record_doc in records_results:
-                    # Add each record update to batch
-                    batch.update(record_doc.reference, {
-                        'status': 'returned',
-                        'return_date': return_date,
-                        'return_timestamp': now
-                    })
-                    library_record_updated = True
-            
-            # Create a single return record
-            return_data = {
-                'book_id': book_id_field,
-                'book_title': book_title,
-                'student_id': student_id,
-                'student_name': student_name,
-                'return_date': return_date,
-                'return_timestamp': now,
-                'status': 'return_record',
-                'lending_record_id': lending_record_id,
-                'activity_type': 'book_return'
-            }
-            
-            # Add to returns collection
-            return_doc_ref = self.db.collection('returns').document()
-            batch.set(return_doc_ref, return_data)
-            
-            # Only add to library_records if no existing record was updated
-            if not library_record_updated:
-                library_record_ref = self.db.collection('library_records').document()
-                batch.set(library_record_ref, return_data)
-            
-            # Commit all changes at once
-            batch.commit()
+            return_data = self.station.return_book(self.return_book_data)
+            book_id_field = return_data['book_id']
+            student_id = return_data['student_id']
+            book_title = return_data['book_title']
             
             # Reset cursor
             self.root.config(cursor="")
@@ -707,6 +347,9 @@ class LibraryUI:
             # Note: We don't refresh the UI here anymore - it will be refreshed when 
             # the recommendation window is closed via the _close_recommendation_window method
             
+        except StationError as e:
+            self.root.config(cursor="")
+            messagebox.showerror(e.title, e.message)
         except Exception as e:
             # Reset cursor
             self.root.config(cursor="")
@@ -1035,8 +678,7 @@ class LibraryUI:
     def show_check_books_ui(self):
         """Show interface to check books lent to a student"""
         # Clear the window
-        for widget in self.root.winfo_children():
-            widget.destroy()
+        clear_screen(self.root)
             
         check_frame = ttk.Frame(self.root, padding=20)
         check_frame.pack(fill=tk.BOTH, expand=True)
@@ -1177,8 +819,7 @@ class LibraryUI:
     def show_manage_books_ui(self):
         """Show interface to manage books"""
         # Clear the window
-        for widget in self.root.winfo_children():
-            widget.destroy()
+        clear_screen(self.root)
             
         manage_frame = ttk.Frame(self.root, padding=20)
         manage_frame.pack(fill=tk.BOTH, expand=True)
@@ -1208,8 +849,7 @@ class LibraryUI:
     def show_add_book_ui(self):
         """Show interface to add a new book"""
         # Clear the window
-        for widget in self.root.winfo_children():
-            widget.destroy()
+        clear_screen(self.root)
             
         add_frame = ttk.Frame(self.root, padding=20)
         add_frame.pack(fill=tk.BOTH, expand=True)
@@ -1324,11 +964,7 @@ class LibraryUI:
             return
         
         # Check if book ID already exists
-        book_ref = self.db.collection('books').where(
-            filter=firestore.FieldFilter('book_id', '==', book_id)
-        ).limit(1).get()
-        
-        if book_ref:
+        if self.catalog.get_book(book_id):
             messagebox.showerror("Error", f"Book with ID {book_id} already exists!")
             return
         
@@ -1343,12 +979,14 @@ class LibraryUI:
             'isbn': isbn if isbn else None,
             'quantity': quantity,
             'available': True,
-            'added_on': datetime.datetime.now()
+            'added_on': datetime.datetime.now(),
+            'updated_at': firestore.SERVER_TIMESTAMP
         }
         
         # Save to database
         try:
-            self.db.collection('books').add(book_data)
+            _, book_ref = self.db.collection('books').add(book_data)
+            self.catalog.apply(book_ref.id, book_data)
             messagebox.showinfo("Success", f"Book '{title}' added successfully!")
             self.show_manage_books_ui()
         except Exception as e:
@@ -1357,8 +995,7 @@ class LibraryUI:
     def show_edit_book_ui(self):
         """Show interface to edit a book"""
         # Clear the window
-        for widget in self.root.winfo_children():
-            widget.destroy()
+        clear_screen(self.root)
             
         edit_frame = ttk.Frame(self.root, padding=20)
         edit_frame.pack(fill=tk.BOTH, expand=True)
@@ -1406,19 +1043,15 @@ class LibraryUI:
         
         # Find book by ID
         try:
-            book_query = self.db.collection('books').where(
-                filter=firestore.FieldFilter('book_id', '==', book_id)
-            ).limit(1).get()
+            book_data = self.catalog.get_book(book_id)
             
-            if not book_query or len(book_query) == 0:
+            if not book_data:
                 ttk.Label(self.edit_details_frame, text=f"No book found with ID {book_id}.", 
                         foreground="red").pack(anchor=tk.W, pady=5)
                 return
             
             # Store document reference for later update
-            book_doc = book_query[0]
-            self.current_edit_book_ref = book_doc.reference
-            book_data = book_doc.to_dict()
+            self.current_edit_book_ref = self.db.collection('books').document(book_data['id'])
             
             # Display and allow editing of book details
             form_frame = ttk.Frame(self.edit_details_frame)
@@ -1554,12 +1187,14 @@ class LibraryUI:
             'isbn': isbn if isbn else None,
             'quantity': quantity,
             'available': available,
-            'last_updated': datetime.datetime.now()
+            'last_updated': datetime.datetime.now(),
+            'updated_at': firestore.SERVER_TIMESTAMP
         }
         
         # Update in database
         try:
             self.current_edit_book_ref.update(update_data)
+            self.catalog.apply(self.current_edit_book_ref.id, update_data)
             messagebox.showinfo("Success", f"Book '{title}' updated successfully!")
             self.show_manage_books_ui()
         except Exception as e:
@@ -1597,6 +1232,7 @@ class LibraryUI:
         # Delete the book
         try:
             self.current_edit_book_ref.delete()
+            self.catalog.discard(self.current_edit_book_ref.id)
             messagebox.showinfo("Success", "Book deleted successfully!")
             self.show_manage_books_ui()
         except Exception as e:
@@ -1605,8 +1241,7 @@ class LibraryUI:
     def show_list_books_ui(self):
         """Show interface to list all books"""
         # Clear the window
-        for widget in self.root.winfo_children():
-            widget.destroy()
+        clear_screen(self.root)
             
         list_frame = ttk.Frame(self.root, padding=20)
         list_frame.pack(fill=tk.BOTH, expand=True)
@@ -1656,31 +1291,31 @@ class LibraryUI:
         books_frame = ttk.Frame(list_frame)
         books_frame.pack(fill=tk.BOTH, expand=True, pady=10)
         
-        # Create treeview for books
-        columns = ('id', 'title', 'author', 'category', 'status', 'quantity')
-        self.books_tree = ttk.Treeview(books_frame, columns=columns, show='headings')
-        
-        # Define headings
-        self.books_tree.heading('id', text='Book ID')
-        self.books_tree.heading('title', text='Title')
-        self.books_tree.heading('author', text='Author')
-        self.books_tree.heading('category', text='Category')
-        self.books_tree.heading('status', text='Status')
-        self.books_tree.heading('quantity', text='Quantity')
-        
-        # Column widths
-        self.books_tree.column('id', width=80)
-        self.books_tree.column('title', width=250)
-        self.books_tree.column('author', width=150)
-        self.books_tree.column('category', width=120)
-        self.books_tree.column('status', width=80)
-        self.books_tree.column('quantity', width=70)
-        
-        # Add scrollbar
-        scrollbar = ttk.Scrollbar(books_frame, orient=tk.VERTICAL, command=self.books_tree.yview)
-        self.books_tree.configure(yscroll=scrollbar.set)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        self.books_tree.pack(fill=tk.BOTH, expand=True)
+        # Status message
+        self.status_var = tk.StringVar()
+        
+        # Books come from the local catalog mirror; filters and sort run in memory
+        columns = [('id', 'Book ID', 80), ('title', 'Title', 250), ('author', 'Author', 150),
+                   ('category', 'Category', 120), ('status', 'Status', 80), ('quantity', 'Quantity', 70)]
+        self.books_list = VirtualTreeview(
+            books_frame, columns,
+            query_factory=None,
+            rows_factory=self._catalog_books,
+            row_builder=lambda doc_id, book: (
+                book.get('book_id', ''),
+                book.get('title', ''),
+                book.get('author', ''),
+                book.get('category', ''),
+                "Available" if book.get('available', True) else "Borrowed",
+                book.get('quantity', 1)
+            ),
+            sort_fields={'title': 'title', 'author': 'author'},
+            default_sort='title',
+            row_filter=self._book_matches_filters,
+            status_callback=self.status_var.set
+        )
+        self.books_list.pack(fill=tk.BOTH, expand=True)
+        self.books_tree = self.books_list.tree
         
         # Add double-click event to view book details
         self.books_tree.bind("<Double-1>", self.view_book_details)
@@ -1704,13 +1339,8 @@ class LibraryUI:
                              command=self.show_manage_books_ui)
         back_btn.pack(side=tk.RIGHT, pady=10)
         
-        # Status message
-        self.status_var = tk.StringVar()
         status_label = ttk.Label(list_frame, textvariable=self.status_var)
         status_label.pack(pady=5)
-        
-        # Load initial books data
-        self.filter_books()
     
     def reset_filters(self):
         """Reset filters to default values"""
@@ -1719,72 +1349,36 @@ class LibraryUI:
         self.search_var.set("")
         self.filter_books()
     
+    def _catalog_books(self):
+        """Mirrored books in the selected category (the list sorts them)"""
+        category = self.category_filter_var.get()
+        return self.catalog.list_books(None if category == "All Categories" else category)
+    
+    def _book_matches_filters(self, book_data):
+        """Availability and search filters, applied to each book as the list loads"""
+        search_term = self.search_var.get().lower().strip()
+        if search_term:
+            title = str(book_data.get('title', '')).lower()
+            author = str(book_data.get('author', '')).lower()
+            book_id = str(book_data.get('book_id', '')).lower()
+            
+            if (search_term not in title and 
+                search_term not in author and 
+                search_term not in book_id):
+                return False
+        
+        availability = self.status_filter_var.get()
+        is_available = book_data.get('available', True)
+        if availability == "Available" and not is_available:
+            return False
+        elif availability == "Borrowed" and is_available:
+            return False
+        return True
+    
     def filter_books(self):
         """Filter books by category, availability and search term"""
         try:
-            # Clear existing data
-            for item in self.books_tree.get_children():
-                self.books_tree.delete(item)
-                
-            # Get filter values
-            category = self.category_filter_var.get()
-            availability = self.status_filter_var.get()
-            search_term = self.search_var.get().lower().strip()
-            
-            # Fetch books
-            query = self.db.collection('books')
-            
-            # Apply category filter in query if needed
-            if category != "All Categories":
-                query = query.where(
-                    filter=firestore.FieldFilter('category', '==', category)
-                )
-                
-            # Execute query
-            books = list(query.get())
-            
-            # Filter results in memory based on search term and availability
-            filtered_books = []
-            for book in books:
-                book_data = book.to_dict()
-                
-                # Apply search filter if provided
-                if search_term:
-                    title = str(book_data.get('title', '')).lower()
-                    author = str(book_data.get('author', '')).lower()
-                    book_id = str(book_data.get('book_id', '')).lower()
-                    
-                    if (search_term not in title and 
-                        search_term not in author and 
-                        search_term not in book_id):
-                        continue
-                
-                # Apply availability filter
-                is_available = book_data.get('available', True)
-                if availability == "Available" and not is_available:
-                    continue
-                elif availability == "Borrowed" and is_available:
-                    continue
-                
-                filtered_books.append(book_data)
-            
-            # Sort books by title
-            filtered_books.sort(key=lambda x: x.get('title', '').lower())
-            
-            # Display books in treeview
-            for book in filtered_books:
-                status = "Available" if book.get('available', True) else "Borrowed"
-                self.books_tree.insert('', tk.END, values=(
-                    book.get('book_id', ''),
-                    book.get('title', ''),
-                    book.get('author', ''),
-                    book.get('category', ''),
-                    status,
-                    book.get('quantity', 1)
-                ))
-            
-            self.status_var.set(f"Found {len(filtered_books)} books matching your criteria.")
-            
+            self.books_list.reload()
         except Exception as e:
             self.status_var.set(f"Error loading books: {e}")
     
@@ -1795,23 +1389,17 @@ class LibraryUI:
         if not selection:
             return
         
-        # Get book ID from selected item
-        item = self.books_tree.item(selection[0])
-        book_id = item['values'][0]
+        # Rows are keyed by document ID
+        doc_id = selection[0]
         
-        # Find book in database
+        # Find book in the catalog mirror
         try:
-            book_query = self.db.collection('books').where(
-                filter=firestore.FieldFilter('book_id', '==', book_id)
-            ).limit(1).get()
+            book_data = self.catalog.get(doc_id)
             
-            if not book_query or len(book_query) == 0:
+            if not book_data:
                 messagebox.showerror("Error", "Book not found in database.")
                 return
             
-            book_doc = book_query[0]
-            book_data = book_doc.to_dict()
-            
             # Display book details in a popup
             details = f"Book ID: {book_data.get('book_id', 'Unknown')}\n\n"
             details += f"Title: {book_data.get('title', 'Unknown')}\n\n"
@@ -1861,7 +1449,7 @@ class LibraryUI:
                 return  # User canceled
             
             # Get books data
-            books = self.db.collection('books').get()
+            books = self.catalog.list_books()
             
             # Write to CSV
             with open(filename, 'w', newline='') as csvfile:
@@ -1872,8 +1460,7 @@ class LibraryUI:
                                'Year', 'ISBN', 'Quantity', 'Status'])
                 
                 # Write data
-                for book in books:
-                    data = book.to_dict()
+                for _, data in books:
                     status = "Available" if data.get('available', True) else "Borrowed"
                     
                     writer.writerow([
@@ -1906,8 +1493,8 @@ class LibraryUI:
             # Group books by category
             categories = {}
             
-            for item in self.books_tree.get_children():
-                values = self.books_tree.item(item, 'values')
+            # The list only holds the rows scrolled to so far; the catalog needs all of them
+            for values in self.books_list.load_all():
                 book_id, title, author, category, status, quantity = values
                 
                 if category not in categories:
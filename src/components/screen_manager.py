@@ -0,0 +1,82 @@
+import tkinter as tk
+from tkinter import ttk
+
+class ScreenManager:
+    """
+    Keeps every screen built so far stacked in one container frame and raises
+    the requested one with tkraise, so going back to a screen only refreshes
+    its data-bound widgets instead of destroying and rebuilding all of them.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.container = None
+        self.screens = {}
+        self.current = None
+
+    def _ensure_container(self):
+        if self.container is None or not self.container.winfo_exists():
+            self.container = ttk.Frame(self.root)
+            self.container.grid_rowconfigure(0, weight=1)
+            self.container.grid_columnconfigure(0, weight=1)
+            self.screens = {}
+
+        # Screens that are not managed here pack straight into root; drop them
+        for widget in self.root.winfo_children():
+            if widget is not self.container:
+                widget.destroy()
+
+        if not self.container.winfo_manager():
+            self.container.pack(fill=tk.BOTH, expand=True)
+
+    def show(self, name, build, refresh=None, title=None):
+        """
+        Raise the named screen. build(frame) creates its widgets the first time
+        it is shown; refresh() runs on every visit to update the data shown.
+        """
+        self._ensure_container()
+
+        frame = self.screens.get(name)
+        if frame is None:
+            frame = ttk.Frame(self.container)
+            frame.grid(row=0, column=0, sticky='nsew')
+            build(frame)
+            self.screens[name] = frame
+
+        if title:
+            self.root.title(title)
+        if refresh:
+            refresh()
+        frame.tkraise()
+        self.current = name
+        return frame
+
+    def hide(self):
+        """Take the cached screens off the window without destroying them"""
+        if self.container is not None and self.container.winfo_exists():
+            self.container.pack_forget()
+        self.current = None
+
+    def discard(self, prefix):
+        """Destroy the cached screens whose names start with prefix"""
+        for name in [name for name in self.screens if name.startswith(prefix)]:
+            self.screens.pop(name).destroy()
+            if self.current == name:
+                self.current = None
+
+def get_screen_manager(root):
+    """The ScreenManager for a Tk root, created on first use"""
+    manager = getattr(root, '_screen_manager', None)
+    if manager is None:
+        manager = ScreenManager(root)
+        root._screen_manager = manager
+    return manager
+
+def clear_screen(root):
+    """Clear the window for a screen built from scratch, keeping the cached screens for later"""
+    manager = getattr(root, '_screen_manager', None)
+    for widget in root.winfo_children():
+        if manager is not None and widget is manager.container:
+            manager.hide()
+        else:
+            widget.destroy()
@@ -8,6 +8,9 @@ from firebase_admin import firestore
 # Add parent directory to path for imports
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from utils import validate_rfid, read_rfid_input, format_currency
+from calendar_service import attendance_summary
+from route_cache import get_route_cache
+from components.screen_manager import get_screen_manager
 
 class StudentUI:
     def __init__(self, root, db, go_back_callback=None):
@@ -15,36 +18,31 @@ class StudentUI:
         self.db = db
         self.go_back_callback = go_back_callback
         
-        # Clear the current window
-        for widget in self.root.winfo_children():
-            widget.destroy()
-            
-        self.root.title("RFID Student Wallet - Student Interface")
-        
-        # Create a frame for the main content
-        self.main_frame = ttk.Frame(self.root)
-        self.main_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=20)
+        # Screens are built once and raised again on every visit
+        self.screens = get_screen_manager(root)
+        self.screens.discard('student.')
         
         # Show the RFID input screen
         self.show_rfid_input()
     
     def show_rfid_input(self):
-        # Clear the main frame
-        for widget in self.main_frame.winfo_children():
-            widget.destroy()
-            
+        self.screens.show('student.rfid', self._build_rfid_input, refresh=self._reset_rfid_input,
+                          title="RFID Student Wallet - Student Interface")
+    
+    def _build_rfid_input(self, frame):
+        frame.configure(padding=20)
+        
         # Title
-        title_label = ttk.Label(self.main_frame, text="Student Information", font=("Helvetica", 16, "bold"))
+        title_label = ttk.Label(frame, text="Student Information", font=("Helvetica", 16, "bold"))
         title_label.pack(pady=10)
         
         # Frame for RFID input
-        rfid_frame = ttk.Frame(self.main_frame)
+        rfid_frame = ttk.Frame(frame)
         rfid_frame.pack(pady=20, fill=tk.X)
         
         ttk.Label(rfid_frame, text="Tap or Enter your RFID:").pack(side=tk.LEFT, padx=5)
         self.rfid_entry = ttk.Entry(rfid_frame, width=15)
         self.rfid_entry.pack(side=tk.LEFT, padx=5)
-        self.rfid_entry.focus()
         
         # Submit button
         ttk.Button(rfid_frame, text="Submit", 
@@ -55,9 +53,13 @@ class StudentUI:
         
         # Back button if callback exists
         if self.go_back_callback:
-            ttk.Button(self.main_frame, text="Back to Main Menu", 
+            ttk.Button(frame, text="Back to Main Menu", 
                       command=self.go_back_callback).pack(pady=20)
     
+    def _reset_rfid_input(self):
+        self.rfid_entry.delete(0, tk.END)
+        self.rfid_entry.focus()
+    
     def process_rfid(self):
         rfid = self.rfid_entry.get().strip()
         
@@ -87,16 +89,52 @@ class StudentUI:
             messagebox.showerror("Error", f"An error occurred: {str(e)}")
     
     def display_student_info(self, student):
-        # Clear the main frame
-        for widget in self.main_frame.winfo_children():
+        self.screens.show('student.info', self._build_student_info)
+        
+        # Student name and header
+        name = student.get('name', 'Unknown Student')
+        department = student.get('department', 'N/A')
+        year = student.get('year', 'N/A')
+        section = student.get('section', 'N/A')
+        rfid = student.get('rfid', 'N/A')
+        
+        self.info_vars['name'].set(name)
+        self.info_vars['details'].set(f"RFID: {rfid} | Department: {department} | Year: {year} | Section: {section}")
+        self.info_vars['rfid'].set(f"RFID: {rfid}")
+        self.info_vars['department'].set(f"Department: {department}")
+        self.info_vars['year'].set(f"Year: {year}")
+        self.info_vars['section'].set(f"Section: {section}")
+        self.info_vars['parent_email'].set(f"Parent's Email: {student.get('parent_email', 'N/A')}")
+        self.info_vars['balance'].set(f"Balance: {format_currency(student.get('wallet_balance', 0))}")
+        
+        # Attendance, library and bus sections vary in length, so they are rebuilt
+        for widget in self.services_frame.winfo_children():
             widget.destroy()
-            
+        
+        # Fetch and display attendance percentage
+        self.display_attendance_info(self.services_frame, student['id'])
+        
+        # Fetch and display library info
+        self.display_library_info(self.services_frame, student['id'])
+        
+        # Fetch and display bus info
+        self.display_bus_info(self.services_frame, student['id'])
+        
+        # Start at the top for every student
+        self.info_canvas.yview_moveto(0)
+        
+        # Fetch and display recent activity
+        self.load_recent_activity(self.activity_tree, student['id'])
+    
+    def _build_student_info(self, frame):
+        frame.configure(padding=20)
+        
         # Create a parent frame for both the scrollable area and the back button
-        parent_frame = ttk.Frame(self.main_frame)
+        parent_frame = ttk.Frame(frame)
         parent_frame.pack(fill=tk.BOTH, expand=True)
         
         # Create a separate frame for the back button at the bottom
-        button_frame = ttk.Frame(self.main_frame)
+        button_frame = ttk.Frame(frame)
         button_frame.pack(side=tk.BOTTOM, fill=tk.X, pady=10)
         
         # Add the back button to the bottom frame (this will always be visible)
@@ -107,6 +145,7 @@ class StudentUI:
         canvas = tk.Canvas(parent_frame)
         scrollbar = ttk.Scrollbar(parent_frame, orient="vertical", command=canvas.yview)
         scrollable_frame = ttk.Frame(canvas)
+        self.info_canvas = canvas
         
         # Configure the canvas
         scrollable_frame.bind(
@@ -132,9 +171,9 @@ class StudentUI:
         canvas.configure(yscrollcommand=scrollbar.set)
         
         # Set minimum sizes to ensure scrolling works properly
-        self.main_frame.update_idletasks()
-        width = self.main_frame.winfo_width()
-        height = self.main_frame.winfo_height() - 50  # Reserve space for back button
+        self.root.update_idletasks()
+        width = self.root.winfo_width() - 40
+        height = self.root.winfo_height() - 90  # Reserve space for padding and back button
         canvas.config(width=width-20, height=height)
         
         # Pack the scrollbar and canvas
@@ -145,23 +184,19 @@ class StudentUI:
         info_frame = ttk.Frame(scrollable_frame)
         info_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
         
+        # Labels are bound to these and updated for each student
+        self.info_vars = {key: tk.StringVar() for key in
+                          ('name', 'details', 'rfid', 'department', 'year', 'section', 'parent_email', 'balance')}
+        
         # Create header with student info
         header_frame = ttk.Frame(info_frame)
         header_frame.pack(fill=tk.X)
         
-        # Student name and header
-        name = student.get('name', 'Unknown Student')
-        department = student.get('department', 'N/A')
-        year = student.get('year', 'N/A')
-        section = student.get('section', 'N/A')
-        rfid = student.get('rfid', 'N/A')
-        
         # Main header with student name
-        ttk.Label(header_frame, text=name, font=("Helvetica", 16, "bold")).pack(anchor=tk.W)
+        ttk.Label(header_frame, textvariable=self.info_vars['name'], font=("Helvetica", 16, "bold")).pack(anchor=tk.W)
         
         # Student details
-        details_text = f"RFID: {rfid} | Department: {department} | Year: {year} | Section: {section}"
-        ttk.Label(header_frame, text=details_text).pack(anchor=tk.W, pady=(0, 10))
+        ttk.Label(header_frame, textvariable=self.info_vars['details']).pack(anchor=tk.W, pady=(0, 10))
         
         # Create a frame with two columns
         details_frame = ttk.Frame(info_frame)
@@ -172,28 +207,20 @@ class StudentUI:
         left_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=5)
         
         ttk.Label(left_frame, text="Personal Details:", font=("Helvetica", 12, "bold")).pack(anchor=tk.W, pady=(0, 5))
-        ttk.Label(left_frame, text=f"RFID: {student.get('rfid', 'N/A')}").pack(anchor=tk.W, pady=2)
-        ttk.Label(left_frame, text=f"Department: {student.get('department', 'N/A')}").pack(anchor=tk.W, pady=2)
-        ttk.Label(left_frame, text=f"Year: {student.get('year', 'N/A')}").pack(anchor=tk.W, pady=2)
-        ttk.Label(left_frame, text=f"Section: {student.get('section', 'N/A')}").pack(anchor=tk.W, pady=2)
-        ttk.Label(left_frame, text=f"Parent's Email: {student.get('parent_email', 'N/A')}").pack(anchor=tk.W, pady=2)
+        for key in ('rfid', 'department', 'year', 'section', 'parent_email'):
+            ttk.Label(left_frame, textvariable=self.info_vars[key]).pack(anchor=tk.W, pady=2)
         
         # Right column - Wallet & Services
         right_frame = ttk.Frame(details_frame)
         right_frame.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True, padx=5)
         
         ttk.Label(right_frame, text="Wallet:", font=("Helvetica", 12, "bold")).pack(anchor=tk.W, pady=(0, 5))
-        ttk.Label(right_frame, text=f"Balance: {format_currency(student.get('wallet_balance', 0))}", 
+        ttk.Label(right_frame, textvariable=self.info_vars['balance'], 
                  font=("Helvetica", 12)).pack(anchor=tk.W, pady=2)
         
-        # Fetch and display attendance percentage
-        self.display_attendance_info(right_frame, student['id'])
-        
-        # Fetch and display library info
-        self.display_library_info(right_frame, student['id'])
-        
-        # Fetch and display bus info
-        self.display_bus_info(right_frame, student['id'])
+        # Attendance, library and bus info are filled in per student
+        self.services_frame = ttk.Frame(right_frame)
+        self.services_frame.pack(fill=tk.BOTH, expand=True)
         
         # Recent Activity
         activity_frame = ttk.Frame(info_frame)
@@ -222,15 +249,12 @@ class StudentUI:
         # Pack the treeview and scrollbar
         tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         tree_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        
-        # Fetch and display recent activity
-        self.load_recent_activity(tree, student['id'])
+        self.activity_tree = tree
     
     def display_attendance_info(self, parent_frame, student_id):
         try:
             # Get attendance records for this month
-            today = datetime.datetime.now()
-            first_day = datetime.datetime(today.year, today.month, 1)
+            today = datetime.date.today()
             
             attendance_ref = self.db.collection('attendance')
             # Instead of using timestamp filtering with where clause, we'll fetch all and filter in memory
@@ -238,57 +262,17 @@ class StudentUI:
             
             results = query.get()
             
-            # Count attendance days after filtering in memory
-            present_days = 0
-            
-            # Track dates to handle potential duplicate entries
+            # Dates present this month; the calendar service decides which of them count
+            month_prefix = today.strftime("%Y-%m-")
             present_dates = set()
-            
             for doc in results:
                 data = doc.to_dict()
-                # Filter by date in memory - ensure naive datetime comparison
-                timestamp = data.get('timestamp')
-                if timestamp:
-                    # Convert to naive datetime if it's timezone-aware
-                    if hasattr(timestamp, 'tzinfo') and timestamp.tzinfo is not None:
-                        timestamp = timestamp.replace(tzinfo=None)
-                    
-                    if timestamp >= first_day:
-                        # Use date string to avoid duplicates
-                        date_str = data.get('date')
-                        if date_str and date_str not in present_dates:
-                            present_dates.add(date_str)
-                            if data.get('status') == 'present':
-                                present_days += 1
-            
-            # Calculate working days in the month (excluding weekends)
-            year = today.year
-            month = today.month
-            
-            # Get days in month
-            days_in_month = 0
-            if month in [1, 3, 5, 7, 8, 10, 12]:
-                days_in_month = 31
-            elif month in [4, 6, 9, 11]:
-                days_in_month = 30
-            elif month == 2:
-                # Simple leap year check
-                if year % 4 == 0 and (year % 100 != 0 or year % 400 == 0):
-                    days_in_month = 29
-                else:
-                    days_in_month = 28
-            
-            # For this implementation, we'll consider working days as weekdays (Mon-Fri)
-            working_days = 0
-            for day in range(1, days_in_month + 1):
-                date = datetime.datetime(year, month, day)
-                # Only count weekdays (0 = Monday, 6 = Sunday)
-                if date.weekday() < 5:  # 0-4 are weekdays
-                    working_days += 1
-            
-            # Calculate percentage
-            percentage = (present_days / working_days * 100) if working_days > 0 else 0
-            
+                date_str = data.get('date')
+                if date_str and date_str.startswith(month_prefix) and data.get('status', 'present') == 'present':
+                    present_dates.add(date_str)
+
+            present_days, working_days, percentage = attendance_summary(present_dates, today.year, today.month)
+
             ttk.Label(parent_frame, text="Attendance:", font=("Helvetica", 12, "bold")).pack(anchor=tk.W, pady=(10, 5))
             ttk.Label(parent_frame, text=f"{present_days}/{working_days} days ({percentage:.1f}%)").pack(anchor=tk.W, pady=2)
             
@@ -386,14 +370,10 @@ class StudentUI:
                 ttk.Label(parent_frame, text="Transport:", font=("Helvetica", 12, "bold")).pack(anchor=tk.W, pady=(10, 5))
                 
                 if bus_route_id:
-                    # Get route details by route_id field
-                    query = self.db.collection('bus_routes').where(
-                        filter=firestore.FieldFilter('route_id', '==', bus_route_id)
-                    ).limit(1)
-                    routes = query.get()
+                    # Get route details from the shared route cache
+                    route_info = get_route_cache(self.db).get(bus_route_id)
                     
-                    if routes and len(routes) > 0:
-                        route_info = routes[0].to_dict()
+                    if route_info:
                         route_name = route_info.get('name', 'Unknown')
                         
                         ttk.Label(parent_frame, text=f"Route: {route_name}").pack(anchor=tk.W, pady=2)
@@ -666,13 +646,4 @@ class StudentUI:
 
     def show_student_menu(self):
         """Show the student menu after viewing detailed info"""
-        # Clear the window
-        for widget in self.root.winfo_children():
-            widget.destroy()
-        
-        # Recreate the main frame
-        self.main_frame = ttk.Frame(self.root)
-        self.main_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=20)
-        
-        # Show the RFID input screen
-        self.show_rfid_input() 
\ No newline at end of file
+        self.show_rfid_input()
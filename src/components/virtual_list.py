@@ -0,0 +1,203 @@
+import tkinter as tk
+from tkinter import ttk
+from firebase_admin import firestore
+
+class VirtualTreeview(ttk.Frame):
+    """
+    Treeview over a Firestore query that only renders the rows in view.
+    Rows are fetched a page at a time with cursor queries as the user scrolls,
+    and clicking a sortable heading re-queries with order_by on that field.
+    """
+
+    def __init__(self, parent, columns, query_factory, row_builder, sort_fields=None, default_sort=None,
+                 row_filter=None, page_size=100, height=15, status_callback=None, rows_factory=None):
+        """
+        columns: list of (column, heading, width)
+        query_factory(): base query (filters only) to page through
+        row_builder(doc_id, data): tuple of column values for a document
+        sort_fields: {column: Firestore field} for columns that can be sorted server-side
+        row_filter(data): optional client-side filter for conditions Firestore cannot index
+        rows_factory(): [(doc_id, data)] already held in memory, used instead of query_factory
+        """
+        super().__init__(parent)
+        self.query_factory = query_factory
+        self.rows_factory = rows_factory
+        self.row_builder = row_builder
+        self.sort_fields = sort_fields or {}
+        self.row_filter = row_filter
+        self.page_size = page_size
+        self.height = height
+        self.status_callback = status_callback
+
+        self.sort_column = default_sort
+        self.sort_descending = False
+
+        self.tree = ttk.Treeview(self, columns=[c[0] for c in columns], show='headings', height=height)
+        self.headings = {}
+        for column, heading, width in columns:
+            self.headings[column] = heading
+            self.tree.column(column, width=width)
+            if column in self.sort_fields:
+                self.tree.heading(column, text=heading, command=lambda c=column: self.sort_by(c))
+            else:
+                self.tree.heading(column, text=heading)
+
+        self.scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self._on_scrollbar)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        # Scrolling moves the window over self.rows instead of the Treeview's own view
+        self.tree.bind('<MouseWheel>', lambda e: self.scroll(-1 if e.delta > 0 else 1))
+        self.tree.bind('<Button-4>', lambda e: self.scroll(-1))
+        self.tree.bind('<Button-5>', lambda e: self.scroll(1))
+        self.tree.bind('<Up>', self._on_key_up)
+        self.tree.bind('<Down>', self._on_key_down)
+        self.tree.bind('<Prior>', lambda e: self.scroll(-self.height) or 'break')
+        self.tree.bind('<Next>', lambda e: self.scroll(self.height) or 'break')
+        self.tree.bind('<Configure>', self._on_resize)
+
+        self.reload()
+
+    def _update_headings(self):
+        for column, heading in self.headings.items():
+            if column == self.sort_column:
+                heading += " ▼" if self.sort_descending else " ▲"
+            self.tree.heading(column, text=heading)
+
+    def reload(self):
+        """Start again from the first page (after the filters or sort changed)"""
+        self.rows = []
+        self.offset = 0
+        self.cursor = None
+        self.exhausted = False
+        self.error = None
+        self._update_headings()
+        self._ensure_rows(self.height * 2)
+        self.render()
+
+    def sort_by(self, column):
+        if self.sort_column == column:
+            self.sort_descending = not self.sort_descending
+        else:
+            self.sort_column = column
+            self.sort_descending = False
+        self.reload()
+
+    def _page_query(self):
+        query = self.query_factory()
+        field = self.sort_fields.get(self.sort_column)
+        if field:
+            direction = firestore.Query.DESCENDING if self.sort_descending else firestore.Query.ASCENDING
+            query = query.order_by(field, direction=direction)
+        query = query.limit(self.page_size)
+        if self.cursor is not None:
+            query = query.start_after(self.cursor)
+        return query
+
+    def _ensure_rows(self, count):
+        """Fetch pages until at least count rows are loaded or the query runs out"""
+        if self.rows_factory is not None and not self.exhausted:
+            self._load_local_rows()
+        while len(self.rows) < count and not self.exhausted:
+            try:
+                docs = list(self._page_query().stream())
+            except Exception as e:
+                self.error = e
+                self.exhausted = True
+                print(f"Error loading rows: {e}")
+                break
+
+            for doc in docs:
+                data = doc.to_dict()
+                if self.row_filter is None or self.row_filter(data):
+                    self.rows.append((doc.id, self.row_builder(doc.id, data)))
+            if len(docs) < self.page_size:
+                self.exhausted = True
+            else:
+                self.cursor = docs[-1]
+
+    def _load_local_rows(self):
+        """Take every row from rows_factory at once, sorted in memory"""
+        try:
+            docs = list(self.rows_factory())
+        except Exception as e:
+            self.error = e
+            print(f"Error loading rows: {e}")
+            docs = []
+        field = self.sort_fields.get(self.sort_column)
+        if field:
+            docs.sort(key=lambda doc: str(doc[1].get(field, '')).lower(), reverse=self.sort_descending)
+        self.rows = [(doc_id, self.row_builder(doc_id, data)) for doc_id, data in docs
+                     if self.row_filter is None or self.row_filter(data)]
+        self.exhausted = True
+
+    def load_all(self):
+        """Fetch every remaining page (for printing or exporting what the list shows)"""
+        self._ensure_rows(float('inf'))
+        self.render()
+        return [values for _, values in self.rows]
+
+    def render(self):
+        """Show rows[offset:offset + height] and update the scrollbar"""
+        selected = set(self.tree.selection())
+        self.tree.delete(*self.tree.get_children())
+        for iid, values in self.rows[self.offset:self.offset + self.height]:
+            self.tree.insert('', tk.END, iid=iid, values=values)
+            if iid in selected:
+                self.tree.selection_add(iid)
+
+        # While more pages exist the total is unknown; leave room below the loaded rows
+        total = max(len(self.rows) + (0 if self.exhausted else self.page_size), 1)
+        self.scrollbar.set(self.offset / total, min(1.0, (self.offset + self.height) / total))
+
+        if self.status_callback:
+            if self.error is not None:
+                status = f"Error loading rows: {self.error}"
+            elif self.exhausted:
+                status = f"{len(self.rows)} rows"
+            else:
+                status = f"{len(self.rows)} rows loaded, scroll for more"
+            if self.rows_factory is None and self.sort_fields.get(self.sort_column):
+                # Firestore's order_by leaves out every document that lacks the sort field
+                status += f" (rows without a {self.headings[self.sort_column]} are not shown while sorted by it)"
+            self.status_callback(status)
+
+    def scroll(self, rows):
+        # Prefetch a page ahead of the window so scrolling does not wait on the network
+        self._ensure_rows(self.offset + rows + self.height * 2)
+        new_offset = max(0, min(self.offset + rows, len(self.rows) - self.height))
+        if new_offset != self.offset:
+            self.offset = new_offset
+            self.render()
+
+    def _on_scrollbar(self, *args):
+        if args[0] == 'moveto':
+            total = len(self.rows) + (0 if self.exhausted else self.page_size)
+            self.scroll(int(float(args[1]) * total) - self.offset)
+        elif args[0] == 'scroll':
+            amount = int(args[1])
+            self.scroll(amount * self.height if args[2] == 'pages' else amount)
+
+    def _on_key_up(self, event):
+        children = self.tree.get_children()
+        if children and self.tree.focus() == children[0]:
+            self.scroll(-1)
+            self.tree.focus(self.tree.get_children()[0])
+            return 'break'
+
+    def _on_key_down(self, event):
+        children = self.tree.get_children()
+        if children and self.tree.focus() == children[-1]:
+            self.scroll(1)
+            self.tree.focus(self.tree.get_children()[-1])
+            return 'break'
+
+    def _on_resize(self, event):
+        # Render as many rows as fit in the Treeview at its current size
+        row_height = int(ttk.Style().lookup('Treeview', 'rowheight') or 20)
+        height = max(1, (event.height - row_height - 4) // row_height)
+        if height != self.height:
+            self.height = height
+            self._ensure_rows(self.offset + height * 2)
+            self.offset = max(0, min(self.offset, len(self.rows) - self.height))
+            self.render()
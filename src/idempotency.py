@@ -0,0 +1,48 @@
+import threading
+import time
+import uuid
+
+# How long a tap blocks an identical tap, in seconds
+DEDUPE_SECONDS = 5.0
+
+# Expired entries are pruned once the table grows past this size
+MAX_ENTRIES = 10000
+
+class TapDeduplicator:
+    """Reject a repeat of the same (rfid, station, action) within a short window"""
+
+    def __init__(self, window=DEDUPE_SECONDS):
+        self.window = window
+        self.lock = threading.Lock()
+        self.expires = {}
+
+    def claim(self, rfid, station, action, window=None):
+        """Record a tap; returns False if the same tap was already claimed in the window"""
+        window = self.window if window is None else window
+        now = time.monotonic()
+        key = (rfid, station, action)
+
+        with self.lock:
+            expires_at = self.expires.get(key)
+            if expires_at is not None and expires_at > now:
+                return False
+            self.expires[key] = now + window
+
+            if len(self.expires) > MAX_ENTRIES:
+                self.expires = {k: t for k, t in self.expires.items() if t > now}
+        return True
+
+    def release(self, rfid, station, action):
+        """Forget a claimed tap so it can be retried (e.g. after the write failed)"""
+        with self.lock:
+            self.expires.pop((rfid, station, action), None)
+
+def new_idempotency_key():
+    """Token identifying one intended operation; reuse it when retrying that operation"""
+    return uuid.uuid4().hex
+
+_deduplicator = TapDeduplicator()
+
+def get_tap_deduplicator():
+    """Process-wide deduplicator shared by the UI, the headless service and the readers"""
+    return _deduplicator
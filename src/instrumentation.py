@@ -0,0 +1,371 @@
+import datetime
+import json
+import os
+import sys
+import threading
+import time
+
+from profiling import record_span
+
+# Latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Periodic JSON dumps are enabled by setting FIRESTORE_METRICS_DUMP to a file path
+DUMP_PATH = os.environ.get("FIRESTORE_METRICS_DUMP")
+DUMP_INTERVAL = int(os.environ.get("FIRESTORE_METRICS_INTERVAL", "60"))
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+COMPONENTS_DIR = os.path.join(SRC_DIR, 'components')
+
+def estimate_size(value):
+    """Approximate Firestore storage size of a value in bytes"""
+    if value is None or isinstance(value, bool):
+        return 1
+    if isinstance(value, (int, float, datetime.datetime, datetime.date)):
+        return 8
+    if isinstance(value, str):
+        return len(value.encode('utf-8')) + 1
+    if isinstance(value, bytes):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(len(str(k)) + 1 + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_size(v) for v in value)
+    # GeoPoint, references and other special types
+    return 16
+
+def _find_caller():
+    """Name of the UI method (or failing that, the first app function) that issued a call"""
+    frame = sys._getframe(2)
+    fallback = None
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(SRC_DIR) and not filename.endswith('instrumentation.py'):
+            owner = frame.f_locals.get('self')
+            name = f"{type(owner).__name__}.{frame.f_code.co_name}" if owner is not None else \
+                f"{os.path.splitext(os.path.basename(filename))[0]}.{frame.f_code.co_name}"
+            if filename.startswith(COMPONENTS_DIR):
+                return name
+            if fallback is None:
+                fallback = name
+        frame = frame.f_back
+    return fallback or 'unknown'
+
+class FirestoreMetrics:
+    """Thread-safe counters of Firestore calls keyed by (caller, collection, operation)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started_at = datetime.datetime.now()
+        self.entries = {}
+
+    def record(self, caller, collection, op, docs, size, seconds):
+        key = (caller, collection, op)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                entry = {'calls': 0, 'docs': 0, 'bytes': 0, 'seconds': 0.0, 'max_seconds': 0.0,
+                         'buckets': [0] * len(LATENCY_BUCKETS)}
+                self.entries[key] = entry
+            entry['calls'] += 1
+            entry['docs'] += docs
+            entry['bytes'] += size
+            entry['seconds'] += seconds
+            entry['max_seconds'] = max(entry['max_seconds'], seconds)
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    entry['buckets'][i] += 1
+                    break
+
+        # Calls are recorded as they finish, so this span ends now
+        end = time.perf_counter()
+        record_span(f"firestore.{op}", 'firestore', end - seconds, end, collection=collection, docs=docs)
+
+    def reset(self):
+        with self.lock:
+            self.entries = {}
+            self.started_at = datetime.datetime.now()
+
+    def snapshot(self):
+        """List of per-key totals, most documents first"""
+        with self.lock:
+            rows = [
+                {'caller': caller, 'collection': collection, 'op': op, 'calls': e['calls'], 'docs': e['docs'],
+                 'bytes': e['bytes'], 'seconds': e['seconds'], 'max_seconds': e['max_seconds']}
+                for (caller, collection, op), e in self.entries.items()
+            ]
+        rows.sort(key=lambda row: row['docs'], reverse=True)
+        return rows
+
+    def to_json(self):
+        return json.dumps({
+            'since': self.started_at.isoformat(),
+            'generated_at': datetime.datetime.now().isoformat(),
+            'operations': self.snapshot()
+        }, indent=2)
+
+    def to_prometheus(self):
+        """Metrics in the Prometheus text exposition format"""
+        with self.lock:
+            items = [(key, dict(e, buckets=list(e['buckets']))) for key, e in self.entries.items()]
+
+        lines = [
+            "# HELP firestore_calls_total Firestore calls issued by the app",
+            "# TYPE firestore_calls_total counter",
+        ]
+        series = {'docs': [], 'bytes': [], 'latency': []}
+        for (caller, collection, op), e in items:
+            labels = f'caller="{caller}",collection="{collection}",op="{op}"'
+            lines.append(f"firestore_calls_total{{{labels}}} {e['calls']}")
+            series['docs'].append(f"firestore_documents_total{{{labels}}} {e['docs']}")
+            series['bytes'].append(f"firestore_bytes_total{{{labels}}} {e['bytes']}")
+
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, e['buckets']):
+                cumulative += count
+                series['latency'].append(f'firestore_latency_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            series['latency'].append(f'firestore_latency_seconds_bucket{{{labels},le="+Inf"}} {e["calls"]}')
+            series['latency'].append(f"firestore_latency_seconds_sum{{{labels}}} {e['seconds']:.6f}")
+            series['latency'].append(f"firestore_latency_seconds_count{{{labels}}} {e['calls']}")
+
+        lines += ["# HELP firestore_documents_total Documents read or written",
+                  "# TYPE firestore_documents_total counter"] + series['docs']
+        lines += ["# HELP firestore_bytes_total Approximate document bytes read or written",
+                  "# TYPE firestore_bytes_total counter"] + series['bytes']
+        lines += ["# HELP firestore_latency_seconds Firestore call latency",
+                  "# TYPE firestore_latency_seconds histogram"] + series['latency']
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path):
+        """Write the JSON snapshot atomically"""
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(self.to_json())
+        os.replace(tmp_path, path)
+
+def _unwrap(value):
+    if isinstance(value, (_Instrumented, _InstrumentedSnapshot)):
+        return value._target
+    if isinstance(value, _InstrumentedBatch):
+        return value._batch
+    return value
+
+def _unwrap_args(args, kwargs):
+    return [_unwrap(a) for a in args], {k: _unwrap(v) for k, v in kwargs.items()}
+
+def _snapshot_size(snapshot):
+    data = snapshot.to_dict() if snapshot.exists else None
+    return estimate_size(data) if data else 0
+
+class _InstrumentedSnapshot:
+    """Document snapshot whose reference stays instrumented"""
+
+    def __init__(self, target, metrics, collection):
+        self._target = target
+        self._metrics = metrics
+        self._collection = collection
+
+    @property
+    def reference(self):
+        return _Instrumented(self._target.reference, self._metrics, self._collection)
+
+    def __getattr__(self, name):
+        return getattr(self._target, name)
+
+class _Instrumented:
+    """Proxy over the Firestore client, references and queries that records every call"""
+
+    CHAINED = ('collection', 'document', 'where', 'limit', 'limit_to_last', 'order_by', 'start_after',
+               'start_at', 'end_before', 'end_at', 'offset', 'select')
+    WRITES = ('set', 'update', 'create', 'delete', 'add')
+
+    def __init__(self, target, metrics, collection=''):
+        self._target = target
+        self._metrics = metrics
+        self._collection = collection
+
+    def _wrap_snapshot(self, snapshot):
+        return _InstrumentedSnapshot(snapshot, self._metrics, self._collection)
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            if name == 'parent' and attr is not None:
+                return _Instrumented(attr, self._metrics, self._collection)
+            return attr
+
+        metrics = self._metrics
+        collection = self._collection
+
+        if name in self.CHAINED:
+            def chained(*args, **kwargs):
+                args, kwargs = _unwrap_args(args, kwargs)
+                label = collection
+                if name in ('collection', 'document') and args and isinstance(args[0], str):
+                    # Label with the top-level collection of the path
+                    label = collection or args[0].split('/')[0]
+                return _Instrumented(attr(*args, **kwargs), metrics, label)
+            return chained
+
+        if name in self.WRITES:
+            def write(*args, **kwargs):
+                args, kwargs = _unwrap_args(args, kwargs)
+                caller = _find_caller()
+                start = time.perf_counter()
+                try:
+                    return attr(*args, **kwargs)
+                finally:
+                    size = estimate_size(args[0]) if args and isinstance(args[0], dict) else 0
+                    metrics.record(caller, collection, name, 1, size, time.perf_counter() - start)
+            return write
+
+        if name == 'get':
+            def get(*args, **kwargs):
+                # Reads inside a transaction pass the (wrapped) transaction along
+                args, kwargs = _unwrap_args(args, kwargs)
+                caller = _find_caller()
+                start = time.perf_counter()
+                result = attr(*args, **kwargs)
+                elapsed = time.perf_counter() - start
+                if isinstance(result, list):
+                    size = sum(_snapshot_size(doc) for doc in result)
+                    # A query matching nothing is still billed as one read
+                    metrics.record(caller, collection, 'query', max(len(result), 1), size, elapsed)
+                    return [self._wrap_snapshot(doc) for doc in result]
+                metrics.record(caller, collection, 'get', 1, _snapshot_size(result), elapsed)
+                return self._wrap_snapshot(result)
+            return get
+
+        if name == 'stream':
+            def stream(*args, **kwargs):
+                args, kwargs = _unwrap_args(args, kwargs)
+                caller = _find_caller()
+                start = time.perf_counter()
+                docs = 0
+                size = 0
+                try:
+                    for doc in attr(*args, **kwargs):
+                        docs += 1
+                        size += _snapshot_size(doc)
+                        yield self._wrap_snapshot(doc)
+                finally:
+                    metrics.record(caller, collection, 'stream', max(docs, 1), size,
+                                   time.perf_counter() - start)
+            return stream
+
+        if name == 'batch':
+            return lambda: _InstrumentedBatch(attr(), metrics)
+
+        if name == 'transaction':
+            return lambda *args, **kwargs: _InstrumentedTransaction(attr(*args, **kwargs), metrics)
+
+        if name == 'get_all':
+            def get_all(refs, *args, **kwargs):
+                refs = [_unwrap(ref) for ref in refs]
+                caller = _find_caller()
+                label = refs[0].parent.id if refs else ''
+                start = time.perf_counter()
+                docs = 0
+                size = 0
+                try:
+                    for doc in attr(refs, *args, **kwargs):
+                        docs += 1
+                        size += _snapshot_size(doc)
+                        yield _InstrumentedSnapshot(doc, metrics, label)
+                finally:
+                    metrics.record(caller, label, 'get_all', docs, size, time.perf_counter() - start)
+            return get_all
+
+        return attr
+
+class _InstrumentedBatch:
+    """Write batch that records its documents and bytes when committed"""
+
+    def __init__(self, batch, metrics):
+        self._batch = batch
+        self._metrics = metrics
+        self._docs = 0
+        self._bytes = 0
+        self._collections = set()
+
+    def _add(self, method, ref, args, kwargs):
+        ref = _unwrap(ref)
+        args, kwargs = _unwrap_args(args, kwargs)
+        self._docs += 1
+        if args and isinstance(args[0], dict):
+            self._bytes += estimate_size(args[0])
+        self._collections.add(ref.parent.id)
+        method(ref, *args, **kwargs)
+        return self
+
+    def set(self, ref, *args, **kwargs):
+        return self._add(self._batch.set, ref, args, kwargs)
+
+    def update(self, ref, *args, **kwargs):
+        return self._add(self._batch.update, ref, args, kwargs)
+
+    def create(self, ref, *args, **kwargs):
+        return self._add(self._batch.create, ref, args, kwargs)
+
+    def delete(self, ref, *args, **kwargs):
+        return self._add(self._batch.delete, ref, args, kwargs)
+
+    def _record_commit(self, commit, args, kwargs):
+        caller = _find_caller()
+        start = time.perf_counter()
+        try:
+            return commit(*args, **kwargs)
+        finally:
+            label = ",".join(sorted(self._collections))
+            self._metrics.record(caller, label, 'commit', self._docs, self._bytes, time.perf_counter() - start)
+
+    def commit(self, *args, **kwargs):
+        return self._record_commit(self._batch.commit, args, kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._batch, name)
+
+class _InstrumentedTransaction(_InstrumentedBatch):
+    """Transaction whose writes are recorded like a batch; @firestore.transactional commits through _commit"""
+
+    def _commit(self, *args, **kwargs):
+        return self._record_commit(self._batch._commit, args, kwargs)
+
+    def _clean_up(self, *args, **kwargs):
+        # A retried attempt starts over with no writes
+        self._docs = 0
+        self._bytes = 0
+        self._collections = set()
+        return self._batch._clean_up(*args, **kwargs)
+
+_metrics = FirestoreMetrics()
+_dump_thread = None
+
+def get_metrics():
+    """Process-wide Firestore metrics"""
+    return _metrics
+
+def instrument(db):
+    """Wrap a Firestore client so every query and commit is recorded"""
+    if db is None or isinstance(db, _Instrumented):
+        return db
+    if DUMP_PATH:
+        start_json_dumps(DUMP_PATH, DUMP_INTERVAL)
+    return _Instrumented(db, _metrics)
+
+def start_json_dumps(path, interval=DUMP_INTERVAL):
+    """Write the metrics to a JSON file every interval seconds in a daemon thread"""
+    global _dump_thread
+    if _dump_thread is not None:
+        return
+
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                _metrics.dump(path)
+            except Exception as e:
+                print(f"Error writing Firestore metrics: {e}")
+
+    _dump_thread = threading.Thread(target=run, name="firestore-metrics", daemon=True)
+    _dump_thread.start()
@@ -0,0 +1,234 @@
+import asyncio
+import datetime
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from stations import (StationError, lookup_student, CanteenStation, BusStation,
+                      LibraryStation, ClassroomStation)
+from instrumentation import get_metrics
+
+# Station calls block on Firestore, so they run on this many worker threads
+DEFAULT_WORKERS = 16
+
+# Largest request body accepted, in bytes
+MAX_BODY = 64 * 1024
+
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                409: "Conflict", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+class KioskService:
+    """Station operations for headless kiosks, shared by every connected reader"""
+
+    def __init__(self, db):
+        self.db = db
+        self.canteen = CanteenStation(db)
+        self.library = LibraryStation(db)
+        self.bus_stations = {}
+        self.classrooms = {}
+        self.lock = threading.Lock()
+
+    def _bus_station(self, route_id):
+        with self.lock:
+            station = self.bus_stations.get(route_id)
+        if station is None:
+            station = BusStation(self.db, BusStation.find_route(self.db, route_id))
+            with self.lock:
+                self.bus_stations[route_id] = station
+        return station
+
+    def _classroom(self, payload):
+        key = (str(payload.get('department', '')).strip().upper(), str(payload.get('year', '')).strip(),
+               str(payload.get('section', '')).strip().upper())
+        with self.lock:
+            station = self.classrooms.get(key)
+        if station is None:
+            info = ClassroomStation.open_classroom(self.db, *key)
+            station = ClassroomStation(self.db, info)
+            with self.lock:
+                self.classrooms[key] = station
+        return station
+
+    def pay(self, payload):
+        student = lookup_student(self.db, payload.get('rfid'))
+        return self.canteen.pay(student, payload.get('amount'), payload.get('description', ''),
+                                payload.get('idempotency_key'))
+
+    def recharge(self, payload):
+        student = lookup_student(self.db, payload.get('rfid'))
+        return self.canteen.recharge(student, payload.get('amount'),
+                                     payload.get('description', 'Wallet Recharge'),
+                                     payload.get('idempotency_key'))
+
+    def board(self, payload):
+        station = self._bus_station(payload.get('route_id'))
+        student = lookup_student(self.db, payload.get('rfid'))
+        station.check_rider(student)
+        return station.board(student, payload.get('stop'), payload.get('idempotency_key'))
+
+    def offboard(self, payload):
+        station = self._bus_station(payload.get('route_id'))
+        student = lookup_student(self.db, payload.get('rfid'))
+        station.check_rider(student)
+        return station.offboard(student, payload.get('stop'), payload.get('idempotency_key'))
+
+    def manifest(self, payload):
+        return self._bus_station(payload.get('route_id')).manifest()
+
+    def lend(self, payload):
+        book_data = self.library.find_book_for_lending(payload.get('book_id'))
+        student = lookup_student(self.db, payload.get('rfid'))
+        return self.library.lend(book_data, student)
+
+    def return_book(self, payload):
+        return self.library.return_book(self.library.find_lent_book(payload.get('book_id')))
+
+    def mark_attendance(self, payload):
+        station = self._classroom(payload)
+        student = station.check_in(payload.get('rfid'))
+
+        # The headless service has no camera or display, so it is RFID-only unless a reader asks otherwise
+        if payload.get('verify_face', False):
+            if not station.verify(station.load_face_encodings(student)):
+                raise StationError("Verification Failed",
+                                   f"Face does not match registered data for {student.get('name')}.")
+            return station.mark_present(student)
+        return station.mark_present(student, verification_method='rfid_only')
+
+    def routes(self):
+        """Map of POST paths to handlers"""
+        return {
+            '/canteen/pay': self.pay,
+            '/canteen/recharge': self.recharge,
+            '/bus/board': self.board,
+            '/bus/offboard': self.offboard,
+            '/bus/manifest': self.manifest,
+            '/library/lend': self.lend,
+            '/library/return': self.return_book,
+            '/classroom/attendance': self.mark_attendance,
+        }
+
+def _json_default(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return str(value)
+
+class KioskServer:
+    """Minimal HTTP/JSON server over TCP or a Unix socket"""
+
+    def __init__(self, service, workers=DEFAULT_WORKERS):
+        self.service = service
+        self.routes = service.routes()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="station")
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+
+                lines = head.decode('latin-1').split("\r\n")
+                try:
+                    method, path, _ = lines[0].split(" ", 2)
+                except ValueError:
+                    await self._respond(writer, 400, {'ok': False, 'error': "Bad Request"}, False)
+                    break
+
+                headers = {}
+                for line in lines[1:]:
+                    if ":" in line:
+                        name, value = line.split(":", 1)
+                        headers[name.strip().lower()] = value.strip()
+
+                try:
+                    length = int(headers.get('content-length', 0) or 0)
+                    if length < 0:
+                        raise ValueError(length)
+                except ValueError:
+                    await self._respond(writer, 400, {'ok': False, 'error': "Bad Request",
+                                                      'message': "invalid Content-Length"}, False)
+                    break
+                if length > MAX_BODY:
+                    await self._respond(writer, 413, {'ok': False, 'error': "Payload Too Large"}, False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                status, payload = await self.dispatch(method, path, body)
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        finally:
+            writer.close()
+
+    async def dispatch(self, method, path, body):
+        """Run the station operation for a request; returns (status, response)"""
+        if method == "GET" and path == "/health":
+            return 200, {'ok': True}
+        if method == "GET" and path == "/metrics":
+            return 200, get_metrics().to_prometheus()
+
+        handler = self.routes.get(path)
+        if handler is None:
+            return 404, {'ok': False, 'error': "Not Found"}
+        if method != "POST":
+            return 405, {'ok': False, 'error': "Method Not Allowed"}
+
+        try:
+            payload = json.loads(body or b"{}")
+            if not isinstance(payload, dict):
+                raise ValueError("request body must be a JSON object")
+        except ValueError as e:
+            return 400, {'ok': False, 'error': "Bad Request", 'message': str(e)}
+
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(self.executor, handler, payload)
+            return 200, {'ok': True, 'result': result}
+        except StationError as e:
+            return 409, {'ok': False, 'error': e.title, 'message': e.message}
+        except Exception as e:
+            print(f"Error handling {path}: {e}")
+            import traceback
+            traceback.print_exc()
+            return 500, {'ok': False, 'error': "Internal Server Error", 'message': str(e)}
+
+    async def _respond(self, writer, status, payload, keep_alive):
+        # Plain strings are sent as Prometheus text, everything else as JSON
+        if isinstance(payload, str):
+            body = payload.encode('utf-8')
+            content_type = "text/plain; version=0.0.4"
+        else:
+            body = json.dumps(payload, default=_json_default).encode('utf-8')
+            content_type = "application/json"
+        head = (
+            f"HTTP/1.1 {status} {HTTP_REASONS.get(status, 'OK')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+    async def serve(self, host="127.0.0.1", port=8080, unix_socket=None):
+        if unix_socket:
+            server = await asyncio.start_unix_server(self.handle_connection, path=unix_socket)
+            print(f"Kiosk service listening on unix:{unix_socket}")
+        else:
+            server = await asyncio.start_server(self.handle_connection, host, port)
+            print(f"Kiosk service listening on http://{host}:{port}")
+
+        async with server:
+            await server.serve_forever()
+
+def run_headless(db, host="127.0.0.1", port=8080, unix_socket=None, workers=DEFAULT_WORKERS):
+    """Serve station operations without a GUI until interrupted"""
+    server = KioskServer(KioskService(db), workers)
+    try:
+        asyncio.run(server.serve(host, port, unix_socket))
+    except KeyboardInterrupt:
+        print("Kiosk service stopped")
+    finally:
+        server.executor.shutdown(wait=False)
@@ -0,0 +1,167 @@
+import argparse
+import datetime
+import time
+
+import numpy as np
+
+from utils import init_firestore, format_currency
+from notifications import get_dispatcher
+from spending import day_key, prune_expired, EWMA_SPAN
+
+# Days of spending used to project each student's daily burn rate
+WINDOW_DAYS = 14
+
+# Students projected to run out within this many days are alerted
+ALERT_WITHIN_DAYS = 3
+
+# An alerted student is not alerted again for this many days
+ALERT_EVERY_DAYS = 3
+
+# Firestore allows at most 500 writes per batch
+BATCH_SIZE = 400
+
+def load_balances(db):
+    """Student ids, names, emails and wallet balances as parallel lists/arrays"""
+    ids, names, emails, balances = [], [], [], []
+    for doc in db.collection('students').select(['name', 'email', 'parent_email', 'wallet_balance']).stream():
+        data = doc.to_dict()
+        ids.append(doc.id)
+        names.append(data.get('name', 'Student'))
+        emails.append(data.get('email') or data.get('parent_email') or '')
+        balances.append(float(data.get('wallet_balance', 0) or 0))
+    return ids, names, emails, np.array(balances, dtype=np.float64)
+
+def load_spend_matrix(db, student_ids, today, window=WINDOW_DAYS):
+    """students x days matrix of daily spend (oldest day first) from spending_stats"""
+    index = {student_id: i for i, student_id in enumerate(student_ids)}
+    # The scan runs in the evening, so today's spending so far is the newest column
+    keys = [day_key(today - datetime.timedelta(days=offset)) for offset in range(window - 1, -1, -1)]
+    matrix = np.zeros((len(student_ids), window), dtype=np.float64)
+
+    for doc in db.collection('spending_stats').select(['daily']).stream():
+        row = index.get(doc.id)
+        if row is None:
+            continue
+        daily = doc.to_dict().get('daily', {})
+        for column, key in enumerate(keys):
+            bucket = daily.get(key)
+            if bucket:
+                matrix[row, column] = bucket.get('amount', 0)
+    return matrix
+
+def project_days_to_empty(balances, spend_matrix, span=EWMA_SPAN):
+    """Days until each balance runs out at its exponentially weighted daily spend rate"""
+    window = spend_matrix.shape[1]
+    alpha = 2.0 / (span + 1)
+    # Most recent day gets the largest weight; weights sum to 1
+    weights = alpha * (1 - alpha) ** np.arange(window - 1, -1, -1)
+    weights /= weights.sum()
+    rates = spend_matrix @ weights
+
+    days = np.full(balances.shape, np.inf)
+    spending = rates > 0
+    days[spending] = balances[spending] / rates[spending]
+    return days, rates
+
+def _recently_alerted(db, student_ids, today, every_days=ALERT_EVERY_DAYS):
+    refs = [db.collection('low_balance_alerts').document(student_id) for student_id in student_ids]
+    cutoff = (today - datetime.timedelta(days=every_days - 1)).strftime("%Y-%m-%d")
+    recent = set()
+    for doc in db.get_all(refs):
+        if doc.exists and doc.to_dict().get('alerted_on', '') >= cutoff:
+            recent.add(doc.id)
+    return recent
+
+def run_low_balance_scan(db, today=None, within_days=ALERT_WITHIN_DAYS, sender=None):
+    """Project days-to-empty for every student and queue alerts for those about to run out"""
+    if today is None:
+        today = datetime.date.today()
+    if sender is None:
+        sender = get_dispatcher(db)
+
+    try:
+        ids, names, emails, balances = load_balances(db)
+        if not ids:
+            return 0
+        spend = load_spend_matrix(db, ids, today)
+        days_left, rates = project_days_to_empty(balances, spend)
+
+        candidates = np.flatnonzero((days_left <= within_days) & np.array([bool(e) for e in emails]))
+        recent = _recently_alerted(db, [ids[i] for i in candidates], today) if len(candidates) else set()
+
+        queued = 0
+        alerted = []
+        for i in candidates:
+            if ids[i] in recent:
+                continue
+            # Two weeks at the current rate, rounded up to the next ₹100
+            suggested = max(100, int(np.ceil(rates[i] * 14 / 100.0)) * 100)
+            empty_on = today + datetime.timedelta(days=int(days_left[i]))
+            message = (
+                f"Dear {names[i]},\n\n"
+                f"Your wallet balance is {format_currency(balances[i])}. At your recent spending of about "
+                f"{format_currency(rates[i])} a day it will run out around {empty_on.strftime('%d %b')}.\n\n"
+                f"We suggest recharging {format_currency(suggested)} before then. Recharging outside the "
+                f"12:00-14:00 lunch rush avoids the queue at the canteen counter."
+            )
+            if sender.enqueue(emails[i], "Low Wallet Balance", message):
+                queued += 1
+                alerted.append(ids[i])
+
+        # Remember who was alerted so they are not emailed every night
+        stamp = today.strftime("%Y-%m-%d")
+        for start in range(0, len(alerted), BATCH_SIZE):
+            batch = db.batch()
+            for student_id in alerted[start:start + BATCH_SIZE]:
+                batch.set(db.collection('low_balance_alerts').document(student_id),
+                          {'alerted_on': stamp, 'updated_at': datetime.datetime.now()})
+            batch.commit()
+
+        unsent = sender.wait_idle()
+        print(f"Low balance scan for {today}: {len(ids)} students, {len(candidates)} within {within_days} days "
+              f"of empty, {queued} alerts queued ({unsent} still waiting to send)")
+        return queued
+
+    except Exception as e:
+        print(f"Error running low balance scan: {e}")
+        import traceback
+        traceback.print_exc()
+        return None
+
+def run_daily(db, run_at="21:00", within_days=ALERT_WITHIN_DAYS):
+    """Run the scan, then prune expired spending buckets, once a day at the given HH:MM time"""
+    hour, minute = [int(part) for part in run_at.split(":")]
+
+    while True:
+        now = datetime.datetime.now()
+        next_run = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if next_run <= now:
+            next_run += datetime.timedelta(days=1)
+
+        print(f"Next low balance scan at {next_run.strftime('%Y-%m-%d %H:%M')}")
+        time.sleep((next_run - now).total_seconds())
+        run_low_balance_scan(db, within_days=within_days)
+
+        # Keep each spending_stats document to its 90-day ring
+        try:
+            prune_expired(db)
+        except Exception as e:
+            print(f"Error pruning spending buckets: {e}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Predictive low wallet balance alerts")
+    parser.add_argument("--once", action="store_true", help="run a single scan and exit")
+    parser.add_argument("--at", default="21:00", help="daily run time (HH:MM)")
+    parser.add_argument("--within-days", type=float, default=ALERT_WITHIN_DAYS)
+    parser.add_argument("--key", default="serviceAccountKey.json", help="service account key file")
+    args = parser.parse_args()
+
+    db = init_firestore(args.key)
+
+    if args.once:
+        run_low_balance_scan(db, within_days=args.within_days)
+    else:
+        run_daily(db, args.at, args.within_days)
+
+if __name__ == "__main__":
+    main()
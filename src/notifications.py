@@ -0,0 +1,334 @@
+import datetime
+import json
+import os
+import smtplib
+import sqlite3
+import threading
+import time
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+from utils import send_email
+
+# Outgoing mail settings; without SMTP_HOST emails go to the console placeholder.
+# For local testing run a debugging server (`python -m aiosmtpd -n -l localhost:1025`)
+# and set SMTP_HOST=localhost SMTP_PORT=1025
+SMTP_HOST = os.environ.get("SMTP_HOST", "")
+SMTP_PORT = int(os.environ.get("SMTP_PORT", "587"))
+SMTP_USER = os.environ.get("SMTP_USER", "")
+SMTP_PASSWORD = os.environ.get("SMTP_PASSWORD", "")
+SMTP_FROM = os.environ.get("SMTP_FROM", SMTP_USER or "rfid-wallet@localhost")
+SMTP_STARTTLS = os.environ.get("SMTP_STARTTLS", "1") == "1"
+
+# Queued emails survive restarts in this SQLite file
+QUEUE_PATH = os.environ.get("NOTIFICATION_QUEUE", "notifications_queue.db")
+
+# Emails wait this long before sending so bursts to one recipient are merged
+COALESCE_DELAY = 5
+
+# Retry schedule for failed deliveries
+MAX_ATTEMPTS = 6
+BACKOFF_BASE = 10
+BACKOFF_MAX = 1800
+
+# Reconnect instead of reusing an SMTP session idle for longer than this
+SMTP_IDLE_TIMEOUT = 60
+
+class ConsoleTransport:
+    """Deliver emails through the utils.send_email placeholder"""
+
+    def send(self, to_email, subject, message):
+        if not send_email(to_email, subject, message):
+            raise RuntimeError("send_email reported a failure")
+
+    def close(self):
+        pass
+
+class SMTPTransport:
+    """Deliver emails over one SMTP connection that is kept open between messages"""
+
+    def __init__(self, host=SMTP_HOST, port=SMTP_PORT, user=SMTP_USER,
+                 password=SMTP_PASSWORD, sender=SMTP_FROM, starttls=SMTP_STARTTLS):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.sender = sender
+        self.starttls = starttls
+        self.connection = None
+        self.last_used = 0
+
+    def _connect(self):
+        self.close()
+        connection = smtplib.SMTP(self.host, self.port, timeout=30)
+        if self.starttls:
+            connection.starttls()
+        if self.user:
+            connection.login(self.user, self.password)
+        self.connection = connection
+
+    def _ensure_connected(self):
+        if self.connection is None:
+            self._connect()
+        elif time.time() - self.last_used > SMTP_IDLE_TIMEOUT:
+            # Servers drop idle sessions; check before reusing one
+            try:
+                if self.connection.noop()[0] != 250:
+                    self._connect()
+            except smtplib.SMTPException:
+                self._connect()
+
+    def send(self, to_email, subject, message):
+        msg = MIMEMultipart()
+        msg['From'] = self.sender
+        msg['To'] = to_email
+        msg['Subject'] = subject
+        msg.attach(MIMEText(message, 'plain'))
+
+        self._ensure_connected()
+        try:
+            self.connection.sendmail(self.sender, [to_email], msg.as_string())
+        except smtplib.SMTPServerDisconnected:
+            # Connection went away between messages, retry once on a fresh one
+            self._connect()
+            self.connection.sendmail(self.sender, [to_email], msg.as_string())
+        self.last_used = time.time()
+
+    def close(self):
+        if self.connection is not None:
+            try:
+                self.connection.quit()
+            except Exception:
+                pass
+            self.connection = None
+
+def default_transport():
+    """SMTP when a server is configured, otherwise the console placeholder"""
+    if SMTP_HOST:
+        return SMTPTransport()
+    return ConsoleTransport()
+
+class NotificationStore:
+    """SQLite-backed outbox shared by the dispatcher workers"""
+
+    def __init__(self, path=QUEUE_PATH):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                to_email TEXT NOT NULL,
+                subject TEXT NOT NULL,
+                message TEXT NOT NULL,
+                status_refs TEXT NOT NULL DEFAULT '[]',
+                state TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL,
+                created_at REAL NOT NULL,
+                last_error TEXT
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS outbox_due ON outbox (state, next_attempt_at)")
+        # Rows claimed by a worker that died mid-send go back to the queue
+        self.conn.execute("UPDATE outbox SET state = 'pending' WHERE state = 'sending'")
+        self.conn.commit()
+
+    def add(self, to_email, subject, message, status_refs, delay=0):
+        now = time.time()
+        with self.lock:
+            cursor = self.conn.execute(
+                "INSERT INTO outbox (to_email, subject, message, status_refs, next_attempt_at, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (to_email, subject, message, json.dumps(status_refs), now + delay, now)
+            )
+            self.conn.commit()
+            return cursor.lastrowid
+
+    def claim_next(self):
+        """Claim every due email for the recipient with the oldest due email"""
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT to_email FROM outbox WHERE state = 'pending' AND next_attempt_at <= ? "
+                "ORDER BY next_attempt_at LIMIT 1", (now,)
+            ).fetchone()
+            if row is None:
+                return None, []
+
+            # Pick up the recipient's other due emails too; ones waiting out a retry backoff stay queued
+            to_email = row[0]
+            rows = self.conn.execute(
+                "SELECT id, subject, message, status_refs, attempts FROM outbox "
+                "WHERE state = 'pending' AND to_email = ? AND next_attempt_at <= ? ORDER BY id",
+                (to_email, now)
+            ).fetchall()
+            self.conn.executemany("UPDATE outbox SET state = 'sending' WHERE id = ?",
+                                  [(r[0],) for r in rows])
+            self.conn.commit()
+
+        items = [{
+            'id': r[0],
+            'subject': r[1],
+            'message': r[2],
+            'status_refs': json.loads(r[3]),
+            'attempts': r[4]
+        } for r in rows]
+        return to_email, items
+
+    def mark_sent(self, ids):
+        with self.lock:
+            self.conn.executemany("DELETE FROM outbox WHERE id = ?", [(i,) for i in ids])
+            self.conn.commit()
+
+    def mark_failed(self, items, error):
+        now = time.time()
+        with self.lock:
+            for item in items:
+                attempts = item['attempts'] + 1
+                if attempts >= MAX_ATTEMPTS:
+                    state, next_attempt = 'failed', now
+                else:
+                    state = 'pending'
+                    next_attempt = now + min(BACKOFF_BASE * (2 ** (attempts - 1)), BACKOFF_MAX)
+                self.conn.execute(
+                    "UPDATE outbox SET state = ?, attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?",
+                    (state, attempts, next_attempt, str(error), item['id'])
+                )
+            self.conn.commit()
+
+    def next_due_in(self):
+        """Seconds until the next pending email is due, or None if the queue is empty"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT MIN(next_attempt_at) FROM outbox WHERE state = 'pending'"
+            ).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return max(0, row[0] - time.time())
+
+    def count(self, states=('pending', 'sending')):
+        with self.lock:
+            placeholders = ",".join("?" for _ in states)
+            return self.conn.execute(
+                f"SELECT COUNT(*) FROM outbox WHERE state IN ({placeholders})", tuple(states)
+            ).fetchone()[0]
+
+class NotificationDispatcher:
+    """Send queued emails from background workers and record delivery in Firestore"""
+
+    def __init__(self, db=None, store_path=QUEUE_PATH, workers=2, transport_factory=default_transport,
+                 coalesce_delay=COALESCE_DELAY):
+        self.db = db
+        self.store = NotificationStore(store_path)
+        self.worker_count = workers
+        self.transport_factory = transport_factory
+        self.coalesce_delay = coalesce_delay
+        self.wakeup = threading.Condition()
+        self.stopping = False
+        self.threads = []
+
+    def start(self):
+        """Start the worker pool"""
+        if self.threads:
+            return
+        self.stopping = False
+        for i in range(self.worker_count):
+            thread = threading.Thread(target=self._worker, name=f"notifier-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self, timeout=5):
+        """Ask the workers to finish their current email and exit"""
+        with self.wakeup:
+            self.stopping = True
+            self.wakeup.notify_all()
+        for thread in self.threads:
+            thread.join(timeout)
+        self.threads = []
+
+    def enqueue(self, to_email, subject, message, status_ref=None):
+        """Queue an email; status_ref ('collection/doc_id') gets email_sent=True once delivered"""
+        if not to_email:
+            return False
+        try:
+            status_refs = [status_ref] if status_ref else []
+            self.store.add(to_email, subject, message, status_refs, delay=self.coalesce_delay)
+            with self.wakeup:
+                self.wakeup.notify()
+            return True
+        except Exception as e:
+            print(f"Error queueing notification to {to_email}: {e}")
+            return False
+
+    def wait_idle(self, timeout=60):
+        """Block until nothing is queued or timeout passes; returns the number still queued"""
+        deadline = time.time() + timeout
+        remaining = self.store.count()
+        while remaining and time.time() < deadline:
+            time.sleep(0.5)
+            remaining = self.store.count()
+        return remaining
+
+    def _worker(self):
+        transport = self.transport_factory()
+        try:
+            while True:
+                with self.wakeup:
+                    if self.stopping:
+                        return
+                to_email, items = self.store.claim_next()
+                if not items:
+                    # Sleep until the next email is due or a new one is queued
+                    wait = self.store.next_due_in()
+                    with self.wakeup:
+                        if not self.stopping:
+                            self.wakeup.wait(timeout=min(wait, 30) if wait is not None else 30)
+                    continue
+                self._deliver(transport, to_email, items)
+        finally:
+            transport.close()
+
+    def _deliver(self, transport, to_email, items):
+        if len(items) == 1:
+            subject = items[0]['subject']
+            message = items[0]['message']
+        else:
+            # Several events for the same recipient go out as one digest
+            subject = f"{len(items)} notifications from the Student RFID System"
+            message = "\n\n----------\n\n".join(f"{item['subject']}\n{item['message']}" for item in items)
+
+        try:
+            transport.send(to_email, subject, message)
+        except Exception as e:
+            print(f"Error sending notification to {to_email}: {e}")
+            self.store.mark_failed(items, e)
+            return
+
+        self.store.mark_sent([item['id'] for item in items])
+        self._record_delivery([ref for item in items for ref in item['status_refs']])
+
+    def _record_delivery(self, status_refs):
+        """Set email_sent on the documents that asked for a delivery receipt"""
+        if not status_refs or self.db is None:
+            return
+        try:
+            batch = self.db.batch()
+            now = datetime.datetime.now()
+            for path in status_refs:
+                batch.update(self.db.document(path), {'email_sent': True, 'email_sent_at': now})
+            batch.commit()
+        except Exception as e:
+            print(f"Error recording email delivery: {e}")
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+def get_dispatcher(db=None):
+    """Return the process-wide dispatcher, starting it on first use"""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = NotificationDispatcher(db)
+            _dispatcher.start()
+        elif _dispatcher.db is None and db is not None:
+            _dispatcher.db = db
+        return _dispatcher
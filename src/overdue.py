@@ -0,0 +1,241 @@
+import argparse
+import datetime
+import time
+from firebase_admin import firestore
+
+from utils import init_firestore, format_currency
+from notifications import get_dispatcher
+
+# Fine charged for every day a book is kept past its due date
+FINE_PER_DAY = 5.0
+
+# Firestore allows at most 500 writes per batch
+BATCH_SIZE = 400
+
+# Open lendings are read in pages of this size
+PAGE_SIZE = 300
+
+# Students are reminded on the first overdue day and then once a week
+NOTIFY_EVERY_DAYS = 7
+
+def iter_overdue_lendings(db, as_of, page_size=PAGE_SIZE):
+    """Yield open lendings due before as_of, oldest due date first"""
+    as_of_str = as_of.strftime("%Y-%m-%d")
+
+    # Due dates are '%Y-%m-%d' strings, so a string range matches date order.
+    # Needs the (status, due_date) composite index from firestore.indexes.json
+    query = db.collection('lendings').where(
+        filter=firestore.FieldFilter('status', '==', 'lent')
+    ).where(
+        filter=firestore.FieldFilter('due_date', '<', as_of_str)
+    ).order_by('due_date')
+
+    last_doc = None
+    while True:
+        page_query = query.limit(page_size)
+        if last_doc is not None:
+            page_query = page_query.start_after(last_doc)
+
+        docs = list(page_query.stream())
+        for doc in docs:
+            yield doc
+
+        if len(docs) < page_size:
+            break
+        last_doc = docs[-1]
+
+def compute_overdue_summaries(lending_docs, as_of, fine_per_day=FINE_PER_DAY):
+    """Group overdue lendings by student and compute their fines"""
+    summaries = {}
+
+    for doc in lending_docs:
+        lending = doc.to_dict()
+        student_id = lending.get('student_id')
+        if not student_id:
+            continue
+
+        try:
+            due_date = datetime.datetime.strptime(lending.get('due_date', ''), "%Y-%m-%d").date()
+        except (TypeError, ValueError):
+            print(f"Skipping lending {doc.id} with invalid due date: {lending.get('due_date')}")
+            continue
+
+        days_overdue = (as_of - due_date).days
+        if days_overdue <= 0:
+            continue
+
+        fine = days_overdue * fine_per_day
+
+        summary = summaries.setdefault(student_id, {
+            'student_id': student_id,
+            'student_name': lending.get('student_name', 'Unknown'),
+            'books': [],
+            'overdue_count': 0,
+            'total_fine': 0.0,
+            'max_days_overdue': 0
+        })
+        summary['books'].append({
+            'lending_id': doc.id,
+            'book_id': lending.get('book_id', ''),
+            'book_title': lending.get('book_title', 'Unknown'),
+            'due_date': lending.get('due_date'),
+            'days_overdue': days_overdue,
+            'fine': fine
+        })
+        summary['overdue_count'] += 1
+        summary['total_fine'] += fine
+        summary['max_days_overdue'] = max(summary['max_days_overdue'], days_overdue)
+
+    return summaries
+
+def _commit_in_batches(db, operations, batch_size=BATCH_SIZE):
+    """Apply (action, ref, data) operations using as few batches as possible"""
+    batch = db.batch()
+    pending = 0
+    committed = 0
+
+    for action, ref, data in operations:
+        if action == 'set':
+            batch.set(ref, data)
+        elif action == 'delete':
+            batch.delete(ref)
+        pending += 1
+
+        if pending >= batch_size:
+            batch.commit()
+            committed += pending
+            batch = db.batch()
+            pending = 0
+
+    if pending:
+        batch.commit()
+        committed += pending
+
+    return committed
+
+def write_overdue_summaries(db, summaries, as_of):
+    """Write one overdue summary per student and remove summaries that no longer apply"""
+    as_of_str = as_of.strftime("%Y-%m-%d")
+    now = datetime.datetime.now()
+    summaries_ref = db.collection('overdue_summaries')
+
+    def operations():
+        for student_id, summary in summaries.items():
+            yield 'set', summaries_ref.document(student_id), {
+                **summary,
+                'computed_on': as_of_str,
+                'updated_at': now
+            }
+
+        # Anything not refreshed by this run belongs to a student who is no longer overdue
+        stale_docs = summaries_ref.where(
+            filter=firestore.FieldFilter('computed_on', '<', as_of_str)
+        ).stream()
+        for doc in stale_docs:
+            if doc.id not in summaries:
+                yield 'delete', doc.reference, None
+
+    return _commit_in_batches(db, operations())
+
+def _load_students(db, student_ids, chunk_size=100):
+    """Fetch student documents in bulk instead of one read per student"""
+    students = {}
+    student_ids = list(student_ids)
+
+    for i in range(0, len(student_ids), chunk_size):
+        refs = [db.collection('students').document(sid) for sid in student_ids[i:i + chunk_size]]
+        for doc in db.get_all(refs):
+            if doc.exists:
+                students[doc.id] = doc.to_dict()
+
+    return students
+
+def queue_overdue_notifications(db, summaries, sender, notify_every_days=NOTIFY_EVERY_DAYS):
+    """Queue reminder emails for students whose reminder falls on today"""
+    due_today = {
+        student_id: summary for student_id, summary in summaries.items()
+        if any((book['days_overdue'] - 1) % notify_every_days == 0 for book in summary['books'])
+    }
+    if not due_today:
+        return 0
+
+    students = _load_students(db, due_today.keys())
+    queued = 0
+
+    for student_id, summary in due_today.items():
+        student = students.get(student_id, {})
+        to_email = student.get('email') or student.get('parent_email')
+        if not to_email:
+            continue
+
+        lines = [
+            f"- {book['book_title']} (due {book['due_date']}, {book['days_overdue']} days overdue, "
+            f"fine {format_currency(book['fine'])})"
+            for book in summary['books']
+        ]
+        message = (
+            f"Dear {student.get('name', summary['student_name'])},\n\n"
+            f"The following library books are overdue:\n" + "\n".join(lines) +
+            f"\n\nTotal fine: {format_currency(summary['total_fine'])}\n"
+            f"Please return them to the library as soon as possible."
+        )
+
+        if sender.enqueue(to_email, "Library Books Overdue", message):
+            queued += 1
+
+    return queued
+
+def run_overdue_scan(db, as_of=None, fine_per_day=FINE_PER_DAY, sender=None):
+    """Find overdue lendings, store per-student summaries and send reminders"""
+    if as_of is None:
+        as_of = datetime.date.today()
+    if sender is None:
+        sender = get_dispatcher(db)
+
+    try:
+        summaries = compute_overdue_summaries(iter_overdue_lendings(db, as_of), as_of, fine_per_day)
+        written = write_overdue_summaries(db, summaries, as_of)
+        queued = queue_overdue_notifications(db, summaries, sender)
+        unsent = sender.wait_idle()
+
+        print(f"Overdue scan for {as_of}: {len(summaries)} students overdue, "
+              f"{written} summary writes, {queued} reminders queued ({unsent} still waiting to send)")
+        return summaries
+
+    except Exception as e:
+        print(f"Error running overdue scan: {e}")
+        import traceback
+        traceback.print_exc()
+        return None
+
+def run_daily(db, run_at="02:00", fine_per_day=FINE_PER_DAY):
+    """Run the overdue scan once a day at the given HH:MM time"""
+    hour, minute = [int(part) for part in run_at.split(":")]
+
+    while True:
+        now = datetime.datetime.now()
+        next_run = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if next_run <= now:
+            next_run += datetime.timedelta(days=1)
+
+        print(f"Next overdue scan at {next_run.strftime('%Y-%m-%d %H:%M')}")
+        time.sleep((next_run - now).total_seconds())
+        run_overdue_scan(db, fine_per_day=fine_per_day)
+
+def main():
+    parser = argparse.ArgumentParser(description="Library overdue detection job")
+    parser.add_argument("--once", action="store_true", help="run a single scan and exit")
+    parser.add_argument("--at", default="02:00", help="daily run time (HH:MM)")
+    parser.add_argument("--fine-per-day", type=float, default=FINE_PER_DAY)
+    parser.add_argument("--key", default="serviceAccountKey.json", help="service account key file")
+    args = parser.parse_args()
+
+    db = init_firestore(args.key)
+
+    if args.once:
+        run_overdue_scan(db, fine_per_day=args.fine_per_day)
+    else:
+        run_daily(db, args.at, args.fine_per_day)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+import atexit
+import functools
+import importlib
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Profiling is off unless RFID_PROFILE (or "profiling" in app_config.json) selects a mode:
+#   spans        - wall-time spans only, written as a Chrome trace
+#   cprofile     - spans plus a cProfile .prof file per handler call
+#   pyinstrument - spans plus a pyinstrument HTML report per handler call
+MODES = ('spans', 'cprofile', 'pyinstrument')
+CONFIG_FILE = "app_config.json"
+
+# Oldest trace events are dropped beyond this many
+MAX_EVENTS = 200000
+
+# Station handlers wrapped when profiling is on ("module:Class.method")
+HOT_HANDLERS = [
+    "components.canteen_ui:CanteenUI.process_payment",
+    "components.canteen_ui:CanteenUI.process_recharge",
+    "components.canteen_ui:CanteenUI.quick_recharge",
+    "components.canteen_ui:CanteenUI.check_balance",
+    "components.classroom_ui:ClassroomUI.process_attendance",
+    "components.library_ui:LibraryUI.process_lending",
+    "components.library_ui:LibraryUI.process_return",
+    "components.library_ui:LibraryUI.filter_books",
+    "components.bus_ui:BusUI.process_student_rfid",
+    "components.bus_ui:BusUI.process_boarding",
+    "components.bus_ui:BusUI.process_offboarding",
+    "components.student_ui:StudentUI.display_student_info",
+    "stations:CanteenStation.pay",
+    "stations:CanteenStation.recharge",
+    "stations:BusStation.board",
+    "stations:BusStation.offboard",
+    "stations:LibraryStation.lend",
+    "stations:LibraryStation.return_book",
+    "stations:ClassroomStation.check_in",
+    "stations:ClassroomStation.load_face_encodings",
+    "stations:ClassroomStation.verify",
+    "stations:ClassroomStation.mark_present",
+]
+
+def _load_settings():
+    """Profiling mode and output directory from the environment, falling back to app_config.json"""
+    settings = {}
+    if os.path.exists(CONFIG_FILE):
+        try:
+            with open(CONFIG_FILE) as f:
+                settings = json.load(f).get('profiling', {}) or {}
+        except Exception as e:
+            print(f"Error reading {CONFIG_FILE}: {e}")
+
+    mode = os.environ.get("RFID_PROFILE", settings.get('mode', '')).strip().lower()
+    if mode in ('1', 'true', 'on'):
+        mode = 'spans'
+    if mode and mode not in MODES:
+        print(f"Unknown profiling mode {mode!r}; expected one of {', '.join(MODES)}")
+        mode = ''
+    output_dir = os.environ.get("RFID_PROFILE_DIR", settings.get('output_dir', 'profiles'))
+    return mode, output_dir
+
+MODE, OUTPUT_DIR = _load_settings()
+ENABLED = bool(MODE)
+
+class TraceRecorder:
+    """Collect spans as Chrome trace events (open the file in chrome://tracing or Perfetto)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.events = []
+        self.origin = time.perf_counter()
+        self.pid = os.getpid()
+
+    def add(self, name, category, start, end, args=None):
+        event = {
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': (start - self.origin) * 1e6,
+            'dur': (end - start) * 1e6,
+            'pid': self.pid,
+            'tid': threading.get_ident(),
+        }
+        if args:
+            event['args'] = args
+        with self.lock:
+            self.events.append(event)
+            if len(self.events) > MAX_EVENTS:
+                del self.events[:len(self.events) - MAX_EVENTS]
+
+    def write(self, path):
+        with self.lock:
+            events = list(self.events)
+        # Name the threads so the trace viewer shows which station did the work
+        names = {t.ident: t.name for t in threading.enumerate()}
+        metadata = [
+            {'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': tid, 'args': {'name': names.get(tid, str(tid))}}
+            for tid in {event['tid'] for event in events}
+        ]
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': metadata + events, 'displayTimeUnit': 'ms'}, f)
+        return path
+
+_recorder = TraceRecorder()
+_local = threading.local()
+
+# Only one profiler may run per process (Python 3.12+ enforces this for cProfile),
+# so handlers running at the same time on other threads only get spans
+_profiler_lock = threading.Lock()
+_file_counter = itertools.count(1)
+
+def get_recorder():
+    return _recorder
+
+def record_span(name, category, start, end, **args):
+    """Record a finished span measured with time.perf_counter(); no-op unless profiling is on"""
+    if ENABLED:
+        _recorder.add(name, category, start, end, args)
+
+@contextmanager
+def span(name, category='app', **args):
+    """Time a block as a span nested inside the handler that runs it"""
+    if not ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _recorder.add(name, category, start, time.perf_counter(), args)
+
+def _output_path(name, extension):
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    return os.path.join(OUTPUT_DIR, f"{name}-{stamp}-{next(_file_counter)}.{extension}")
+
+def _start_profiler():
+    """Start a profiler if none is running in the process; None if this handler only gets a span"""
+    if not _profiler_lock.acquire(blocking=False):
+        return None
+    try:
+        profiler = _create_profiler()
+    except Exception as e:
+        # Profiling must never break the handler it wraps
+        print(f"Error starting profiler: {e}")
+        profiler = None
+    if profiler is None:
+        _profiler_lock.release()
+    return profiler
+
+def _create_profiler():
+    if MODE == 'cprofile':
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+    if MODE == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            print("pyinstrument is not installed: pip install pyinstrument")
+            return None
+        profiler = Profiler()
+        profiler.start()
+        return profiler
+    return None
+
+def _stop_profiler(profiler, name):
+    try:
+        if MODE == 'cprofile':
+            profiler.disable()
+            profiler.dump_stats(_output_path(name, "prof"))
+        else:
+            profiler.stop()
+            with open(_output_path(name, "html"), 'w') as f:
+                f.write(profiler.output_html())
+    except Exception as e:
+        print(f"Error saving profile for {name}: {e}")
+    finally:
+        _profiler_lock.release()
+
+def profile_handler(func, name=None):
+    """Wrap a handler in a span and, for the outermost handler on a thread, a profiler"""
+    name = name or func.__qualname__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        depth = getattr(_local, 'depth', 0)
+        # Nested handlers, and handlers overlapping one on another thread, just get a span
+        profiler = _start_profiler() if depth == 0 else None
+        _local.depth = depth + 1
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _recorder.add(name, 'handler', start, time.perf_counter())
+            _local.depth = depth
+            if profiler is not None:
+                _stop_profiler(profiler, name)
+
+    wrapper.__profiled__ = True
+    return wrapper
+
+def install(handlers=None):
+    """Wrap the hot station handlers when profiling is enabled; returns the number wrapped"""
+    if not ENABLED:
+        return 0
+
+    wrapped = 0
+    for target in handlers or HOT_HANDLERS:
+        module_name, qualname = target.split(":")
+        class_name, method_name = qualname.split(".")
+        try:
+            cls = getattr(importlib.import_module(module_name), class_name)
+            method = getattr(cls, method_name)
+            if not getattr(method, '__profiled__', False):
+                setattr(cls, method_name, profile_handler(method, qualname))
+                wrapped += 1
+        except Exception as e:
+            print(f"Could not profile {target}: {e}")
+
+    atexit.register(write_trace)
+    print(f"Profiling ({MODE}) enabled for {wrapped} handlers; output in {OUTPUT_DIR}/")
+    return wrapped
+
+def write_trace(path=None):
+    """Write all spans recorded so far as a Chrome trace-event JSON file"""
+    if not ENABLED:
+        return None
+    try:
+        path = _recorder.write(path or _output_path("trace", "json"))
+        print(f"Profiling trace written to {path}")
+        return path
+    except Exception as e:
+        print(f"Error writing profiling trace: {e}")
+        return None
@@ -0,0 +1,239 @@
+import argparse
+import asyncio
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import validate_rfid, init_firestore
+from stations import StationError, lookup_student, BusStation, ClassroomStation
+from idempotency import TapDeduplicator
+from attendance_writer import get_attendance_writer
+import profiling
+
+# A card held on a reader repeats its ID; taps inside this window are dropped
+DEBOUNCE_SECONDS = 2.0
+
+class FileReader:
+    """Read one RFID per line from a file or named pipe (used as a fake reader in testing)"""
+
+    def __init__(self, name, path, follow=True):
+        self.name = name
+        self.path = path
+        self.follow = follow
+
+    async def taps(self):
+        loop = asyncio.get_running_loop()
+        # Opening a FIFO blocks until a writer connects, so do it off the loop
+        f = await loop.run_in_executor(None, open, self.path, 'r')
+        try:
+            while True:
+                line = await loop.run_in_executor(None, f.readline)
+                if line:
+                    yield line.strip()
+                elif not self.follow:
+                    return
+                elif os.path.exists(self.path) and not os.path.isfile(self.path):
+                    # Writer closed the pipe; wait for the next one
+                    f.close()
+                    f = await loop.run_in_executor(None, open, self.path, 'r')
+                else:
+                    await asyncio.sleep(0.2)
+        finally:
+            f.close()
+
+class SerialReader:
+    """Read newline-terminated RFIDs from a serial reader (needs pyserial)"""
+
+    def __init__(self, name, port, baudrate=9600):
+        self.name = name
+        self.port = port
+        self.baudrate = baudrate
+
+    async def taps(self):
+        try:
+            import serial
+        except ImportError:
+            raise RuntimeError("Serial readers need pyserial: pip install pyserial")
+
+        loop = asyncio.get_running_loop()
+        connection = serial.Serial(self.port, self.baudrate, timeout=1)
+        try:
+            while True:
+                line = await loop.run_in_executor(None, connection.readline)
+                if line:
+                    yield line.decode('ascii', errors='ignore').strip()
+        finally:
+            connection.close()
+
+class HIDReader:
+    """Read RFIDs from a keyboard-emulating USB reader via evdev (Linux only, needs evdev)"""
+
+    def __init__(self, name, device):
+        self.name = name
+        self.device = device
+
+    async def taps(self):
+        try:
+            import evdev
+        except ImportError:
+            raise RuntimeError("HID readers need evdev: pip install evdev")
+
+        device = evdev.InputDevice(self.device)
+        # Grab the device so card numbers are not typed into the focused window
+        device.grab()
+        digits = []
+        try:
+            async for event in device.async_read_loop():
+                if event.type != evdev.ecodes.EV_KEY or event.value != 1:
+                    continue
+                key = evdev.ecodes.KEY[event.code]
+                if key in ('KEY_ENTER', 'KEY_KPENTER'):
+                    yield "".join(digits)
+                    digits = []
+                elif key.startswith('KEY_') and key[4:].isdigit():
+                    digits.append(key[4:])
+                elif key.startswith('KEY_KP') and key[6:].isdigit():
+                    digits.append(key[6:])
+        finally:
+            device.ungrab()
+
+class RFIDIngestor:
+    """Read several RFID readers on one asyncio loop and dispatch taps to station handlers"""
+
+    def __init__(self, workers=8, debounce=DEBOUNCE_SECONDS):
+        self.readers = []
+        self.debouncer = TapDeduplicator(debounce)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tap")
+
+    def add_reader(self, reader, handler):
+        """Register a reader; handler(rfid, reader_name) runs on a worker thread for every tap"""
+        self.readers.append((reader, handler))
+
+    async def _read(self, reader, handler):
+        pending = set()
+        async for rfid in reader.taps():
+            if not validate_rfid(rfid):
+                print(f"[{reader.name}] Ignoring invalid RFID: {rfid!r}")
+                continue
+            if not self.debouncer.claim(rfid, reader.name, 'tap'):
+                continue
+
+            # Don't wait for the handler; the next card on this reader can be read meanwhile
+            task = asyncio.ensure_future(self._dispatch(reader, handler, rfid))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+
+        # Let taps already read finish before the reader is reported as stopped
+        if pending:
+            await asyncio.gather(*pending)
+
+    async def _dispatch(self, reader, handler, rfid):
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(self.executor, handler, rfid, reader.name)
+            if result:
+                print(f"[{reader.name}] {rfid}: {result}")
+        except StationError as e:
+            print(f"[{reader.name}] {rfid}: {e.title} - {e.message}")
+        except Exception as e:
+            print(f"[{reader.name}] Error handling {rfid}: {e}")
+
+    async def run(self):
+        tasks = [asyncio.ensure_future(self._read(reader, handler)) for reader, handler in self.readers]
+        try:
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+            for (reader, _), result in zip(self.readers, results):
+                if isinstance(result, Exception):
+                    print(f"[{reader.name}] Reader stopped: {result}")
+        finally:
+            self.executor.shutdown(wait=False)
+
+# Station handlers
+
+def bus_door_handler(db, route_id, stop, action=None):
+    """Board or exit on a bus door; without a fixed action the student's status is toggled"""
+    station = BusStation(db, BusStation.find_route(db, route_id))
+
+    def handle(rfid, reader_name):
+        student = lookup_student(db, rfid)
+        station.check_rider(student)
+        # A second tap soon after the first must not toggle the student straight back out
+        station.claim_tap(student, 'door')
+        tap_action = action or ('exit' if student.get('bus_status') == 'inside' else 'board')
+        try:
+            if tap_action == 'board':
+                station.board(student, stop)
+            else:
+                station.offboard(student, stop)
+        except Exception:
+            # Nothing was recorded, so the student may tap again straight away
+            station.release_tap(student, 'door')
+            raise
+        return f"{student.get('name')} {'boarded' if tap_action == 'board' else 'exited'} at {stop}"
+    return handle
+
+def attendance_handler(db, department, year, section, verify_face=False):
+    """Mark attendance at a classroom turnstile"""
+    station = ClassroomStation(db, ClassroomStation.open_classroom(db, department, year, section),
+                               writer=get_attendance_writer(db))
+
+    def handle(rfid, reader_name):
+        student = station.check_in(rfid)
+        if verify_face:
+            if not station.verify(station.load_face_encodings(student)):
+                raise StationError("Verification Failed", f"Face does not match for {student.get('name')}.")
+            station.mark_present(student)
+        else:
+            station.mark_present(student, verification_method='rfid_only')
+        return f"{student.get('name')} marked present"
+    return handle
+
+def log_handler(rfid, reader_name):
+    """Only print taps (useful for checking reader wiring)"""
+    return "tap received"
+
+def build_reader(config):
+    reader_type = config.get('type', 'file')
+    name = config.get('name', reader_type)
+    if reader_type == 'file':
+        return FileReader(name, config['path'], config.get('follow', True))
+    if reader_type == 'serial':
+        return SerialReader(name, config['port'], config.get('baudrate', 9600))
+    if reader_type == 'hid':
+        return HIDReader(name, config['device'])
+    raise ValueError(f"Unknown reader type: {reader_type}")
+
+def build_handler(db, config):
+    station = config.get('station', 'log')
+    if station == 'bus':
+        return bus_door_handler(db, config['route_id'], config['stop'], config.get('action'))
+    if station == 'attendance':
+        return attendance_handler(db, config['department'], config['year'], config['section'],
+                                  config.get('verify_face', False))
+    if station == 'log':
+        return log_handler
+    raise ValueError(f"Unknown station type: {station}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Run several RFID readers from one process")
+    parser.add_argument("config", help="JSON file with a 'readers' list")
+    parser.add_argument("--key", default="serviceAccountKey.json", help="service account key file")
+    parser.add_argument("--debounce", type=float, default=DEBOUNCE_SECONDS)
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        config = json.load(f)
+
+    db = init_firestore(args.key)
+    profiling.install()
+    ingestor = RFIDIngestor(workers=config.get('workers', 8), debounce=args.debounce)
+    for reader_config in config.get('readers', []):
+        ingestor.add_reader(build_reader(reader_config), build_handler(db, reader_config))
+
+    try:
+        asyncio.run(ingestor.run())
+    except KeyboardInterrupt:
+        print("Readers stopped")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import atexit
+import threading
+
+# How long a lookup waits for the listener's first snapshot before reading bus_routes directly
+WARM_TIMEOUT = 5
+
+class RouteCache:
+    """route_id -> bus route, kept current by a snapshot listener on bus_routes"""
+
+    def __init__(self, db):
+        self.db = db
+        self.lock = threading.Lock()
+        self.routes = {}     # doc_id -> route data (with 'doc_id')
+        self.by_route = {}   # route_id -> doc_id
+        self.ready = threading.Event()
+        self.watch = None
+
+    def start(self):
+        """Start listening; the first snapshot warms the cache"""
+        if self.watch is not None:
+            return
+        try:
+            self.watch = self.db.collection('bus_routes').on_snapshot(self._on_snapshot)
+        except Exception as e:
+            print(f"Error listening to bus routes, falling back to direct reads: {e}")
+
+    def stop(self):
+        if self.watch is not None:
+            try:
+                self.watch.unsubscribe()
+            except Exception as e:
+                print(f"Error stopping bus route listener: {e}")
+            self.watch = None
+
+    def _on_snapshot(self, docs, changes, read_time):
+        # Every snapshot carries the whole (small) collection, so rebuild rather than patch
+        routes = {doc.id: {**doc.to_dict(), 'doc_id': doc.id} for doc in docs}
+        with self.lock:
+            self._set_routes(routes)
+        self.ready.set()
+
+    def _set_routes(self, routes):
+        """Swap in a new doc_id -> route map (caller holds the lock)"""
+        by_route = {}
+        for doc_id, route in routes.items():
+            route_id = route.get('route_id')
+            if route_id:
+                by_route.setdefault(str(route_id), doc_id)
+        self.routes = routes
+        self.by_route = by_route
+
+    def _warm(self):
+        """Wait for the listener, or load the collection once if it does not answer"""
+        if self.ready.is_set():
+            return
+        self.start()
+        if self.ready.wait(WARM_TIMEOUT):
+            return
+        routes = {doc.id: {**doc.to_dict(), 'doc_id': doc.id} for doc in self.db.collection('bus_routes').get()}
+        with self.lock:
+            self._set_routes(routes)
+        self.ready.set()
+
+    def get(self, route_id):
+        """Route data for a route_id, or None"""
+        if not route_id:
+            return None
+        self._warm()
+        with self.lock:
+            doc_id = self.by_route.get(str(route_id))
+            return dict(self.routes[doc_id]) if doc_id else None
+
+    def exists(self, route_id):
+        return self.get(route_id) is not None
+
+    def all(self):
+        """Every route, sorted by route_id"""
+        self._warm()
+        with self.lock:
+            routes = [dict(route) for route in self.routes.values()]
+        routes.sort(key=lambda route: str(route.get('route_id', '')))
+        return routes
+
+    def put(self, doc_id, data):
+        """Apply a local write (new route or changed fields) now instead of waiting for the listener to echo it"""
+        with self.lock:
+            self._set_routes({**self.routes, doc_id: {**self.routes.get(doc_id, {}), **data, 'doc_id': doc_id}})
+
+    def discard(self, doc_id):
+        """Drop a route deleted locally"""
+        with self.lock:
+            self._set_routes({key: route for key, route in self.routes.items() if key != doc_id})
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_route_cache(db):
+    """Return the process-wide route cache, starting its listener on first use"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = RouteCache(db)
+            _cache.start()
+            atexit.register(_cache.stop)
+        return _cache
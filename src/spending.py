@@ -0,0 +1,215 @@
+import argparse
+import datetime
+
+from firebase_admin import firestore
+
+# Days of daily buckets kept per student
+RING_DAYS = 90
+
+# Smoothing span (days) for the exponentially weighted daily spend
+EWMA_SPAN = 7
+
+# Transactions read per page while backfilling
+PAGE_SIZE = 500
+BATCH_SIZE = 400
+
+def day_key(day):
+    """Map key for a day's bucket; a plain identifier so it can be used in field paths"""
+    return day.strftime("d%Y%m%d")
+
+def stats_ref(db, student_id):
+    return db.collection('spending_stats').document(student_id)
+
+def add_debit(batch, db, student_id, amount, when):
+    """Add a debit to the student's daily bucket as part of an existing write batch"""
+    day = when.date()
+    batch.set(stats_ref(db, student_id), {
+        'daily': {
+            day_key(day): {'amount': firestore.Increment(amount), 'count': firestore.Increment(1)},
+            # Drop the bucket that just fell out of the ring; gaps left by days without
+            # debits are removed by prune_expired
+            day_key(day - datetime.timedelta(days=RING_DAYS)): firestore.DELETE_FIELD
+        },
+        'updated_at': when
+    }, merge=True)
+
+def daily_series(stats, days, today=None):
+    """Amounts and counts for the last `days` days (oldest first) from a spending_stats document"""
+    today = today or datetime.date.today()
+    daily = stats.get('daily', {})
+    amounts = []
+    counts = []
+    for offset in range(days - 1, -1, -1):
+        bucket = daily.get(day_key(today - datetime.timedelta(days=offset)), {})
+        amounts.append(bucket.get('amount', 0))
+        counts.append(bucket.get('count', 0))
+    return amounts, counts
+
+def summarize(stats, days=30, today=None):
+    """Spending pattern from the daily buckets; same keys as get_spending_pattern plus trend stats"""
+    today = today or datetime.date.today()
+    days = min(days, RING_DAYS)
+    amounts, counts = daily_series(stats, days, today)
+    transaction_count = sum(counts)
+    if transaction_count == 0:
+        return None
+
+    total_amount = sum(amounts)
+    daily_avg = total_amount / days
+
+    # Recent days weigh more, so a student who started spending more is noticed quickly
+    alpha = 2.0 / (EWMA_SPAN + 1)
+    ewma = amounts[0]
+    for amount in amounts[1:]:
+        ewma = alpha * amount + (1 - alpha) * ewma
+
+    # Average spend per weekday (Monday first) over the whole ring
+    ring_amounts, _ = daily_series(stats, RING_DAYS, today)
+    weekday_totals = [0.0] * 7
+    weekday_days = [0] * 7
+    for offset, amount in enumerate(reversed(ring_amounts)):
+        weekday = (today - datetime.timedelta(days=offset)).weekday()
+        weekday_totals[weekday] += amount
+        weekday_days[weekday] += 1
+
+    return {
+        'daily_avg': daily_avg,
+        'weekly_avg': daily_avg * 7,
+        'transaction_count': transaction_count,
+        'total_spent': total_amount,
+        'ewma_daily': ewma,
+        'weekday_avg': [total / count if count else 0 for total, count in zip(weekday_totals, weekday_days)]
+    }
+
+def get_spending_stats(db, student_id):
+    """The student's spending_stats document, or None if it has not been backfilled yet"""
+    doc = stats_ref(db, student_id).get()
+    if not doc.exists:
+        return None
+    stats = doc.to_dict()
+    # Buckets written before the backfill only cover recent debits
+    if not stats.get('backfilled_at'):
+        return None
+    return stats
+
+def expired_keys(daily, today=None):
+    """Bucket keys older than the ring"""
+    today = today or datetime.date.today()
+    cutoff = day_key(today - datetime.timedelta(days=RING_DAYS - 1))
+    # Keys are dYYYYMMDD, so they compare in date order
+    return [key for key in daily if key < cutoff]
+
+def prune_expired(db, today=None):
+    """Delete every bucket older than the ring from all spending_stats documents"""
+    batch = db.batch()
+    pending = 0
+    pruned = 0
+    for doc in db.collection('spending_stats').select(['daily']).stream():
+        keys = expired_keys(doc.to_dict().get('daily', {}), today)
+        if not keys:
+            continue
+        batch.update(doc.reference, {f'daily.{key}': firestore.DELETE_FIELD for key in keys})
+        pruned += len(keys)
+        pending += 1
+        if pending >= BATCH_SIZE:
+            batch.commit()
+            batch = db.batch()
+            pending = 0
+    if pending:
+        batch.commit()
+
+    print(f"Pruned {pruned} expired spending buckets")
+    return pruned
+
+def _local_time(timestamp):
+    """Stored naive local times come back tagged as UTC; keep the wall-clock time"""
+    if getattr(timestamp, 'tzinfo', None) is not None:
+        return timestamp.replace(tzinfo=None)
+    return timestamp
+
+def _add_to_buckets(buckets, data):
+    """Add one transaction to per-student daily buckets"""
+    if data.get('type') != 'debit' or not data.get('student_id') or not data.get('timestamp'):
+        return
+    timestamp = _local_time(data['timestamp'])
+    daily = buckets.setdefault(data['student_id'], {})
+    bucket = daily.setdefault(day_key(timestamp.date()), {'amount': 0.0, 'count': 0})
+    bucket['amount'] += data.get('amount', 0)
+    bucket['count'] += 1
+
+def _bucket_start(days):
+    return datetime.datetime.combine(datetime.date.today() - datetime.timedelta(days=days - 1), datetime.time.min)
+
+def rebuild_student(db, student_id, days=RING_DAYS):
+    """Rebuild one student's buckets from their transactions; returns the new stats document"""
+    start = _bucket_start(days)
+    buckets = {}
+    query = db.collection('transactions').where(
+        filter=firestore.FieldFilter('student_id', '==', student_id)
+    )
+    for doc in query.stream():
+        data = doc.to_dict()
+        timestamp = data.get('timestamp')
+        if timestamp and _local_time(timestamp) >= start:
+            _add_to_buckets(buckets, data)
+
+    now = datetime.datetime.now()
+    stats = {'daily': buckets.get(student_id, {}), 'updated_at': now, 'backfilled_at': now}
+    stats_ref(db, student_id).set(stats)
+    return stats
+
+def backfill(db, days=RING_DAYS):
+    """Rebuild every student's daily buckets from the transactions collection"""
+    buckets = {}
+    scanned = 0
+    query = db.collection('transactions').where(
+        filter=firestore.FieldFilter('timestamp', '>=', _bucket_start(days))
+    ).order_by('timestamp').limit(PAGE_SIZE)
+    last_doc = None
+    while True:
+        page = query.start_after(last_doc) if last_doc else query
+        docs = list(page.stream())
+        for doc in docs:
+            _add_to_buckets(buckets, doc.to_dict())
+            scanned += 1
+        if len(docs) < PAGE_SIZE:
+            break
+        last_doc = docs[-1]
+
+    # Students without recent debits still get an (empty) document so they are not rescanned later
+    student_ids = [doc.id for doc in db.collection('students').select([]).stream()]
+
+    now = datetime.datetime.now()
+    batch = db.batch()
+    pending = 0
+    for student_id in set(student_ids) | set(buckets):
+        batch.set(stats_ref(db, student_id),
+                  {'daily': buckets.get(student_id, {}), 'updated_at': now, 'backfilled_at': now})
+        pending += 1
+        if pending >= BATCH_SIZE:
+            batch.commit()
+            batch = db.batch()
+            pending = 0
+    if pending:
+        batch.commit()
+
+    print(f"Backfilled spending stats for {len(student_ids)} students from {scanned} transactions")
+    return len(student_ids)
+
+def main():
+    from utils import init_firestore
+
+    parser = argparse.ArgumentParser(description="Rebuild per-student daily spending buckets")
+    parser.add_argument("--days", type=int, default=RING_DAYS)
+    parser.add_argument("--prune", action="store_true", help="only delete buckets older than the ring")
+    parser.add_argument("--key", default="serviceAccountKey.json", help="service account key file")
+    args = parser.parse_args()
+
+    db = init_firestore(args.key)
+    if args.prune:
+        prune_expired(db)
+    else:
+        backfill(db, args.days)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,847 @@
+import datetime
+from firebase_admin import firestore
+from google.api_core.exceptions import Conflict
+
+from utils import validate_rfid, get_student_by_rfid, check_attendance_exists, format_currency
+from notifications import get_dispatcher
+from idempotency import get_tap_deduplicator
+from spending import add_debit
+from attendance_writer import attendance_doc_id
+from route_cache import get_route_cache
+
+# Books a student may hold at the same time before the desk is warned
+MAX_BORROWED_BOOKS = 3
+
+# Loan period for library books
+LENDING_DAYS = 14
+
+# Identical taps inside these windows are rejected before anything is written
+WALLET_DEDUPE_SECONDS = 5
+BUS_DEDUPE_SECONDS = 30
+
+# Bus taps before this hour belong to the morning run, the rest to the evening run
+TRIP_SPLIT_HOUR = 12
+
+class StationError(Exception):
+    """A station operation was rejected; title and message are meant for the operator"""
+
+    def __init__(self, title, message, level="error"):
+        super().__init__(message)
+        self.title = title
+        self.message = message
+        self.level = level
+
+def lookup_student(db, rfid):
+    """Return the student with this RFID or raise StationError"""
+    if not validate_rfid(rfid):
+        raise StationError("Invalid RFID", "Please enter a valid 10-digit RFID.")
+
+    student = get_student_by_rfid(db, rfid)
+    if not student:
+        raise StationError("Student Not Found", f"No student found with RFID {rfid}.")
+    return student
+
+def parse_amount(value):
+    """Convert user input to a positive amount or raise StationError"""
+    if value is None or str(value).strip() == "":
+        raise StationError("Invalid Input", "Please enter a valid amount.")
+    try:
+        amount = float(value)
+    except (TypeError, ValueError):
+        raise StationError("Invalid Amount", "Please enter a valid number for amount.")
+    if amount <= 0:
+        raise StationError("Invalid Amount", "Amount must be greater than zero.")
+    return amount
+
+@firestore.transactional
+def _commit_wallet_transaction(transaction, db, student_ref, transaction_ref, transaction_data, create_transaction,
+                               delta):
+    """Apply delta to the stored wallet balance and record the transaction; returns the new balance"""
+    snapshot = student_ref.get(transaction=transaction)
+    if not snapshot.exists:
+        raise StationError("Student Not Found", "This student is no longer registered.")
+    current_balance = snapshot.to_dict().get('wallet_balance', 0)
+    new_balance = current_balance + delta
+    if new_balance < 0:
+        raise StationError("Insufficient Balance",
+                           f"Student has insufficient balance.\nCurrent Balance: {format_currency(current_balance)}\n"
+                           f"Required: {format_currency(-delta)}")
+
+    if transaction_data['type'] == 'credit':
+        transaction_data = {**transaction_data, 'balance_after': new_balance}
+    if create_transaction:
+        # create() fails the whole commit if this idempotency key was already used
+        transaction.create(transaction_ref, transaction_data)
+    else:
+        transaction.set(transaction_ref, transaction_data)
+    transaction.update(student_ref, {'wallet_balance': new_balance})
+    if transaction_data['type'] == 'debit':
+        # Keep the recharge recommendation's daily buckets current without rescanning history
+        add_debit(transaction, db, student_ref.id, transaction_data['amount'], transaction_data['timestamp'])
+    return new_balance
+
+class CanteenStation:
+    """Wallet payments and recharges"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def pay(self, student, amount, description="", idempotency_key=None):
+        """Debit the student's wallet"""
+        amount = parse_amount(amount)
+
+        now = datetime.datetime.now()
+        transaction = {
+            'student_id': student['id'],
+            'amount': amount,
+            'type': 'debit',
+            'description': description if description else 'Canteen Purchase',
+            'location': 'Canteen',
+            'timestamp': now
+        }
+
+        transaction_ref, new_balance = self._commit_wallet_change(student, f"pay:{amount:.2f}", transaction,
+                                                                  -amount, idempotency_key)
+        return {'transaction_id': transaction_ref.id, 'amount': amount, 'new_balance': new_balance, 'timestamp': now}
+
+    def recharge(self, student, amount, description="Wallet Recharge", idempotency_key=None):
+        """Credit the student's wallet"""
+        amount = parse_amount(amount)
+
+        now = datetime.datetime.now()
+        transaction = {
+            'student_id': student['id'],
+            'student_name': student.get('name', 'Unknown'),
+            'student_rfid': student.get('rfid', 'Unknown'),
+            'type': 'credit',
+            'amount': amount,
+            'description': description,
+            'location': 'Canteen',
+            'timestamp': now
+        }
+
+        transaction_ref, new_balance = self._commit_wallet_change(student, f"recharge:{amount:.2f}", transaction,
+                                                                  amount, idempotency_key)
+        return {'transaction_id': transaction_ref.id, 'amount': amount, 'new_balance': new_balance, 'timestamp': now}
+
+    def _commit_wallet_change(self, student, action, transaction, delta, idempotency_key):
+        """Write a transaction and the new balance together, at most once per tap and per key"""
+        dedupe = get_tap_deduplicator()
+        tap = (student.get('rfid', student['id']), 'canteen', action)
+        if not dedupe.claim(*tap, window=WALLET_DEDUPE_SECONDS):
+            raise StationError("Duplicate Transaction",
+                               f"An identical transaction for {student.get('name', 'this student')} was just processed.",
+                               level="warning")
+
+        if idempotency_key:
+            # The key is the document id, so replaying the same operation fails instead of charging twice
+            transaction_ref = self.db.collection('transactions').document(idempotency_key)
+            transaction = {**transaction, 'idempotency_key': idempotency_key}
+        else:
+            transaction_ref = self.db.collection('transactions').document()
+
+        # The balance is read and written in one transaction, so concurrent taps for a student cannot overwrite each other
+        try:
+            new_balance = _commit_wallet_transaction(self.db.transaction(), self.db,
+                                                     self.db.collection('students').document(student['id']),
+                                                     transaction_ref, transaction, bool(idempotency_key), delta)
+        except Conflict:
+            raise StationError("Duplicate Transaction", "This transaction has already been processed.",
+                               level="warning")
+        except Exception:
+            # Nothing was written, so let the operator retry straight away
+            dedupe.release(*tap)
+            raise
+
+        return transaction_ref, new_balance
+
+def trip_run(when):
+    return 'am' if when.hour < TRIP_SPLIT_HOUR else 'pm'
+
+def trip_id(route_id, when):
+    """One occupancy manifest per route per run: '{route}_{YYYY-MM-DD}_{am|pm}'"""
+    return f"{route_id}_{when.strftime('%Y-%m-%d')}_{trip_run(when)}"
+
+def _update_manifest(transaction, trip_ref, route_id, student, action, stop, now):
+    """Add or remove the student from a trip manifest inside a transaction; returns the new headcount"""
+    snapshot = trip_ref.get(transaction=transaction)
+    trip = snapshot.to_dict() if snapshot.exists else None
+    riders = (trip or {}).get('riders', {})
+    on_board = student['id'] in riders
+
+    # A repeated board or an exit for someone not on the manifest leaves the counters alone
+    if (action == 'board') == on_board:
+        return len(riders)
+
+    if action == 'board':
+        headcount = len(riders) + 1
+        rider = {'name': student.get('name'), 'rfid': student.get('rfid'), 'stop': stop, 'boarded_at': now}
+        if trip is None:
+            transaction.set(trip_ref, {
+                'route_id': route_id,
+                'date': now.strftime('%Y-%m-%d'),
+                'run': trip_run(now),
+                'riders': {student['id']: rider},
+                'headcount': headcount,
+                'boardings': 1,
+                'exits': 0,
+                'updated_at': now
+            })
+            return headcount
+        transaction.update(trip_ref, {
+            f"riders.{student['id']}": rider,
+            'headcount': headcount,
+            'boardings': trip.get('boardings', 0) + 1,
+            'updated_at': now
+        })
+    else:
+        headcount = len(riders) - 1
+        transaction.update(trip_ref, {
+            f"riders.{student['id']}": firestore.DELETE_FIELD,
+            'headcount': headcount,
+            'exits': trip.get('exits', 0) + 1,
+            'updated_at': now
+        })
+    return headcount
+
+@firestore.transactional
+def _commit_bus_tap(transaction, trip_ref, activity_ref, activity_data, create_activity, student_ref, student_update,
+                    route_id, student, action, stop, now):
+    """Write the activity, the student's status and the trip manifest together, or none of them"""
+    # The manifest read comes first: a transaction must do all its reads before any write
+    headcount = _update_manifest(transaction, trip_ref, route_id, student, action, stop, now)
+    if create_activity:
+        # create() fails the whole commit if this idempotency key was already used
+        transaction.create(activity_ref, activity_data)
+    else:
+        transaction.set(activity_ref, activity_data)
+    transaction.update(student_ref, student_update)
+    return headcount
+
+class BusStation:
+    """Boarding and offboarding for one bus route"""
+
+    def __init__(self, db, route_data):
+        self.db = db
+        self.route_data = route_data
+
+    @staticmethod
+    def find_route(db, route_id):
+        """Load a bus route by its route_id or raise StationError"""
+        if not route_id:
+            raise StationError("Invalid Input", "Please enter a bus route ID.")
+
+        # Served from the listener-backed cache, so selecting a route costs no reads
+        route_data = get_route_cache(db).get(route_id)
+        if not route_data:
+            raise StationError("Invalid Route", f"Bus route with ID {route_id} does not exist.")
+
+        route_data['route_id'] = route_id
+        return route_data
+
+    def check_rider(self, student):
+        """Make sure the student may ride this route"""
+        if not student.get('has_bus_pass', False):
+            raise StationError("No Bus Pass", f"Student {student.get('name')} does not have a bus pass.")
+
+        student_route = student.get('bus_route')
+        if student_route != self.route_data['route_id']:
+            raise StationError("Wrong Route",
+                               f"Student {student.get('name')} is assigned to route {student_route}, "
+                               f"not route {self.route_data['route_id']}.")
+
+    def board(self, student, stop, idempotency_key=None):
+        """Mark the student as inside the bus"""
+        return self._record_action(student, stop, 'board', 'inside', idempotency_key)
+
+    def offboard(self, student, stop, idempotency_key=None):
+        """Mark the student as outside the bus"""
+        return self._record_action(student, stop, 'exit', 'outside', idempotency_key)
+
+    def trip_ref(self, when=None):
+        return self.db.collection('bus_trips').document(trip_id(self.route_data['route_id'], when or datetime.datetime.now()))
+
+    def manifest(self, when=None):
+        """Current trip's riders and headcount (a single document read)"""
+        snapshot = self.trip_ref(when).get()
+        trip = snapshot.to_dict() if snapshot.exists else {}
+        return {
+            'trip_id': snapshot.id,
+            'headcount': trip.get('headcount', 0),
+            'boardings': trip.get('boardings', 0),
+            'exits': trip.get('exits', 0),
+            'riders': trip.get('riders', {})
+        }
+
+    def _manifest_ref(self, student, action, now):
+        """Exits come off the trip the student boarded, even if that run has ended"""
+        last = student.get('last_bus_action') or {}
+        if action == 'exit' and last.get('action') == 'board' and last.get('route') == self.route_data['route_id'] \
+                and last.get('timestamp'):
+            boarded_at = last['timestamp']
+            # Stored naive local times come back tagged as UTC; keep the wall-clock time
+            if getattr(boarded_at, 'tzinfo', None) is not None:
+                boarded_at = boarded_at.replace(tzinfo=None)
+            return self.trip_ref(boarded_at)
+        return self.trip_ref(now)
+
+    def claim_tap(self, student, action):
+        """Reserve a tap for this route, or raise StationError if it repeats a recent one"""
+        if not get_tap_deduplicator().claim(student.get('rfid', student['id']), f"bus:{self.route_data['route_id']}",
+                                            action, window=BUS_DEDUPE_SECONDS):
+            raise StationError("Duplicate Tap", f"{student.get('name')} was just recorded on this bus.",
+                               level="warning")
+
+    def release_tap(self, student, action):
+        """Give back a tap claimed with claim_tap when nothing was recorded"""
+        get_tap_deduplicator().release(student.get('rfid', student['id']), f"bus:{self.route_data['route_id']}", action)
+
+    def _record_action(self, student, stop, action, bus_status, idempotency_key=None):
+        if not stop:
+            raise StationError("Missing Information", "Please select a stop.")
+
+        self.claim_tap(student, action)
+
+        now = datetime.datetime.now()
+        route_id = self.route_data['route_id']
+
+        activity_data = {
+            'student_id': student['id'],
+            'student_name': student.get('name'),
+            'student_rfid': student.get('rfid'),
+            'action': action,
+            'route_num': route_id,
+            'stop': stop,
+            'timestamp': now,
+            'email_sent': False
+        }
+        if idempotency_key:
+            activity_ref = self.db.collection('bus_activity').document(idempotency_key)
+            activity_data['idempotency_key'] = idempotency_key
+        else:
+            activity_ref = self.db.collection('bus_activity').document()
+
+        student_update = {
+            'bus_status': bus_status,
+            'last_bus_action': {
+                'action': action,
+                'timestamp': now,
+                'route': route_id,
+                'stop': stop
+            }
+        }
+
+        # Activity, status and manifest are committed in one round trip, so a failed tap leaves no partial state
+        trip_ref = self._manifest_ref(student, action, now)
+        try:
+            headcount = _commit_bus_tap(self.db.transaction(), trip_ref,
+                                        activity_ref, activity_data, bool(idempotency_key),
+                                        self.db.collection('students').document(student['id']), student_update,
+                                        route_id, student, action, stop, now)
+        except Conflict:
+            raise StationError("Duplicate Tap", "This tap has already been recorded.", level="warning")
+        except Exception:
+            self.release_tap(student, action)
+            raise
+
+        # Notify the parent in the background
+        parent_email = student.get('parent_email')
+        if parent_email:
+            if action == 'board':
+                subject = "Bus Boarding Notification"
+                event = "boarded"
+            else:
+                subject = "Bus Offboarding Notification"
+                event = "exited"
+            message = f"""
+                Dear Parent/Guardian,
+
+                This is to inform you that {student.get('name')} has {event} the bus (Route {route_id}) at {stop} at {now.strftime('%H:%M:%S')}.
+
+                This is an automated message from the Student RFID System.
+                """
+            # email_sent is set on the activity once the email goes out
+            get_dispatcher(self.db).enqueue(parent_email, subject, message,
+                                            status_ref=f"bus_activity/{activity_ref.id}")
+
+        # headcount belongs to trip_id, which for an exit may be an earlier run than the current one
+        return {**activity_data, 'id': activity_ref.id, 'trip_id': trip_ref.id, 'headcount': headcount}
+
+def _book_unavailable(book_data):
+    return StationError("Book Unavailable",
+                        f"This book is already lent to student ID {book_data.get('lent_to', 'Unknown')}.\n"
+                        f"Lent on: {book_data.get('lent_date', 'Unknown')}, Due: {book_data.get('due_date', 'Unknown')}")
+
+@firestore.transactional
+def _commit_lend(transaction, book_ref, book_update, record_refs, lending_data):
+    """Mark the book lent and write its lending records, only if it is still available"""
+    snapshot = book_ref.get(transaction=transaction)
+    if not snapshot.exists:
+        raise StationError("Book Not Found", "This book is no longer in the catalog.")
+    if snapshot.to_dict().get('status') == 'lent':
+        raise _book_unavailable(snapshot.to_dict())
+
+    transaction.update(book_ref, book_update)
+    for record_ref in record_refs:
+        transaction.set(record_ref, lending_data)
+
+class LibraryStation:
+    """Book lending and returns"""
+
+    def __init__(self, db, catalog=None):
+        self.db = db
+        # Optional CatalogMirror; book lookups are served from it instead of Firestore
+        self.catalog = catalog
+
+    def find_book_for_lending(self, book_id):
+        """Load a book that can be lent or raise StationError"""
+        if not book_id:
+            raise StationError("Invalid Input", "Please enter a Book ID.")
+
+        if self.catalog is not None:
+            book_data = self.catalog.get_book(book_id)
+            if not book_data:
+                raise StationError("Book Not Found", f"No book found with ID {book_id}.")
+        else:
+            books = self.db.collection('books').where(
+                filter=firestore.FieldFilter('book_id', '==', book_id)
+            ).limit(1).get()
+            if not books:
+                raise StationError("Book Not Found", f"No book found with ID {book_id}.")
+
+            book_doc = books[0]
+            book_data = book_doc.to_dict()
+            book_data['id'] = book_doc.id  # Store document ID for reference
+        book_data['book_id'] = book_id  # Ensure book_id is saved
+
+        if book_data.get('status') == 'lent':
+            raise _book_unavailable(book_data)
+        return book_data
+
+    def borrowed_count(self, student_id):
+        """Number of books the student currently has out"""
+        results = self.db.collection('library_records').where(
+            filter=firestore.FieldFilter('student_id', '==', student_id)
+        ).where(
+            filter=firestore.FieldFilter('status', '==', 'lent')
+        ).get()
+        return len(results)
+
+    def lend(self, book_data, student):
+        """Lend a book found with find_book_for_lending to a student"""
+        now = datetime.datetime.now()
+        lent_date = now.strftime("%Y-%m-%d")
+        due_date = (now + datetime.timedelta(days=LENDING_DAYS)).strftime("%Y-%m-%d")
+
+        book_update = {
+            'status': 'lent',
+            'lent_to': student['id'],
+            'lent_date': lent_date,
+            'due_date': due_date,
+            'available': False,  # Set available to False when lending
+            'updated_at': firestore.SERVER_TIMESTAMP
+        }
+        lending_data = {
+            'book_id': book_data.get('book_id', book_data['id']),  # Use book_id field or document ID
+            'book_title': book_data.get('title', 'Unknown'),
+            'student_id': student['id'],
+            'student_name': student.get('name', 'Unknown'),
+            'student_rfid': student.get('rfid', 'Unknown'),
+            'lent_date': lent_date,
+            'due_date': due_date,
+            'status': 'lent',
+            'timestamp': now
+        }
+
+        # The lookup may come from the catalog mirror, so the book's status is checked again as part of the commit
+        book_ref = self.db.collection('books').document(book_data['id'])
+        # Add to lendings collection (new approach), and to library_records for backward compatibility
+        record_refs = [self.db.collection('lendings').document(), self.db.collection('library_records').document()]
+        try:
+            _commit_lend(self.db.transaction(), book_ref, book_update, record_refs, lending_data)
+        except StationError:
+            if self.catalog is not None:
+                # The mirror was behind; pick up the current state now instead of waiting for the listener
+                snapshot = book_ref.get()
+                if snapshot.exists:
+                    self.catalog.apply(book_ref.id, snapshot.to_dict())
+                else:
+                    self.catalog.discard(book_ref.id)
+            raise
+
+        if self.catalog is not None:
+            self.catalog.apply(book_data['id'], book_update)
+        return lending_data
+
+    def _open_lending(self, book_id):
+        results = list(self.db.collection('lendings').where(
+            filter=firestore.FieldFilter('book_id', '==', book_id)
+        ).where(
+            filter=firestore.FieldFilter('status', '==', 'lent')
+        ).limit(1).get())
+        return results[0] if results else None
+
+    def _book_by_field(self, book_id):
+        results = list(self.db.collection('books').where(
+            filter=firestore.FieldFilter('book_id', '==', book_id)
+        ).limit(1).get())
+        return results[0] if results else None
+
+    def _describe_lent_book(self, book_doc, book_id):
+        """Build return data for a book whose own status says it is lent"""
+        book_data = book_doc.to_dict()
+        book_data['id'] = book_doc.id
+
+        if book_data.get('status') != 'lent':
+            raise StationError("Book Not Lent", f"Book '{book_data.get('title', 'Unknown')}' is not currently lent out.")
+
+        lending_doc = self._open_lending(book_id)
+        if lending_doc:
+            book_data['lending_id'] = lending_doc.id
+
+        student_id = book_data.get('lent_to')
+        if student_id:
+            student_doc = self.db.collection('students').document(student_id).get()
+            if student_doc.exists:
+                book_data['lent_to'] = student_doc.to_dict().get('name', 'Unknown')
+                book_data['student_id'] = student_id
+        return book_data
+
+    def find_lent_book(self, book_id):
+        """Find a lent-out book and who has it, or raise StationError"""
+        if not book_id:
+            raise StationError("Error", "Please enter a Book ID")
+
+        # First try to search in lending records (most reliable)
+        lending_doc = self._open_lending(book_id)
+        if lending_doc:
+            lending_data = lending_doc.to_dict()
+
+            book_doc = self._book_by_field(book_id)
+            if not book_doc:
+                # If book not found by book_id, try direct document ID
+                book_doc = self.db.collection('books').document(lending_data.get('book_id')).get()
+                if not book_doc.exists:
+                    book_doc = None
+
+            if book_doc:
+                book_data = book_doc.to_dict()
+                book_data['id'] = book_doc.id
+                book_data['lending_id'] = lending_doc.id
+                book_data['student_id'] = lending_data.get('student_id')
+                book_data['lent_to'] = lending_data.get('student_name', 'Unknown')
+                book_data['lent_date'] = lending_data.get('lent_date')
+                book_data['due_date'] = lending_data.get('due_date')
+                return book_data
+
+        # Try to get the book directly by document ID, then by book_id field
+        book_doc = self.db.collection('books').document(book_id).get()
+        if book_doc.exists:
+            return self._describe_lent_book(book_doc, book_id)
+
+        book_doc = self._book_by_field(book_id)
+        if book_doc:
+            return self._describe_lent_book(book_doc, book_id)
+
+        # Check for library_records as a fallback
+        record_results = list(self.db.collection('library_records').where(
+            filter=firestore.FieldFilter('book_id', '==', book_id)
+        ).where(
+            filter=firestore.FieldFilter('status', '==', 'lent')
+        ).limit(1).get())
+
+        if record_results:
+            record_doc = record_results[0]
+            record_data = record_doc.to_dict()
+            book_id_from_record = record_data.get('book_id')
+
+            book_doc = self._book_by_field(book_id_from_record)
+            if not book_doc:
+                book_doc = self.db.collection('books').document(book_id_from_record).get()
+                if not book_doc.exists:
+                    book_doc = None
+
+            if book_doc:
+                book_data = book_doc.to_dict()
+                book_data['id'] = book_doc.id
+                book_data['library_record_id'] = record_doc.id
+                book_data['student_id'] = record_data.get('student_id')
+                book_data['lent_to'] = record_data.get('student_name', 'Unknown')
+                book_data['lent_date'] = record_data.get('lent_date')
+                book_data['due_date'] = record_data.get('due_date')
+                return book_data
+
+        raise StationError("Book Not Found", f"No book with ID '{book_id}' is currently checked out.")
+
+    def return_book(self, return_book_data):
+        """Check in a book found with find_lent_book"""
+        book_id = return_book_data['id']  # This is the document ID
+        book_id_field = return_book_data.get('book_id', book_id)  # Use the book_id field if available
+
+        # Create a batch for all Firestore operations
+        batch = self.db.batch()
+
+        book_ref = self.db.collection('books').document(book_id)
+        if not book_ref.get().exists:
+            raise StationError("Error", "Book not found in database.")
+
+        now = datetime.datetime.now()
+        return_date = now.strftime("%Y-%m-%d")
+        student_id = return_book_data.get('student_id')
+        student_name = return_book_data.get('lent_to', 'Unknown')
+        book_title = return_book_data.get('title', 'Unknown Book')
+        returned_fields = {
+            'status': 'returned',
+            'return_date': return_date,
+            'return_timestamp': now
+        }
+
+        book_update = {
+            'status': 'available',
+            'lent_to': None,
+            'lent_date': None,
+            'due_date': None,
+            'available': True,
+            'last_updated': now,
+            'updated_at': firestore.SERVER_TIMESTAMP
+        }
+        batch.update(book_ref, book_update)
+
+        # Process lending record - prefer the one found during lookup
+        lending_record_id = None
+        if 'lending_id' in return_book_data:
+            lending_record_id = return_book_data['lending_id']
+            batch.update(self.db.collection('lendings').document(lending_record_id), returned_fields)
+        else:
+            lending_doc = self._open_lending(book_id_field)
+            if lending_doc:
+                lending_data = lending_doc.to_dict()
+                student_id = lending_data.get('student_id', student_id)
+                student_name = lending_data.get('student_name', student_name)
+                lending_record_id = lending_doc.id
+                batch.update(lending_doc.reference, returned_fields)
+
+        # Update library_records
+        library_record_updated = False
+        if 'library_record_id' in return_book_data:
+            batch.update(self.db.collection('library_records').document(return_book_data['library_record_id']),
+                         returned_fields)
+            library_record_updated = True
+        else:
+            # Limit to 3 records in case of duplicates
+            records_results = list(self.db.collection('library_records').where(
+                filter=firestore.FieldFilter('book_id', '==', book_id_field)
+            ).where(
+                filter=firestore.FieldFilter('status', '==', 'lent')
+            ).limit(3).get())
+
+            for record_doc in records_results:
+                batch.update(record_doc.reference, returned_fields)
+                library_record_updated = True
+
+        # Create a single return record
+        return_data = {
+            'book_id': book_id_field,
+            'book_title': book_title,
+            'student_id': student_id,
+            'student_name': student_name,
+            'return_date': return_date,
+            'return_timestamp': now,
+            'status': 'return_record',
+            'lending_record_id': lending_record_id,
+            'activity_type': 'book_return'
+        }
+        batch.set(self.db.collection('returns').document(), return_data)
+
+        # Only add to library_records if no existing record was updated
+        if not library_record_updated:
+            batch.set(self.db.collection('library_records').document(), return_data)
+
+        batch.commit()
+        if self.catalog is not None:
+            self.catalog.apply(book_id, book_update)
+        return return_data
+
+class ClassroomStation:
+    """Attendance for one classroom"""
+
+    def __init__(self, db, classroom_info, camera_index=0, tolerance=0.45, writer=None):
+        self.db = db
+        self.classroom_info = classroom_info
+        self.camera_index = camera_index
+        self.tolerance = tolerance
+        # Optional AttendanceWriter; without one each mark is written immediately
+        self.writer = writer
+
+        # Filled by load_roster; until then every tap queries Firestore
+        self.roster = None
+        self.face_encodings = {}
+        self.present_ids = None
+        self.present_date = None
+
+    @staticmethod
+    def open_classroom(db, department, year, section):
+        """Validate a classroom selection, creating the classroom record if needed"""
+        department = str(department).strip().upper()
+        year = str(year).strip()
+        section = str(section).strip().upper()
+
+        if not all([department, year, section]):
+            raise StationError("Error", "All fields are required!")
+
+        try:
+            year = int(year)
+            if year < 1 or year > 5:
+                raise ValueError("Year must be between 1 and 5")
+        except ValueError as e:
+            raise StationError("Invalid Year", str(e))
+
+        if len(section) != 1 or not section.isalpha():
+            raise StationError("Invalid Section", "Section must be a single letter.")
+
+        classroom_info = {
+            'department': department,
+            'year': year,
+            'section': section,
+            'key': f"{department}_{year}_{section}"
+        }
+
+        # Check if classroom exists, if not create it
+        classroom_ref = db.collection('classrooms').document(classroom_info['key'])
+        if not classroom_ref.get().exists:
+            classroom_ref.set({
+                'department': department,
+                'year': year,
+                'section': section,
+                'created_at': datetime.datetime.now()
+            })
+
+        return classroom_info
+
+    def load_roster(self, decode_faces=True):
+        """Preload the classroom's students, their face templates and today's attendance"""
+        info = self.classroom_info
+        query = self.db.collection('students').where(
+            filter=firestore.FieldFilter('department', '==', info['department'])
+        ).where(
+            filter=firestore.FieldFilter('section', '==', info['section'])
+        ).where(
+            # Years are stored as text by some screens and as numbers by others
+            filter=firestore.FieldFilter('year', 'in', [str(info['year']), info['year']])
+        )
+
+        roster = {}
+        face_encodings = {}
+        for doc in query.stream():
+            student = {'id': doc.id, **doc.to_dict()}
+            if student.get('rfid'):
+                roster[student['rfid']] = student
+            if decode_faces and student.get('face_data'):
+                from face import decode_base64_to_face
+                encodings = decode_base64_to_face(student['face_data'])
+                if encodings is not None:
+                    face_encodings[doc.id] = encodings
+
+        self.roster = roster
+        self.face_encodings = face_encodings
+        self.load_present()
+        return len(roster)
+
+    def load_present(self):
+        """Load the ids of students already marked present here today"""
+        today_str = datetime.datetime.now().strftime("%Y-%m-%d")
+        query = self.db.collection('attendance').where(
+            filter=firestore.FieldFilter('classroom_key', '==', self.classroom_info['key'])
+        ).where(
+            filter=firestore.FieldFilter('date', '==', today_str)
+        ).select(['student_id'])
+        self.present_ids = {doc.get('student_id') for doc in query.stream()}
+        self.present_date = today_str
+
+    def note_present(self, student_id, date_str):
+        """Record a mark seen elsewhere (e.g. by a snapshot listener) in the local present set"""
+        if self.present_ids is not None and date_str == self.present_date and student_id:
+            self.present_ids.add(student_id)
+
+    def check_in(self, rfid):
+        """Return the tapping student if they may be marked present in this classroom"""
+        if not validate_rfid(rfid):
+            raise StationError("Invalid RFID", "Invalid RFID format. Please try again.")
+
+        student = self.roster.get(rfid) if self.roster is not None else None
+        if student is None:
+            # Not in the preloaded roster: another classroom's student or someone enrolled since
+            student = get_student_by_rfid(self.db, rfid)
+        if not student:
+            raise StationError("Student Not Found", f"No student found with RFID {rfid}.")
+
+        # Check if student belongs to this classroom
+        if student.get('department') != self.classroom_info['department'] or \
+           int(student.get('year')) != self.classroom_info['year'] or \
+           student.get('section') != self.classroom_info['section']:
+            raise StationError("Wrong Classroom", f"Student {student.get('name')} does not belong to this classroom.")
+
+        today_str = datetime.datetime.now().strftime("%Y-%m-%d")
+        if self.present_ids is not None:
+            if self.present_date != today_str:
+                self.load_present()
+            already_marked = student['id'] in self.present_ids
+        else:
+            already_marked = check_attendance_exists(self.db, student['id'], today_str)
+        if already_marked:
+            raise StationError("Already Marked", f"Attendance for {student.get('name')} already marked today.",
+                               level="warning")
+
+        return student
+
+    def load_face_encodings(self, student):
+        """Decode the student's registered face or raise StationError"""
+        if student['id'] in self.face_encodings:
+            return self.face_encodings[student['id']]
+
+        face_data_base64 = student.get('face_data')
+        if not face_data_base64:
+            raise StationError("No Face Data",
+                               f"No face data registered for {student.get('name')}. Cannot verify identity.")
+
+        # Face libraries are loaded on the first verification, not at startup
+        from face import decode_base64_to_face
+        known_face_encodings = decode_base64_to_face(face_data_base64)
+        if known_face_encodings is None:
+            raise StationError("Face Data Error", f"Error decoding face data for {student.get('name')}.")
+        return known_face_encodings
+
+    def verify(self, known_face_encodings):
+        """Run camera face verification against the registered encodings"""
+        from face import verify_face
+        return verify_face(known_face_encodings, camera_index=self.camera_index, tolerance=self.tolerance)
+
+    def mark_present(self, student, verification_method='face_recognition'):
+        """Write the attendance record for a verified student"""
+        now = datetime.datetime.now()
+        info = self.classroom_info
+
+        attendance_data = {
+            'student_id': student['id'],
+            'student_name': student.get('name'),
+            'student_rfid': student.get('rfid'),
+            'classroom_key': info['key'],
+            'department': info['department'],
+            'year': info['year'],
+            'section': info['section'],
+            'date': now.strftime("%Y-%m-%d"),
+            'timestamp': now,
+            'time_str': now.strftime("%H:%M:%S"),
+            'status': 'present',
+            'verification_method': verification_method,
+            'verification_strictness': 'high',
+            'course': f"{info['department']} Year {info['year']} Section {info['section']}"
+        }
+        doc_id = attendance_doc_id(student['id'], attendance_data['date'])
+        if self.writer is not None:
+            # Spooled locally now and committed with the writer's next batch
+            self.writer.enqueue(doc_id, attendance_data)
+        else:
+            self.db.collection('attendance').document(doc_id).set(attendance_data)
+        self.note_present(student['id'], attendance_data['date'])
+        return {**attendance_data, 'id': doc_id}